@@ -0,0 +1,440 @@
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+import numpy as np
+import pandas as pd
+
+from scripts.tcm_hierarchical_clustering import (
+    build_cluster_profiles,
+    dendrogram_leaf_labels,
+    normalize_feature_frame,
+    normalized_to_frame,
+    peak_rss_bytes,
+    profile_stage,
+    render_dendrogram,
+    resolve_dendrogram_mode,
+    run_analysis,
+    write_analysis_outputs,
+    write_excel_workbook,
+)
+
+DEFAULT_SIZES = tuple((patients, symptoms) for patients in (1000, 10000, 50000) for symptoms in (50, 500, 2000))
+BENCHMARK_STAGES = (
+    "read_excel",
+    "normalize",
+    "filter",
+    "prepare_feature_matrix",
+    "linkage",
+    "evaluate_candidate_ks",
+    "build_cluster_profiles",
+    "write_analysis_outputs",
+    "render_dendrogram",
+)
+BENCHMARK_SEED = 20260314
+BENCHMARK_SYNDROMES = 6
+BENCHMARK_CANDIDATE_KS = range(4, 8)
+BENCHMARK_SILHOUETTE_SAMPLE = 5000
+EXACT_PATIENT_LIMIT = 20000
+REGRESSION_THRESHOLD = 0.25
+REGRESSION_MIN_SECONDS = 0.05
+PROFILES_SIZE = (20000, 2000)
+PROFILES_CLUSTER_COUNT = 7
+STARTUP_MODULE = "scripts.tcm_hierarchical_clustering"
+STARTUP_HEAVY_MODULES = ("pandas", "scipy", "sklearn", "matplotlib")
+STARTUP_REPEAT = 5
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def synthetic_cohort(patient_count: int, symptom_count: int, seed: int = BENCHMARK_SEED) -> pd.DataFrame:
+    rng = np.random.default_rng([seed, patient_count, symptom_count])
+    prevalence = rng.beta(0.6, 6.0, size=symptom_count)
+    syndromes = rng.integers(0, BENCHMARK_SYNDROMES, size=patient_count)
+    core_symptoms = rng.random((BENCHMARK_SYNDROMES, symptom_count)) < 0.1
+    probabilities = np.where(core_symptoms[syndromes], 0.6, prevalence[None, :])
+    matrix = (rng.random((patient_count, symptom_count)) < probabilities).astype(np.uint8)
+    frame = pd.DataFrame(matrix, columns=[f"症状{index:04d}" for index in range(1, symptom_count + 1)])
+    frame.insert(0, "年龄", rng.integers(18, 90, size=patient_count))
+    frame.insert(0, "姓名", [f"患者{index}" for index in range(1, patient_count + 1)])
+    return frame
+
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    cumulative: dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_text, module = line.removeprefix("import time:").split("|", maxsplit=2)
+        if cumulative_text.strip().isdigit():
+            cumulative[module.strip()] = int(cumulative_text)
+    return cumulative
+
+
+def measure_startup(repeat: int = STARTUP_REPEAT) -> dict[str, Any]:
+    timings = []
+    for _ in range(max(repeat, 1)):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {STARTUP_MODULE}"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=REPO_ROOT,
+        )
+        timings.append(parse_importtime(completed.stderr))
+    heavy_modules = sorted(
+        {module.split(".")[0] for module in timings[0]} & set(STARTUP_HEAVY_MODULES)
+    )
+    return {
+        "module": STARTUP_MODULE,
+        "import_seconds": round(min(timing[STARTUP_MODULE] for timing in timings) / 1e6, 4),
+        "heavy_modules": heavy_modules,
+    }
+
+
+def synthetic_workbook(patient_count: int, symptom_count: int, work_dir: Path) -> Path:
+    input_path = work_dir / f"cohort-{patient_count}x{symptom_count}.xlsx"
+    if not input_path.exists():
+        write_excel_workbook(input_path, {"Sheet1": synthetic_cohort(patient_count, symptom_count)})
+    return input_path
+
+
+def run_benchmark_case(
+    patient_count: int,
+    symptom_count: int,
+    work_dir: Path,
+    min_frequency: float = 0.05,
+) -> dict[str, Any]:
+    input_path = synthetic_workbook(patient_count, symptom_count, work_dir)
+    engine = "exact" if patient_count <= EXACT_PATIENT_LIMIT else "approximate"
+    result = run_analysis(
+        input_path,
+        output_dir=work_dir / f"outputs-{patient_count}x{symptom_count}",
+        min_frequency=min_frequency,
+        candidate_ks=BENCHMARK_CANDIDATE_KS,
+        silhouette_sample=BENCHMARK_SILHOUETTE_SAMPLE,
+        use_linkage_cache=False,
+        engine=engine,
+    )
+    write_analysis_outputs(result, dendrogram_mode="none", stage_profiles=result["stage_profiles"])
+    leaf_count = len(result["linkage_matrix"]) + 1
+    with profile_stage(result["stage_profiles"], "render_dendrogram"):
+        render_dendrogram(
+            result["linkage_matrix"],
+            dendrogram_leaf_labels(result),
+            Path(result["output_dir"]) / "dendrogram.png",
+            resolve_dendrogram_mode("auto", leaf_count),
+        )
+    profiles = {profile["stage"]: profile["wall_seconds"] for profile in result["stage_profiles"]}
+    stages = {stage: profiles[stage] for stage in BENCHMARK_STAGES}
+
+    peak_rss = peak_rss_bytes()
+    return {
+        "patients": patient_count,
+        "symptoms": symptom_count,
+        "retained_symptoms": int(result["features"].shape[1]),
+        "engine": engine,
+        "leaf_count": leaf_count,
+        "optimal_k": int(result["best_k"]["k"]),
+        "stages": stages,
+        "total_seconds": round(sum(stages.values()), 4),
+        "peak_rss_mb": round(peak_rss / 1024 / 1024, 1) if peak_rss is not None else None,
+    }
+
+
+def best_wall_seconds(action: Callable[[], Any], repeat: int) -> tuple[Any, float]:
+    timings = []
+    for _ in range(max(repeat, 1)):
+        started = time.perf_counter()
+        value = action()
+        timings.append(time.perf_counter() - started)
+    return value, round(min(timings), 4)
+
+
+def loop_cluster_profiles(normalized: dict[str, Any], labels: pd.Series) -> pd.DataFrame:
+    frame = normalized_to_frame(normalized)
+    label_series = pd.Series(np.asarray(labels), index=frame.index, name="cluster")
+    global_frequency = normalized["global_frequency"]
+    rows: list[dict[str, float | int | str]] = []
+    for cluster in sorted(label_series.unique()):
+        cluster_mask = label_series == cluster
+        cluster_frame = frame.loc[cluster_mask]
+        cluster_size = int(cluster_mask.sum())
+        cluster_count = cluster_frame.sum(axis=0)
+        cluster_frequency = cluster_frame.mean(axis=0)
+        for feature in frame.columns:
+            overall = float(global_frequency[feature])
+            inside = float(cluster_frequency[feature]) if cluster_size else 0.0
+            rows.append(
+                {
+                    "cluster": int(cluster),
+                    "cluster_size": cluster_size,
+                    "feature": feature,
+                    "count": int(cluster_count[feature]),
+                    "cluster_frequency": inside,
+                    "global_frequency": overall,
+                    "lift": inside / overall if overall else 0.0,
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def run_profiles_benchmark(
+    patient_count: int,
+    symptom_count: int,
+    cluster_count: int = PROFILES_CLUSTER_COUNT,
+    repeat: int = 1,
+) -> dict[str, Any]:
+    cohort = synthetic_cohort(patient_count, symptom_count)
+    normalized = normalize_feature_frame(cohort.drop(columns=["姓名", "年龄"]))
+    rng = np.random.default_rng([BENCHMARK_SEED, patient_count, cluster_count])
+    labels = pd.Series(rng.integers(1, cluster_count + 1, size=patient_count), name="cluster")
+    looped, loop_seconds = best_wall_seconds(lambda: loop_cluster_profiles(normalized, labels), repeat)
+    vectorized, vectorized_seconds = best_wall_seconds(
+        lambda: build_cluster_profiles(normalized, labels),
+        repeat,
+    )
+    return {
+        "patients": patient_count,
+        "symptoms": symptom_count,
+        "clusters": cluster_count,
+        "loop_seconds": loop_seconds,
+        "vectorized_seconds": vectorized_seconds,
+        "speedup": round(loop_seconds / vectorized_seconds, 1) if vectorized_seconds else None,
+        "identical": bool(vectorized.equals(looped)),
+    }
+
+
+def run_benchmarks(
+    sizes: Iterable[tuple[int, int]] = DEFAULT_SIZES,
+    repeat: int = 1,
+    work_dir: Path | str | None = None,
+    profiles_size: tuple[int, int] | None = PROFILES_SIZE,
+) -> dict[str, Any]:
+    startup = measure_startup()
+    print(
+        f"启动导入: {startup['import_seconds']:.3f}s，重量级依赖: {', '.join(startup['heavy_modules']) or '无'}",
+        file=sys.stderr,
+    )
+    cases = []
+    with tempfile.TemporaryDirectory(dir=work_dir) as temporary_dir:
+        for patient_count, symptom_count in sizes:
+            runs = [
+                run_benchmark_case(patient_count, symptom_count, Path(temporary_dir))
+                for _ in range(max(repeat, 1))
+            ]
+            best = min(runs, key=lambda run: run["total_seconds"])
+            best["stages"] = {
+                stage: min(run["stages"][stage] for run in runs) for stage in BENCHMARK_STAGES
+            }
+            best["total_seconds"] = round(sum(best["stages"].values()), 4)
+            cases.append(best)
+            print(
+                f"{patient_count} 例 × {symptom_count} 症状 ({best['engine']}): "
+                f"{best['total_seconds']:.2f}s "
+                + ", ".join(f"{stage}={seconds:.2f}" for stage, seconds in best["stages"].items()),
+                file=sys.stderr,
+            )
+    profiles = None
+    if profiles_size is not None:
+        profiles = run_profiles_benchmark(*profiles_size, repeat=repeat)
+        print(
+            f"聚类画像 {profiles['patients']} 例 × {profiles['symptoms']} 症状 × {profiles['clusters']} 类: "
+            f"逐类循环 {profiles['loop_seconds']:.3f}s，矩阵乘法 {profiles['vectorized_seconds']:.3f}s，"
+            f"加速 {profiles['speedup']} 倍，结果{'一致' if profiles['identical'] else '不一致'}",
+            file=sys.stderr,
+        )
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "repeat": max(repeat, 1),
+        "startup": startup,
+        "profiles": profiles,
+        "cases": cases,
+    }
+
+
+def compare_with_baseline(
+    current: dict[str, Any],
+    baseline: dict[str, Any],
+    threshold: float = REGRESSION_THRESHOLD,
+    min_seconds: float = REGRESSION_MIN_SECONDS,
+) -> list[dict[str, Any]]:
+    baseline_cases = {(case["patients"], case["symptoms"]): case for case in baseline["cases"]}
+    regressions = []
+    startup = current.get("startup")
+    if startup is not None:
+        reference_seconds = baseline.get("startup", {}).get("import_seconds")
+        seconds = startup["import_seconds"]
+        slower = (
+            reference_seconds is not None
+            and seconds > reference_seconds * (1 + threshold)
+            and seconds - reference_seconds > min_seconds
+        )
+        if slower or startup["heavy_modules"]:
+            regressions.append(
+                {
+                    "patients": None,
+                    "symptoms": None,
+                    "stage": "startup_import",
+                    "baseline_seconds": reference_seconds,
+                    "seconds": seconds,
+                    "ratio": round(seconds / reference_seconds, 3) if reference_seconds else None,
+                    "heavy_modules": startup["heavy_modules"],
+                }
+            )
+    profiles = current.get("profiles")
+    reference_profiles = baseline.get("profiles")
+    if profiles is not None and not profiles["identical"]:
+        regressions.append(
+            {
+                "patients": profiles["patients"],
+                "symptoms": profiles["symptoms"],
+                "stage": "profiles_mismatch",
+                "baseline_seconds": None,
+                "seconds": profiles["vectorized_seconds"],
+                "ratio": None,
+            }
+        )
+    if (
+        profiles is not None
+        and reference_profiles is not None
+        and (profiles["patients"], profiles["symptoms"], profiles["clusters"])
+        == (reference_profiles["patients"], reference_profiles["symptoms"], reference_profiles["clusters"])
+    ):
+        seconds = profiles["vectorized_seconds"]
+        reference_seconds = reference_profiles["vectorized_seconds"]
+        if seconds > reference_seconds * (1 + threshold) and seconds - reference_seconds > min_seconds:
+            regressions.append(
+                {
+                    "patients": profiles["patients"],
+                    "symptoms": profiles["symptoms"],
+                    "stage": "profiles_vectorized",
+                    "baseline_seconds": reference_seconds,
+                    "seconds": seconds,
+                    "ratio": round(seconds / reference_seconds, 3) if reference_seconds else None,
+                }
+            )
+    for case in current["cases"]:
+        reference = baseline_cases.get((case["patients"], case["symptoms"]))
+        if reference is None:
+            continue
+        for stage, seconds in case["stages"].items():
+            reference_seconds = reference["stages"].get(stage)
+            if reference_seconds is None:
+                continue
+            if seconds > reference_seconds * (1 + threshold) and seconds - reference_seconds > min_seconds:
+                regressions.append(
+                    {
+                        "patients": case["patients"],
+                        "symptoms": case["symptoms"],
+                        "stage": stage,
+                        "baseline_seconds": reference_seconds,
+                        "seconds": seconds,
+                        "ratio": round(seconds / reference_seconds, 3) if reference_seconds else None,
+                    }
+                )
+    return regressions
+
+
+def parse_sizes(raw_sizes: str) -> list[tuple[int, int]]:
+    sizes = []
+    for part in filter(str.strip, raw_sizes.split(",")):
+        patients_text, symptoms_text = part.strip().lower().split("x", maxsplit=1)
+        sizes.append((int(patients_text), int(symptoms_text)))
+    return sizes
+
+
+def build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="中医证候层次聚类流程性能基准")
+    parser.add_argument(
+        "--sizes",
+        default=",".join(f"{patients}x{symptoms}" for patients, symptoms in DEFAULT_SIZES),
+        help="基准规模列表，格式如 1000x50,10000x500（患者数x症状数）；传空字符串仅测量启动导入耗时",
+    )
+    parser.add_argument(
+        "--profiles-size",
+        default="x".join(str(value) for value in PROFILES_SIZE),
+        help="聚类画像对比基准规模（患者数x症状数），对比逐类循环与一次矩阵乘法的耗时；传空字符串跳过",
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="每个规模重复次数，各阶段取最快一次")
+    parser.add_argument("--output", default=None, help="基准结果 JSON 输出路径，默认打印到标准输出")
+    parser.add_argument("--baseline", default=None, help="用于对比的历史基准 JSON 文件")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=REGRESSION_THRESHOLD,
+        help="允许的阶段耗时增幅，超过基准该比例即视为性能回退并以非零状态退出",
+    )
+    parser.add_argument(
+        "--min-seconds",
+        type=float,
+        default=REGRESSION_MIN_SECONDS,
+        help="判定回退所需的最小绝对耗时增量（秒），用于忽略极短阶段的计时抖动",
+    )
+    parser.add_argument("--work-dir", default=None, help="合成数据与输出文件的临时目录")
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_argument_parser().parse_args(argv)
+    profiles_sizes = parse_sizes(args.profiles_size)
+    results = run_benchmarks(
+        parse_sizes(args.sizes),
+        repeat=args.repeat,
+        work_dir=args.work_dir,
+        profiles_size=profiles_sizes[0] if profiles_sizes else None,
+    )
+    payload = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(payload, encoding="utf-8")
+        print(f"基准结果: {args.output}", file=sys.stderr)
+    else:
+        print(payload)
+
+    if args.baseline is None:
+        return 0
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+    regressions = compare_with_baseline(
+        results,
+        baseline,
+        threshold=args.threshold,
+        min_seconds=args.min_seconds,
+    )
+    for regression in regressions:
+        if regression["stage"] == "startup_import":
+            baseline_seconds = regression["baseline_seconds"]
+            baseline_text = f"{baseline_seconds:.3f}s" if baseline_seconds is not None else "无基准"
+            print(
+                f"启动回退: 导入 {baseline_text} -> {regression['seconds']:.3f}s，"
+                f"导入时加载的重量级依赖: {', '.join(regression['heavy_modules']) or '无'}",
+                file=sys.stderr,
+            )
+            continue
+        if regression["stage"] == "profiles_mismatch":
+            print(
+                f"聚类画像结果不一致: {regression['patients']}x{regression['symptoms']} "
+                "矩阵乘法实现与逐类循环的输出不同",
+                file=sys.stderr,
+            )
+            continue
+        print(
+            f"性能回退: {regression['patients']}x{regression['symptoms']} {regression['stage']} "
+            f"{regression['baseline_seconds']:.3f}s -> {regression['seconds']:.3f}s",
+            file=sys.stderr,
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
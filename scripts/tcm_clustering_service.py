@@ -0,0 +1,576 @@
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from scripts.tcm_hierarchical_clustering import (
+    DISTANCE_METRICS,
+    INPUT_READERS,
+    LINKAGE_METHODS,
+    build_cluster_profiles,
+    cached_linkage,
+    candidate_cluster_labels,
+    collapse_if_worthwhile,
+    evaluate_candidate_ks,
+    load_prepared_cohort,
+    pack_binary_matrix,
+    parse_k_range,
+    sort_cluster_profiles,
+)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MEMORY_BUDGET_MB = 1024
+DEFAULT_MIN_FREQUENCY = 0.05
+MAX_UPLOAD_BYTES = 512 * 1024 * 1024
+
+
+class CohortNotFoundError(LookupError):
+    pass
+
+
+def new_registry(memory_budget_bytes: int = DEFAULT_MEMORY_BUDGET_MB * 1024 * 1024) -> dict[str, Any]:
+    return {
+        "cohorts": OrderedDict(),
+        "memory_budget_bytes": int(memory_budget_bytes),
+        "evicted": 0,
+        "lock": threading.Lock(),
+    }
+
+
+def frame_nbytes(frame: pd.DataFrame) -> int:
+    return int(frame.memory_usage(index=True, deep=True).sum())
+
+
+def variant_nbytes(variant: dict[str, Any]) -> int:
+    total = variant["keep"].nbytes + variant["linkage"].nbytes + variant["leaf_packed"].nbytes
+    for name in ("first_rows", "assignments", "weights"):
+        if variant[name] is not None:
+            total += variant[name].nbytes
+    return int(total)
+
+
+def measure_cohort_nbytes(cohort: dict[str, Any]) -> int:
+    total = cohort["packed"].nbytes + cohort["global_frequency"].nbytes + frame_nbytes(cohort["identifiers"])
+    for variant in list(cohort["variants"].values()):
+        total += variant_nbytes(variant)
+        total += sum(labels.nbytes for labels in list(variant["cuts"].values()))
+        total += sum(frame_nbytes(profiles) for profiles in list(variant["profiles"].values()))
+        total += sum(frame_nbytes(metrics) for metrics in list(variant["k_metrics"].values()))
+    return int(total)
+
+
+def cohort_nbytes(cohort: dict[str, Any]) -> int:
+    return cohort["nbytes"]
+
+
+def cached_cohort_entry(
+    cohort: dict[str, Any],
+    cache: dict[Any, Any],
+    pending_key: tuple[Any, ...],
+    key: Any,
+    build: Callable[[], Any],
+    measure: Callable[[Any], int],
+) -> Any:
+    with cohort["lock"]:
+        if key in cache:
+            return cache[key]
+        pending = cohort["pending"].setdefault(pending_key, threading.Lock())
+    with pending:
+        with cohort["lock"]:
+            if key in cache:
+                return cache[key]
+        value = build()
+        nbytes = measure(value)
+        with cohort["lock"]:
+            cache[key] = value
+            cohort["nbytes"] += nbytes
+            cohort["pending"].pop(pending_key, None)
+        return value
+
+
+def load_cohort(
+    input_path: Path | str,
+    excluded_columns: list[str] | None = None,
+    min_frequency: float = DEFAULT_MIN_FREQUENCY,
+    sheet_name: str | int | None = None,
+    method: str = "ward",
+    metric: str = "euclidean",
+    source: str | None = None,
+) -> dict[str, Any]:
+    if method not in LINKAGE_METHODS:
+        raise ValueError(f"未知连接方法: {method}，可选值为 {', '.join(LINKAGE_METHODS)}")
+    if metric not in DISTANCE_METRICS:
+        raise ValueError(f"未知距离度量: {metric}，可选值为 {', '.join(DISTANCE_METRICS)}")
+    if method == "ward" and metric != "euclidean":
+        raise ValueError("ward 连接方法只能与 euclidean 距离搭配使用。")
+    prepared = load_prepared_cohort(
+        input_path,
+        excluded_columns=excluded_columns if excluded_columns is not None else ("姓名", "年龄"),
+        min_frequency=0.0,
+        sheet_name=sheet_name,
+    )
+    normalized = prepared["normalized"]
+    cohort = {
+        "cohort_id": uuid.uuid4().hex[:12],
+        "source": source or str(input_path),
+        "sheet_name": prepared["sheet_name"],
+        "row_count": int(len(normalized["matrix"])),
+        "identifiers": prepared["identifiers"].reset_index(drop=True),
+        "packed": np.packbits(normalized["matrix"], axis=1),
+        "columns": pd.Index(normalized["columns"]),
+        "global_frequency": normalized["global_frequency"].to_numpy(dtype=np.float64),
+        "default_min_frequency": float(min_frequency),
+        "method": method,
+        "metric": metric,
+        "variants": {},
+        "lock": threading.Lock(),
+        "pending": {},
+    }
+    cohort["nbytes"] = measure_cohort_nbytes(cohort)
+    cohort_variant(cohort, min_frequency)
+    return cohort
+
+
+def cohort_matrix(cohort: dict[str, Any], keep: np.ndarray) -> np.ndarray:
+    matrix = np.unpackbits(cohort["packed"], axis=1, count=len(cohort["columns"]))
+    return np.ascontiguousarray(matrix[:, keep])
+
+
+def build_variant(cohort: dict[str, Any], min_frequency: float) -> dict[str, Any]:
+    keep = cohort["global_frequency"] >= min_frequency
+    if not keep.any():
+        raise ValueError("低频剔除后没有剩余证候列，无法继续聚类。")
+    started = time.perf_counter()
+    matrix = cohort_matrix(cohort, keep)
+    packed = pack_binary_matrix(matrix)
+    collapsed = collapse_if_worthwhile(matrix, packed)
+    linkage_matrix, _, _ = cached_linkage(
+        collapsed["packed"] if collapsed is not None else packed,
+        None,
+        weights=collapsed["weights"] if collapsed is not None else None,
+        method=cohort["method"],
+        metric=cohort["metric"],
+    )
+    return {
+        "min_frequency": min_frequency,
+        "keep": keep,
+        "linkage": linkage_matrix,
+        "leaf_packed": collapsed["packed"] if collapsed is not None else packed,
+        "first_rows": collapsed["first_rows"] if collapsed is not None else None,
+        "assignments": collapsed["assignments"] if collapsed is not None else None,
+        "weights": collapsed["weights"] if collapsed is not None else None,
+        "linkage_seconds": round(time.perf_counter() - started, 4),
+        "cuts": {},
+        "profiles": {},
+        "k_metrics": {},
+    }
+
+
+def cohort_variant(cohort: dict[str, Any], min_frequency: float | None = None) -> dict[str, Any]:
+    min_frequency = cohort["default_min_frequency"] if min_frequency is None else float(min_frequency)
+    key = round(min_frequency, 6)
+    return cached_cohort_entry(
+        cohort,
+        cohort["variants"],
+        ("variant", key),
+        key,
+        lambda: build_variant(cohort, min_frequency),
+        variant_nbytes,
+    )
+
+
+def cut_labels(cohort: dict[str, Any], variant: dict[str, Any], k: int) -> np.ndarray:
+    valid_ks, label_matrix = candidate_cluster_labels(
+        variant["linkage"],
+        [k],
+        sample_count=cohort["row_count"],
+    )
+    if not valid_ks:
+        raise ValueError(f"K={k} 无法生成有效聚类结果，请检查样本量或 K 值。")
+    labels = label_matrix[0]
+    if variant["assignments"] is not None:
+        labels = labels[variant["assignments"]]
+    return labels
+
+
+def cut_cohort(cohort: dict[str, Any], k: int, min_frequency: float | None = None) -> np.ndarray:
+    variant = cohort_variant(cohort, min_frequency)
+    return cached_cohort_entry(
+        cohort,
+        variant["cuts"],
+        ("cut", variant["min_frequency"], k),
+        k,
+        lambda: cut_labels(cohort, variant, k),
+        lambda labels: labels.nbytes,
+    )
+
+
+def cohort_profiles(cohort: dict[str, Any], k: int, min_frequency: float | None = None) -> pd.DataFrame:
+    variant = cohort_variant(cohort, min_frequency)
+    labels = cut_cohort(cohort, k, min_frequency)
+    keep = variant["keep"]
+    columns = cohort["columns"][keep]
+    return cached_cohort_entry(
+        cohort,
+        variant["profiles"],
+        ("profiles", variant["min_frequency"], k),
+        k,
+        lambda: sort_cluster_profiles(
+            build_cluster_profiles(
+                {
+                    "matrix": cohort_matrix(cohort, keep),
+                    "columns": columns,
+                    "global_frequency": pd.Series(cohort["global_frequency"][keep], index=columns),
+                },
+                pd.Series(labels, name="cluster"),
+            )
+        ),
+        frame_nbytes,
+    )
+
+
+def cohort_k_metrics(
+    cohort: dict[str, Any],
+    candidate_ks: range,
+    min_frequency: float | None = None,
+    silhouette_sample: int | None = None,
+) -> pd.DataFrame:
+    variant = cohort_variant(cohort, min_frequency)
+    key = (candidate_ks.start, candidate_ks.stop, silhouette_sample)
+
+    def build_metrics() -> pd.DataFrame:
+        leaf_matrix = cohort_matrix(cohort, variant["keep"])
+        if variant["first_rows"] is not None:
+            leaf_matrix = leaf_matrix[variant["first_rows"]]
+        valid_ks, leaf_labels = candidate_cluster_labels(
+            variant["linkage"],
+            candidate_ks,
+            sample_count=cohort["row_count"],
+        )
+        return evaluate_candidate_ks(
+            {"matrix": leaf_matrix},
+            variant["linkage"],
+            candidate_ks,
+            packed=variant["leaf_packed"],
+            silhouette_sample=silhouette_sample,
+            candidate_labels=(valid_ks, leaf_labels),
+            weights=variant["weights"],
+            metric=cohort["metric"],
+        )
+
+    return cached_cohort_entry(
+        cohort,
+        variant["k_metrics"],
+        ("k_metrics", variant["min_frequency"], key),
+        key,
+        build_metrics,
+        frame_nbytes,
+    )
+
+
+def register_cohort(registry: dict[str, Any], cohort: dict[str, Any]) -> None:
+    with registry["lock"]:
+        registry["cohorts"][cohort["cohort_id"]] = cohort
+    enforce_memory_budget(registry, cohort["cohort_id"])
+
+
+def get_cohort(registry: dict[str, Any], cohort_id: str) -> dict[str, Any]:
+    with registry["lock"]:
+        cohort = registry["cohorts"].get(cohort_id)
+        if cohort is None:
+            raise CohortNotFoundError(cohort_id)
+        registry["cohorts"].move_to_end(cohort_id)
+        return cohort
+
+
+def enforce_memory_budget(registry: dict[str, Any], protected_id: str | None = None) -> None:
+    with registry["lock"]:
+        cohorts = registry["cohorts"]
+        total = sum(cohort_nbytes(cohort) for cohort in cohorts.values())
+        for cohort_id in list(cohorts):
+            if total <= registry["memory_budget_bytes"]:
+                break
+            if cohort_id == protected_id:
+                continue
+            total -= cohort_nbytes(cohorts.pop(cohort_id))
+            registry["evicted"] += 1
+
+
+def cohort_summary(cohort: dict[str, Any]) -> dict[str, Any]:
+    variant = cohort_variant(cohort)
+    return {
+        "cohort_id": cohort["cohort_id"],
+        "source": cohort["source"],
+        "sheet_name": cohort["sheet_name"],
+        "sample_count": cohort["row_count"],
+        "candidate_feature_count": int(len(cohort["columns"])),
+        "retained_feature_count": int(variant["keep"].sum()),
+        "min_frequency": variant["min_frequency"],
+        "leaf_count": int(len(variant["linkage"]) + 1),
+        "linkage_method": cohort["method"],
+        "distance_metric": cohort["metric"],
+        "variants": sorted(cohort["variants"]),
+        "memory_bytes": cohort_nbytes(cohort),
+    }
+
+
+def query_value(query: dict[str, list[str]], name: str, cast: Any, default: Any = None) -> Any:
+    values = query.get(name)
+    if not values or values[0] == "":
+        if default is None:
+            raise ValueError(f"缺少查询参数: {name}")
+        return default
+    try:
+        return cast(values[0])
+    except ValueError as exc:
+        raise ValueError(f"查询参数 {name} 取值无效: {values[0]}") from exc
+
+
+def optional_query_value(query: dict[str, list[str]], name: str, cast: Any) -> Any:
+    values = query.get(name)
+    return cast(values[0]) if values and values[0] != "" else None
+
+
+def upload_cohort(
+    registry: dict[str, Any],
+    query: dict[str, list[str]],
+    body: bytes,
+    content_type: str,
+) -> dict[str, Any]:
+    if content_type.startswith("application/json"):
+        options = json.loads(body.decode("utf-8") or "{}")
+        if "path" not in options:
+            raise ValueError("JSON 请求体需要提供 path 字段。")
+        input_path = Path(options["path"])
+        source = str(input_path)
+        temporary_dir = None
+    else:
+        options = {name: values[0] for name, values in query.items()}
+        filename = Path(options.get("filename", ""))
+        if filename.suffix.lower() not in INPUT_READERS:
+            raise ValueError(f"上传文件需通过 filename 参数指明类型，可选: {sorted(INPUT_READERS)}")
+        temporary_dir = tempfile.TemporaryDirectory()
+        input_path = Path(temporary_dir.name) / filename.name
+        input_path.write_bytes(body)
+        source = filename.name
+    excluded_columns = options.get("excluded_columns")
+    if isinstance(excluded_columns, str):
+        excluded_columns = [part.strip() for part in excluded_columns.split(",") if part.strip()]
+    try:
+        cohort = load_cohort(
+            input_path,
+            excluded_columns=excluded_columns,
+            min_frequency=float(options.get("min_frequency", DEFAULT_MIN_FREQUENCY)),
+            sheet_name=options.get("sheet"),
+            method=options.get("method", "ward"),
+            metric=options.get("metric", "euclidean"),
+            source=source,
+        )
+    finally:
+        if temporary_dir is not None:
+            temporary_dir.cleanup()
+    register_cohort(registry, cohort)
+    return cohort_summary(cohort)
+
+
+def handle_request(
+    registry: dict[str, Any],
+    method: str,
+    raw_path: str,
+    body: bytes = b"",
+    content_type: str = "application/json",
+) -> tuple[int, dict[str, Any]]:
+    parsed = urlparse(raw_path)
+    query = parse_qs(parsed.query)
+    parts = [part for part in parsed.path.split("/") if part]
+    try:
+        if parts == ["health"] and method == "GET":
+            with registry["lock"]:
+                cohorts = list(registry["cohorts"].values())
+            return HTTPStatus.OK, {
+                "status": "ok",
+                "cohort_count": len(cohorts),
+                "memory_bytes": sum(cohort_nbytes(cohort) for cohort in cohorts),
+                "memory_budget_bytes": registry["memory_budget_bytes"],
+                "evicted": registry["evicted"],
+            }
+        if parts == ["cohorts"] and method == "GET":
+            with registry["lock"]:
+                cohorts = list(registry["cohorts"].values())
+            return HTTPStatus.OK, {"cohorts": [cohort_summary(cohort) for cohort in cohorts]}
+        if parts == ["cohorts"] and method == "POST":
+            return HTTPStatus.CREATED, upload_cohort(registry, query, body, content_type)
+        if len(parts) < 2 or parts[0] != "cohorts":
+            return HTTPStatus.NOT_FOUND, {"error": f"未知接口: {parsed.path}"}
+
+        cohort_id = parts[1]
+        if len(parts) == 2 and method == "DELETE":
+            with registry["lock"]:
+                if registry["cohorts"].pop(cohort_id, None) is None:
+                    raise CohortNotFoundError(cohort_id)
+            return HTTPStatus.OK, {"cohort_id": cohort_id, "deleted": True}
+        cohort = get_cohort(registry, cohort_id)
+        action = parts[2] if len(parts) == 3 else None
+        min_frequency = optional_query_value(query, "min_frequency", float)
+        if action is None and method == "GET":
+            payload = cohort_summary(cohort)
+        elif action == "cut" and method == "GET":
+            k = query_value(query, "k", int)
+            labels = cut_cohort(cohort, k, min_frequency)
+            cluster_ids, counts = np.unique(labels, return_counts=True)
+            payload = {
+                "k": k,
+                "min_frequency": cohort_variant(cohort, min_frequency)["min_frequency"],
+                "cluster_sizes": {str(cluster): int(count) for cluster, count in zip(cluster_ids, counts)},
+                "clusters": labels.tolist(),
+            }
+        elif action == "profile" and method == "GET":
+            k = query_value(query, "k", int)
+            cluster = query_value(query, "cluster", int)
+            top = optional_query_value(query, "top", int)
+            profiles = cohort_profiles(cohort, k, min_frequency)
+            rows = profiles.loc[profiles["cluster"] == cluster]
+            if rows.empty:
+                raise ValueError(f"K={k} 时不存在簇 {cluster}。")
+            payload = {
+                "k": k,
+                "cluster": cluster,
+                "cluster_size": int(rows["cluster_size"].iloc[0]),
+                "features": (rows.head(top) if top else rows).drop(columns=["cluster", "cluster_size"]).to_dict(
+                    orient="records"
+                ),
+            }
+        elif action == "refilter" and method in ("GET", "POST"):
+            threshold = query_value(query, "min_frequency", float)
+            variant = cohort_variant(cohort, threshold)
+            payload = {
+                "min_frequency": variant["min_frequency"],
+                "retained_feature_count": int(variant["keep"].sum()),
+                "removed_features": cohort["columns"][~variant["keep"]].tolist(),
+                "leaf_count": int(len(variant["linkage"]) + 1),
+                "linkage_seconds": variant["linkage_seconds"],
+            }
+        elif action == "k_metrics" and method == "GET":
+            metrics = cohort_k_metrics(
+                cohort,
+                parse_k_range(query_value(query, "k_range", str, "4-7")),
+                min_frequency,
+                optional_query_value(query, "silhouette_sample", int),
+            )
+            payload = {"k_metrics": metrics.to_dict(orient="records")}
+        else:
+            return HTTPStatus.NOT_FOUND, {"error": f"未知接口: {method} {parsed.path}"}
+        enforce_memory_budget(registry, cohort_id)
+        return HTTPStatus.OK, {"cohort_id": cohort_id, **payload}
+    except CohortNotFoundError as exc:
+        return HTTPStatus.NOT_FOUND, {"error": f"队列不存在或已被淘汰: {exc.args[0]}"}
+    except (ValueError, json.JSONDecodeError, OSError) as exc:
+        return HTTPStatus.BAD_REQUEST, {"error": str(exc)}
+    except Exception as exc:
+        return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(exc).__name__}: {exc}"}
+
+
+def json_default(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+class ClusteringRequestHandler(BaseHTTPRequestHandler):
+    server_version = "TCMClusteringService/1.0"
+
+    def dispatch(self, method: str) -> None:
+        started = time.perf_counter()
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_UPLOAD_BYTES:
+            status, payload = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "上传文件超过大小上限。"}
+        else:
+            body = self.rfile.read(length) if length else b""
+            status, payload = handle_request(
+                self.server.registry,
+                method,
+                self.path,
+                body,
+                self.headers.get("Content-Type", "application/json"),
+            )
+        payload["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        encoded = json.dumps(payload, ensure_ascii=False, default=json_default).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def do_GET(self) -> None:
+        self.dispatch("GET")
+
+    def do_POST(self) -> None:
+        self.dispatch("POST")
+
+    def do_DELETE(self) -> None:
+        self.dispatch("DELETE")
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def create_server(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    memory_budget_bytes: int = DEFAULT_MEMORY_BUDGET_MB * 1024 * 1024,
+    quiet: bool = False,
+) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), ClusteringRequestHandler)
+    server.registry = new_registry(memory_budget_bytes)
+    server.quiet = quiet
+    return server
+
+
+def build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="中医证候层次聚类本地 HTTP/JSON 服务")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="监听地址，默认仅本机可访问")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="监听端口")
+    parser.add_argument(
+        "--memory-budget-mb",
+        type=float,
+        default=DEFAULT_MEMORY_BUDGET_MB,
+        help="内存中缓存队列的总容量上限（MB），超出后按最近使用时间淘汰",
+    )
+    parser.add_argument("--quiet", action="store_true", help="不输出逐条请求日志")
+    return parser
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = build_argument_parser().parse_args(argv)
+    server = create_server(
+        args.host,
+        args.port,
+        memory_budget_bytes=int(args.memory_budget_mb * 1024 * 1024),
+        quiet=args.quiet,
+    )
+    print(f"聚类服务已启动: http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,86 @@
 from __future__ import annotations
 
 import argparse
+import cProfile
+import glob
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+from multiprocessing import shared_memory
 from pathlib import Path
-from typing import Any, Iterable
+from typing import Any, Callable, Iterable, Iterator
 
-import matplotlib
-matplotlib.use("Agg")
-import pandas as pd
-from matplotlib import pyplot as plt
-from scipy.cluster.hierarchy import dendrogram, fcluster, linkage
-from sklearn.metrics import calinski_harabasz_score, silhouette_score
+import numpy as np
+
+
+BINARY_TOKEN_MAP = {
+    True: 1,
+    False: 0,
+    "1": 1,
+    "0": 0,
+    "是": 1,
+    "否": 0,
+    "有": 1,
+    "无": 0,
+    "阳性": 1,
+    "阴性": 0,
+}
+
+CELL_ZERO = 0
+CELL_POSITIVE = 1
+CELL_COERCED = 2
+CELL_MISSING = 3
+CELL_UNRECOGNIZED = 4
+CELL_NEGATIVE = 5
+NORMALIZE_BLOCK_CELLS = 4_000_000
+DISTANCE_BLOCK_BYTES = 64 * 1024 * 1024
+UNPACK_BLOCK_BYTES = 8 * 1024 * 1024
+DISTANCE_METRICS = ("euclidean", "hamming", "jaccard", "dice")
+LINKAGE_METHODS = ("ward", "average", "complete", "single")
+DEFAULT_OUTPUT_ROOT = "outputs/tcm_clustering"
+LINKAGE_CACHE_DIRNAME = "linkage_cache"
+LINKAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+INCREMENTAL_CACHE_DIRNAME = "incremental_cache"
+INCREMENTAL_STATE_VERSION = 1
+INPUT_CHUNK_ROWS = 5000
+COHORT_CACHE_VERSION = 1
+OUTPUT_CHUNK_ROWS = 10_000
+TABLE_FORMATS = ("xlsx", "csv", "parquet")
+LARGE_OUTPUT_TABLES = ("patient_clusters", "cluster_profiles")
+BATCH_INDEX_NAME = "batch_index.xlsx"
+SWEEP_WORKBOOK_NAME = "min_frequency_sweep.xlsx"
+ANALYSIS_DEPENDENCIES = ("pandas", "openpyxl", "scipy.cluster.hierarchy", "sklearn.cluster", "matplotlib.pyplot")
+DENDROGRAM_MODES = ("auto", "full", "lastp", "level", "none")
+DENDROGRAM_FORMATS = ("png", "svg")
+DENDROGRAM_FULL_LEAF_LIMIT = 1000
+DENDROGRAM_LASTP = 60
+DENDROGRAM_LEVELS = 6
+SILHOUETTE_SAMPLE_SEED = 20260314
+STABILITY_SEED = 20260314
+MICRO_CLUSTER_COUNT = 2000
+MICRO_CLUSTER_SEED = 20260314
+COLLAPSE_MAX_UNIQUE_FRACTION = 0.5
+CLUSTERING_ENGINES = ("exact", "approximate")
+STABILITY_BATCH_RESAMPLES = 10
+STABILITY_MIN_RESAMPLES = 20
+STABILITY_CI_TOLERANCE = 0.02
+STABILITY_CONFIDENCE_Z = 1.96
 
 
 def normalize_binary_series(series: pd.Series) -> pd.Series:
+    import pandas as pd
+
     normalized = series.fillna(0)
-    mapped = normalized.replace(
-        {
-            True: 1,
-            False: 0,
-            "1": 1,
-            "0": 0,
-            "是": 1,
-            "否": 0,
-            "有": 1,
-            "无": 0,
-            "阳性": 1,
-            "阴性": 0,
-        }
-    )
+    mapped = normalized.map(lambda value: BINARY_TOKEN_MAP.get(value, value))
     numeric = pd.to_numeric(mapped, errors="coerce")
     if numeric.isna().any():
         bad_values = sorted({value for value in normalized[numeric.isna()].tolist()})
@@ -44,154 +96,1947 @@ def normalize_binary_series(series: pd.Series) -> pd.Series:
     return coerced
 
 
+def classify_numeric_cells(values: np.ndarray) -> np.ndarray:
+    states = (values > 0).view(np.uint8) + (values > 1).view(np.uint8)
+    states[values < 0] = CELL_NEGATIVE
+    states[np.isnan(values)] = CELL_MISSING
+    return states
+
+
+def classify_object_cells(values: np.ndarray) -> np.ndarray:
+    import pandas as pd
+
+    codes, uniques = pd.factorize(values.ravel(), use_na_sentinel=True)
+    mapped = pd.Series([BINARY_TOKEN_MAP.get(value, value) for value in uniques], dtype=object)
+    numeric = pd.to_numeric(mapped, errors="coerce").to_numpy(dtype=np.float64)
+    unique_states = classify_numeric_cells(numeric)
+    unique_states[np.isnan(numeric)] = CELL_UNRECOGNIZED
+    lookup = np.append(unique_states, np.uint8(CELL_MISSING))
+    return lookup[codes].reshape(values.shape)
+
+
+def classify_binary_frame(frame: pd.DataFrame) -> np.ndarray:
+    import pandas as pd
+
+    states = np.empty(frame.shape, dtype=np.uint8)
+    is_numeric = np.array(
+        [
+            pd.api.types.is_numeric_dtype(dtype) or pd.api.types.is_bool_dtype(dtype)
+            for dtype in frame.dtypes
+        ],
+        dtype=bool,
+    )
+    block_width = max(1, NORMALIZE_BLOCK_CELLS // max(len(frame), 1))
+    for start in range(0, frame.shape[1], block_width):
+        stop = min(start + block_width, frame.shape[1])
+        block = frame.iloc[:, start:stop]
+        block_numeric = is_numeric[start:stop]
+        if block_numeric.all():
+            values = block.to_numpy(dtype=np.float64, na_value=np.nan)
+            states[:, start:stop] = classify_numeric_cells(values)
+            continue
+        numeric_positions = np.flatnonzero(block_numeric)
+        object_positions = np.flatnonzero(~block_numeric)
+        if numeric_positions.size:
+            values = block.iloc[:, numeric_positions].to_numpy(dtype=np.float64, na_value=np.nan)
+            states[:, start + numeric_positions] = classify_numeric_cells(values)
+        values = block.iloc[:, object_positions].to_numpy(dtype=object)
+        states[:, start + object_positions] = classify_object_cells(values)
+    return states
+
+
+def raise_for_invalid_cells(frame: pd.DataFrame, states: np.ndarray) -> None:
+    invalid_columns = np.flatnonzero((states >= CELL_UNRECOGNIZED).any(axis=0))
+    if invalid_columns.size:
+        normalize_binary_series(frame.iloc[:, int(invalid_columns[0])])
+
+
+def build_normalized_features(
+    matrix: np.ndarray,
+    index: pd.Index,
+    columns: pd.Index,
+    missing_fill_count: int,
+    positive_value_coercions: int,
+) -> dict[str, Any]:
+    import pandas as pd
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        global_frequency = matrix.sum(axis=0, dtype=np.int64) / len(matrix)
+    return {
+        "matrix": matrix,
+        "index": index,
+        "columns": columns,
+        "global_frequency": pd.Series(global_frequency, index=columns, dtype=float),
+        "missing_fill_count": int(missing_fill_count),
+        "positive_value_coercions": int(positive_value_coercions),
+    }
+
+
+def normalize_feature_frame(frame: pd.DataFrame) -> dict[str, Any]:
+    states = classify_binary_frame(frame)
+    raise_for_invalid_cells(frame, states)
+    return build_normalized_features(
+        ((states == CELL_POSITIVE) | (states == CELL_COERCED)).view(np.uint8),
+        frame.index,
+        frame.columns,
+        missing_fill_count=np.count_nonzero(states == CELL_MISSING),
+        positive_value_coercions=np.count_nonzero(states == CELL_COERCED),
+    )
+
+
+def as_normalized_features(features: pd.DataFrame | dict[str, Any]) -> dict[str, Any]:
+    if isinstance(features, dict):
+        return features
+    return normalize_feature_frame(features)
+
+
+def normalized_to_frame(normalized: dict[str, Any]) -> pd.DataFrame:
+    import pandas as pd
+
+    return pd.DataFrame(
+        normalized["matrix"],
+        index=normalized["index"],
+        columns=normalized["columns"],
+    )
+
+
+def filter_normalized_features(
+    normalized: dict[str, Any],
+    min_frequency: float = 0.05,
+) -> tuple[dict[str, Any], pd.DataFrame]:
+    import pandas as pd
+
+    global_frequency = normalized["global_frequency"]
+    keep_mask = (global_frequency >= min_frequency).to_numpy()
+
+    stats = pd.DataFrame(
+        {
+            "global_frequency": global_frequency,
+            "keep": [bool(value) for value in keep_mask.tolist()],
+        },
+        index=normalized["columns"],
+    )
+    stats["keep"] = stats["keep"].astype(object)
+    filtered = {
+        **normalized,
+        "matrix": normalized["matrix"][:, keep_mask],
+        "columns": normalized["columns"][keep_mask],
+        "global_frequency": global_frequency[keep_mask],
+    }
+    return filtered, stats
+
+
 def filter_low_frequency_features(
     features: pd.DataFrame,
     min_frequency: float = 0.05,
 ) -> tuple[pd.DataFrame, pd.DataFrame]:
-    normalized = features.apply(normalize_binary_series)
-    global_frequency = normalized.mean(axis=0)
-    keep_mask = global_frequency >= min_frequency
+    filtered, stats = filter_normalized_features(
+        normalize_feature_frame(features),
+        min_frequency=min_frequency,
+    )
+    return normalized_to_frame(filtered), stats
+
+
+def pack_binary_matrix(matrix: np.ndarray) -> np.ndarray:
+    packed = np.packbits(np.asarray(matrix, dtype=np.uint8), axis=1)
+    padding = (-packed.shape[1]) % 8
+    if padding:
+        packed = np.pad(packed, ((0, 0), (0, padding)))
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+
+def distance_block_rows(column_count: int, word_count: int) -> int:
+    return max(1, DISTANCE_BLOCK_BYTES // max(column_count * word_count * 8, 1))
+
+
+def unpack_binary_rows(packed: np.ndarray) -> np.ndarray:
+    return np.unpackbits(np.ascontiguousarray(packed).view(np.uint8), axis=1).astype(np.float32)
+
+
+def binary_distance_block(left: np.ndarray, right: np.ndarray, metric: str = "euclidean") -> np.ndarray:
+    left_bits = unpack_binary_rows(left)
+    cooccurrence = np.empty((len(left), len(right)), dtype=np.float64)
+    chunk_rows = max(1, UNPACK_BLOCK_BYTES // max(left_bits.shape[1] * 4, 1))
+    for start in range(0, len(right), chunk_rows):
+        right_bits = unpack_binary_rows(right[start : start + chunk_rows])
+        cooccurrence[:, start : start + chunk_rows] = left_bits @ right_bits.T
+    left_counts = np.bitwise_count(left).sum(axis=1, dtype=np.float64)
+    right_counts = np.bitwise_count(right).sum(axis=1, dtype=np.float64)
+    totals = left_counts[:, None] + right_counts[None, :]
+    mismatches = totals - 2.0 * cooccurrence
+    if metric == "hamming":
+        return mismatches
+    if metric == "euclidean":
+        return np.sqrt(mismatches, out=mismatches)
+    if metric == "jaccard":
+        denominator = totals - cooccurrence
+    elif metric == "dice":
+        denominator = totals
+    else:
+        raise ValueError(f"未知距离度量: {metric}，可选值为 {', '.join(DISTANCE_METRICS)}")
+    return np.divide(mismatches, denominator, out=np.zeros_like(mismatches), where=denominator > 0)
+
+
+def condensed_distances(
+    packed: np.ndarray,
+    metric: str = "euclidean",
+    memmap_path: Path | None = None,
+) -> np.ndarray:
+    sample_count = len(packed)
+    condensed_size = sample_count * (sample_count - 1) // 2
+    if memmap_path is None:
+        condensed = np.empty(condensed_size, dtype=np.float64)
+    else:
+        condensed = np.memmap(
+            memmap_path,
+            dtype=np.float64,
+            mode="w+",
+            shape=(max(condensed_size, 1),),
+        )[:condensed_size]
+    offset = 0
+    start = 0
+    while start < sample_count:
+        stop = min(start + distance_block_rows(sample_count - start, 4), sample_count)
+        block = binary_distance_block(packed[start:stop], packed[start:], metric)
+        for local_row in range(stop - start):
+            segment = block[local_row, local_row + 1 :]
+            condensed[offset : offset + len(segment)] = segment
+            offset += len(segment)
+        start = stop
+    return condensed
+
+
+def condensed_distance_rows(
+    condensed: np.ndarray,
+    sample_count: int,
+    rows: np.ndarray,
+) -> np.ndarray:
+    row_ids = np.asarray(rows, dtype=np.int64)[:, None]
+    column_ids = np.arange(sample_count, dtype=np.int64)[None, :]
+    low = np.minimum(row_ids, column_ids)
+    high = np.maximum(row_ids, column_ids)
+    diagonal = low == high
+    index = low * sample_count - low * (low + 1) // 2 + (high - low - 1)
+    index[diagonal] = 0
+    distances = np.asarray(condensed[index], dtype=np.float64)
+    distances[diagonal] = 0.0
+    return distances
+
+
+def encode_labels(labels: Iterable[int]) -> tuple[np.ndarray, int]:
+    _, codes = np.unique(np.asarray(labels), return_inverse=True)
+    return codes.astype(np.intp), int(codes.max()) + 1
+
+
+def silhouette_from_distance_sums(
+    distance_sums: np.ndarray,
+    cluster_sizes: np.ndarray,
+    own_codes: np.ndarray,
+) -> np.ndarray:
+    rows = np.arange(len(own_codes))
+    own_sizes = cluster_sizes[own_codes]
+    intra = distance_sums[rows, own_codes] / np.maximum(own_sizes - 1, 1)
+    mean_distances = distance_sums / cluster_sizes
+    mean_distances[rows, own_codes] = np.inf
+    nearest = mean_distances.min(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = (nearest - intra) / np.maximum(intra, nearest)
+    scores[own_sizes == 1] = 0.0
+    return np.nan_to_num(scores)
+
+
+def sample_silhouette_rows(sample_count: int, sample_size: int | None, seed: int) -> np.ndarray | None:
+    if sample_size is None or sample_size >= sample_count:
+        return None
+    if sample_size < 2:
+        raise ValueError("轮廓系数抽样数量至少为 2。")
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(sample_count, size=sample_size, replace=False))
+
+
+def silhouette_membership(
+    label_matrix: np.ndarray,
+    weights: np.ndarray | None = None,
+) -> dict[str, Any]:
+    label_matrix = np.atleast_2d(np.asarray(label_matrix))
+    sample_count = label_matrix.shape[1]
+    encoded = [encode_labels(labels) for labels in label_matrix]
+    offsets = np.cumsum([0] + [cluster_count for _, cluster_count in encoded])
+    membership = np.zeros((sample_count, int(offsets[-1])), dtype=np.float64)
+    for position, (codes, _) in enumerate(encoded):
+        membership[np.arange(sample_count), offsets[position] + codes] = 1.0 if weights is None else weights
+    return {
+        "codes": [codes for codes, _ in encoded],
+        "offsets": offsets,
+        "membership": membership,
+        "cluster_sizes": membership.sum(axis=0),
+    }
+
+
+def silhouette_point_scores(
+    packed: np.ndarray,
+    membership: dict[str, Any],
+    rows: np.ndarray,
+    condensed: np.ndarray | None = None,
+    metric: str = "euclidean",
+) -> np.ndarray:
+    sample_count = len(packed)
+    offsets = membership["offsets"]
+    point_scores = np.empty((len(membership["codes"]), len(rows)), dtype=np.float64)
+    block_rows = distance_block_rows(sample_count, 4)
+    for start in range(0, len(rows), block_rows):
+        block = rows[start : start + block_rows]
+        if condensed is None:
+            distances = binary_distance_block(packed[block], packed, metric)
+        else:
+            distances = condensed_distance_rows(condensed, sample_count, block)
+        distance_sums = distances @ membership["membership"]
+        for position, codes in enumerate(membership["codes"]):
+            columns = slice(offsets[position], offsets[position + 1])
+            point_scores[position, start : start + len(block)] = silhouette_from_distance_sums(
+                distance_sums[:, columns],
+                membership["cluster_sizes"][columns],
+                codes[block],
+            )
+    return point_scores
+
+
+def share_array(array: np.ndarray) -> tuple[shared_memory.SharedMemory, dict[str, Any]]:
+    array = np.ascontiguousarray(array)
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block, {"name": block.name, "shape": array.shape, "dtype": array.dtype.str}
+
+
+def attach_array(spec: dict[str, Any]) -> tuple[Any, np.ndarray]:
+    if "path" in spec:
+        array = np.memmap(spec["path"], dtype=np.dtype(spec["dtype"]), mode="r", shape=tuple(spec["shape"]))
+        return None, array
+    block = shared_memory.SharedMemory(name=spec["name"])
+    return block, np.ndarray(spec["shape"], dtype=np.dtype(spec["dtype"]), buffer=block.buf)
+
+
+@contextmanager
+def shared_arrays(arrays: dict[str, np.ndarray | None]) -> Iterator[dict[str, dict[str, Any]]]:
+    blocks: list[shared_memory.SharedMemory] = []
+    specs: dict[str, dict[str, Any]] = {}
+    try:
+        for key, array in arrays.items():
+            if array is None:
+                continue
+            if isinstance(array, np.memmap) and array.filename:
+                specs[key] = {"path": array.filename, "shape": array.shape, "dtype": array.dtype.str}
+            else:
+                block, specs[key] = share_array(array)
+                blocks.append(block)
+        yield specs
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+SHARED_WORKER_STATE: dict[str, Any] = {}
+
+
+def init_shared_worker(
+    specs: dict[str, dict[str, Any]],
+    settings: dict[str, Any] | None = None,
+) -> None:
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        pass
+    else:
+        threadpool_limits(1)
+    for key, spec in specs.items():
+        SHARED_WORKER_STATE[f"{key}_block"], SHARED_WORKER_STATE[key] = attach_array(spec)
+    SHARED_WORKER_STATE.update(settings or {})
+
+
+def silhouette_worker(rows: np.ndarray) -> np.ndarray:
+    state = SHARED_WORKER_STATE
+    if "membership" not in state:
+        state["membership"] = silhouette_membership(state["labels"], state.get("weights"))
+    return silhouette_point_scores(
+        state["packed"],
+        state["membership"],
+        rows,
+        condensed=state.get("condensed"),
+        metric=state.get("metric", "euclidean"),
+    )
+
+
+def parallel_silhouette_point_scores(
+    packed: np.ndarray,
+    label_matrix: np.ndarray,
+    rows: np.ndarray,
+    jobs: int,
+    condensed: np.ndarray | None = None,
+    weights: np.ndarray | None = None,
+    metric: str = "euclidean",
+) -> np.ndarray:
+    arrays = {
+        "packed": packed,
+        "labels": np.atleast_2d(label_matrix),
+        "condensed": condensed,
+        "weights": weights,
+    }
+    tasks = [task for task in np.array_split(rows, min(len(rows), jobs * 4)) if len(task)]
+    with shared_arrays(arrays) as specs, ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=init_shared_worker,
+        initargs=(specs, {"metric": metric}),
+    ) as executor:
+        parts = list(executor.map(silhouette_worker, tasks))
+    return np.concatenate(parts, axis=1)
+
+
+def resolve_jobs(jobs: int | None) -> int:
+    if jobs is None or jobs < 1:
+        return os.cpu_count() or 1
+    return int(jobs)
+
+
+def silhouette_scores(
+    packed: np.ndarray,
+    label_matrix: np.ndarray,
+    sample_rows: np.ndarray | None = None,
+    condensed: np.ndarray | None = None,
+    jobs: int = 1,
+    weights: np.ndarray | None = None,
+    metric: str = "euclidean",
+) -> tuple[np.ndarray, np.ndarray]:
+    sample_count = len(packed) if weights is None else int(weights.sum())
+    rows = np.arange(sample_count) if sample_rows is None else np.asarray(sample_rows)
+    vector_rows, patient_vectors = rows, None
+    if weights is not None:
+        if sample_rows is None:
+            vector_rows = np.arange(len(packed))
+        else:
+            vector_rows, patient_vectors = np.unique(
+                np.searchsorted(np.cumsum(weights), rows, side="right"),
+                return_inverse=True,
+            )
+    jobs = resolve_jobs(jobs)
+    if jobs > 1 and len(vector_rows) > 1:
+        point_scores = parallel_silhouette_point_scores(
+            packed,
+            label_matrix,
+            vector_rows,
+            jobs,
+            condensed=condensed,
+            weights=weights,
+            metric=metric,
+        )
+    else:
+        point_scores = silhouette_point_scores(
+            packed,
+            silhouette_membership(label_matrix, weights),
+            vector_rows,
+            condensed=condensed,
+            metric=metric,
+        )
+
+    if sample_rows is None:
+        scores = point_scores.mean(axis=1) if weights is None else point_scores @ weights / sample_count
+        return scores, np.zeros_like(scores)
+    if patient_vectors is not None:
+        point_scores = point_scores[:, patient_vectors]
+    scores = point_scores.mean(axis=1)
+    finite_population = np.sqrt(1.0 - len(rows) / sample_count)
+    errors = point_scores.std(axis=1, ddof=1) / np.sqrt(len(rows)) * finite_population
+    return scores, errors
+
+
+def cluster_feature_counts(
+    matrix: np.ndarray,
+    codes: np.ndarray,
+    cluster_count: int,
+) -> np.ndarray:
+    counts = np.zeros((cluster_count, matrix.shape[1]), dtype=np.float64)
+    block_rows = max(1, NORMALIZE_BLOCK_CELLS // max(matrix.shape[1], 1))
+    for start in range(0, len(matrix), block_rows):
+        stop = min(start + block_rows, len(matrix))
+        membership = np.zeros((stop - start, cluster_count), dtype=np.float32)
+        membership[np.arange(stop - start), codes[start:stop]] = 1.0
+        counts += membership.T @ matrix[start:stop].astype(np.float32)
+    return counts
+
+
+def binary_calinski_harabasz_score(matrix: np.ndarray, labels: Iterable[int]) -> float:
+    codes, cluster_count = encode_labels(labels)
+    sample_count = len(matrix)
+    counts = cluster_feature_counts(matrix, codes, cluster_count)
+    cluster_sizes = np.bincount(codes, minlength=cluster_count).astype(np.float64)
+    totals = counts.sum(axis=0)
+    explained = float(((counts**2).sum(axis=1) / cluster_sizes).sum())
+    extra_dispersion = explained - float((totals**2).sum()) / sample_count
+    intra_dispersion = float(totals.sum()) - explained
+    if intra_dispersion == 0:
+        return 1.0
+    return extra_dispersion * (sample_count - cluster_count) / (intra_dispersion * (cluster_count - 1))
+
+
+def weighted_ward_linkage(centroids: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    centroids = np.asarray(centroids, dtype=np.float64)
+    sizes = np.asarray(weights, dtype=np.float64)
+    norms = (centroids**2).sum(axis=1)
+    leaf_count = len(centroids)
+    condensed = np.empty(leaf_count * (leaf_count - 1) // 2, dtype=np.float64)
+    offset = 0
+    start = 0
+    while start < leaf_count:
+        stop = min(start + distance_block_rows(leaf_count - start, 1), leaf_count)
+        block = norms[start:stop, None] + norms[None, start:]
+        block -= 2.0 * (centroids[start:stop] @ centroids[start:].T)
+        np.maximum(block, 0.0, out=block)
+        for local_row in range(stop - start):
+            segment = block[local_row, local_row + 1 :]
+            condensed[offset : offset + len(segment)] = segment
+            offset += len(segment)
+        start = stop
+    return weighted_linkage(weighted_ward_distances(condensed, sizes), sizes, method="ward")
+
+
+def weighted_ward_distances(squared: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    sizes = np.asarray(weights, dtype=np.float64)
+    offset = 0
+    for row in range(len(sizes) - 1):
+        others = sizes[row + 1 :]
+        squared[offset : offset + len(others)] *= 2.0 * sizes[row] * others / (sizes[row] + others)
+        offset += len(others)
+    return np.sqrt(squared, out=squared)
+
+
+def weighted_linkage(
+    condensed: np.ndarray,
+    weights: np.ndarray,
+    method: str,
+    overwrite: bool = False,
+) -> np.ndarray:
+    if method not in LINKAGE_METHODS:
+        raise ValueError(f"未知连接方法: {method}，可选值为 {', '.join(LINKAGE_METHODS)}")
+    distances = condensed if overwrite else np.array(condensed, dtype=np.float64)
+    sizes = np.asarray(weights, dtype=np.float64).copy()
+    leaf_count = len(sizes)
+    slots = np.arange(leaf_count, dtype=np.int64)
+    row_starts = slots * leaf_count - slots * (slots + 1) // 2 - slots - 1
+    active = np.ones(leaf_count, dtype=bool)
+
+    def read_row(slot: int) -> np.ndarray:
+        row = np.empty(leaf_count, dtype=np.float64)
+        row[:slot] = distances[row_starts[:slot] + slot]
+        row[slot + 1 :] = distances[row_starts[slot] + slot + 1 : row_starts[slot] + leaf_count]
+        row[slot] = np.inf
+        row[~active] = np.inf
+        return row
+
+    merges = np.empty((max(leaf_count - 1, 0), 3), dtype=np.float64)
+    chain: list[int] = []
+    for step in range(leaf_count - 1):
+        if not chain:
+            chain.append(int(np.flatnonzero(active)[0]))
+        while True:
+            current = chain[-1]
+            current_row = read_row(current)
+            nearest = int(np.argmin(current_row))
+            if len(chain) > 1 and current_row[chain[-2]] <= current_row[nearest]:
+                nearest = chain[-2]
+            if len(chain) > 1 and nearest == chain[-2]:
+                break
+            chain.append(nearest)
+        right = chain.pop()
+        left = chain.pop()
+        left, right = min(left, right), max(left, right)
+        left_row, right_row = read_row(left), read_row(right)
+        merged_distance = left_row[right]
+        merges[step] = (left, right, merged_distance)
+
+        with np.errstate(invalid="ignore"):
+            if method == "ward":
+                scale = 1.0 / (sizes[left] + sizes[right] + sizes)
+                updated = np.sqrt(
+                    (sizes + sizes[left]) * scale * left_row * left_row
+                    + (sizes + sizes[right]) * scale * right_row * right_row
+                    - sizes * scale * merged_distance * merged_distance
+                )
+            elif method == "average":
+                updated = (sizes[left] * left_row + sizes[right] * right_row) / (sizes[left] + sizes[right])
+            elif method == "complete":
+                updated = np.maximum(left_row, right_row)
+            else:
+                updated = np.minimum(left_row, right_row)
+        sizes[right] += sizes[left]
+        sizes[left] = 0.0
+        active[left] = False
+        distances[row_starts[:right] + right] = updated[:right]
+        distances[row_starts[right] + right + 1 : row_starts[right] + leaf_count] = updated[right + 1 :]
+
+    order = np.argsort(merges[:, 2], kind="mergesort")
+    cluster_ids = np.arange(leaf_count)
+    cluster_sizes = dict.fromkeys(range(leaf_count), 1)
+    parents = np.arange(leaf_count)
+
+    def root(slot: int) -> int:
+        while parents[slot] != slot:
+            parents[slot] = parents[parents[slot]]
+            slot = parents[slot]
+        return slot
+
+    linkage_matrix = np.empty((len(merges), 4), dtype=np.float64)
+    for row, (left, right, distance) in enumerate(merges[order]):
+        left_root, right_root = root(int(left)), root(int(right))
+        left_id, right_id = sorted((cluster_ids[left_root], cluster_ids[right_root]))
+        size = cluster_sizes.pop(left_id) + cluster_sizes.pop(right_id)
+        linkage_matrix[row] = (left_id, right_id, distance, size)
+        parents[left_root] = right_root
+        cluster_ids[right_root] = leaf_count + row
+        cluster_sizes[leaf_count + row] = size
+    return linkage_matrix
+
+
+def collapse_duplicate_rows(matrix: np.ndarray, packed: np.ndarray | None = None) -> dict[str, np.ndarray]:
+    if packed is None:
+        packed = pack_binary_matrix(matrix)
+    _, first_rows, assignments, weights = np.unique(
+        packed,
+        axis=0,
+        return_index=True,
+        return_inverse=True,
+        return_counts=True,
+    )
+    return {
+        "matrix": matrix[first_rows],
+        "packed": packed[first_rows],
+        "first_rows": first_rows,
+        "assignments": assignments.ravel().astype(np.intp),
+        "weights": weights.astype(np.int64),
+    }
+
+
+def collapse_if_worthwhile(
+    matrix: np.ndarray,
+    packed: np.ndarray | None = None,
+    max_unique_fraction: float = COLLAPSE_MAX_UNIQUE_FRACTION,
+) -> dict[str, np.ndarray] | None:
+    collapsed = collapse_duplicate_rows(matrix, packed)
+    if len(collapsed["weights"]) > max_unique_fraction * len(matrix):
+        return None
+    return collapsed
+
+
+def compress_patients(
+    matrix: np.ndarray,
+    max_micro_clusters: int = MICRO_CLUSTER_COUNT,
+    seed: int = MICRO_CLUSTER_SEED,
+) -> dict[str, np.ndarray]:
+    from sklearn.cluster import MiniBatchKMeans
+
+    collapsed = collapse_duplicate_rows(matrix)
+    patient_vectors = collapsed["assignments"]
+    vector_counts = collapsed["weights"]
+    vectors = collapsed["matrix"].astype(np.float64)
+    if len(vectors) <= max_micro_clusters:
+        return {
+            "assignments": patient_vectors,
+            "centroids": vectors,
+            "weights": vector_counts.astype(np.float64),
+        }
+    model = MiniBatchKMeans(
+        n_clusters=max_micro_clusters,
+        init="random",
+        random_state=seed,
+        batch_size=max(4096, 2 * max_micro_clusters),
+        n_init=1,
+    )
+    vector_clusters, cluster_count = encode_labels(
+        model.fit_predict(vectors, sample_weight=vector_counts)
+    )
+    weights = np.bincount(vector_clusters, weights=vector_counts, minlength=cluster_count)
+    sums = np.zeros((cluster_count, vectors.shape[1]), dtype=np.float64)
+    np.add.at(sums, vector_clusters, vectors * vector_counts[:, None])
+    return {
+        "assignments": vector_clusters[patient_vectors],
+        "centroids": sums / weights[:, None],
+        "weights": weights,
+    }
+
+
+def peak_rss_bytes() -> int | None:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return int(peak if sys.platform == "darwin" else peak * 1024)
+
+
+def cpu_seconds() -> float:
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def stage_profile(name: str) -> dict[str, Any]:
+    return {
+        "stage": name,
+        "wall_seconds": 0.0,
+        "cpu_seconds": 0.0,
+        "peak_rss_growth_mb": None,
+        "tracemalloc_peak_mb": None,
+    }
+
+
+def start_stage(name: str) -> dict[str, Any]:
+    stage = {"profile": stage_profile(name), "rss_before": peak_rss_bytes(), "traced_before": None}
+    if tracemalloc.is_tracing():
+        stage["traced_before"] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    stage["wall_started"] = time.perf_counter()
+    stage["cpu_started"] = cpu_seconds()
+    return stage
+
+
+def measure_stage(stage: dict[str, Any]) -> dict[str, Any]:
+    profile = stage["profile"]
+    profile["wall_seconds"] = round(time.perf_counter() - stage["wall_started"], 4)
+    profile["cpu_seconds"] = round(cpu_seconds() - stage["cpu_started"], 4)
+    rss_after = peak_rss_bytes()
+    if stage["rss_before"] is not None and rss_after is not None:
+        profile["peak_rss_growth_mb"] = round((rss_after - stage["rss_before"]) / 1024 / 1024, 1)
+    if stage["traced_before"] is not None and tracemalloc.is_tracing():
+        traced_peak = tracemalloc.get_traced_memory()[1] - stage["traced_before"]
+        profile["tracemalloc_peak_mb"] = round(traced_peak / 1024 / 1024, 1)
+    return profile
+
+
+@contextmanager
+def profile_stage(profiles: list[dict[str, Any]] | None, name: str) -> Iterator[dict[str, Any]]:
+    stage = start_stage(name)
+    try:
+        yield stage["profile"]
+    finally:
+        measure_stage(stage)
+        if profiles is not None:
+            profiles.append(stage["profile"])
+
+
+@contextmanager
+def accumulate_profile(profile: dict[str, Any] | None) -> Iterator[None]:
+    if profile is None:
+        yield
+        return
+    wall_started = time.perf_counter()
+    cpu_started = cpu_seconds()
+    try:
+        yield
+    finally:
+        profile["wall_seconds"] = round(profile["wall_seconds"] + time.perf_counter() - wall_started, 4)
+        profile["cpu_seconds"] = round(profile["cpu_seconds"] + cpu_seconds() - cpu_started, 4)
+
+
+def profile_chunks(chunks: Iterable[pd.DataFrame], profile: dict[str, Any]) -> Iterator[pd.DataFrame]:
+    iterator = iter(chunks)
+    while True:
+        try:
+            with accumulate_profile(profile):
+                chunk = next(iterator)
+        except StopIteration:
+            return
+        yield chunk
+
+
+def stage_profile_rows(profiles: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    return [
+        {"metric": f"stage_{profile['stage']}_{field}", "value": profile[field]}
+        for profile in profiles
+        for field in ("wall_seconds", "cpu_seconds", "peak_rss_growth_mb", "tracemalloc_peak_mb")
+    ]
+
+
+def cluster_numbering_keys(linkage_matrix: np.ndarray) -> np.ndarray:
+    sample_count = len(linkage_matrix) + 1
+    children = linkage_matrix[:, :2].astype(np.intp)
+    keys = np.arange(2 * sample_count - 1, dtype=np.intp)
+    if sample_count < 2:
+        return keys
+    counter = 0
+    stack = [(2 * sample_count - 2, False)]
+    while stack:
+        node, expanded = stack.pop()
+        left, right = children[node - sample_count]
+        if expanded:
+            for child in (left, right):
+                if child < sample_count:
+                    keys[child] = counter
+                    counter += 1
+            continue
+        keys[node] = counter
+        counter += 1
+        stack.append((node, True))
+        for child in (right, left):
+            if child >= sample_count:
+                stack.append((child, False))
+    return keys
+
+
+def linkage_merge_schedule(
+    linkage_matrix: np.ndarray,
+    ks: list[int],
+) -> tuple[np.ndarray, np.ndarray]:
+    from scipy.cluster.hierarchy import maxdists
+
+    sample_count = len(linkage_matrix) + 1
+    max_dists = maxdists(linkage_matrix)
+    merge_order = np.argsort(max_dists, kind="stable")
+    sorted_dists = max_dists[merge_order]
+    merge_counts = np.zeros(len(ks), dtype=np.intp)
+    for position, k in enumerate(ks):
+        if k < 1:
+            raise ValueError(f"聚类数必须为正整数: {k}")
+        if k < sample_count:
+            threshold = sorted_dists[sample_count - k - 1]
+            merge_counts[position] = np.searchsorted(sorted_dists, threshold, side="right")
+    return merge_order, merge_counts
+
+
+def cut_linkage_labels(linkage_matrix, ks: Iterable[int]) -> np.ndarray:
+    linkage_matrix = np.asarray(linkage_matrix, dtype=np.float64)
+    ks = [int(k) for k in ks]
+    sample_count = len(linkage_matrix) + 1
+    labels = np.empty((len(ks), sample_count), dtype=np.int32)
+    if not ks:
+        return labels
+
+    merge_order, merge_counts = linkage_merge_schedule(linkage_matrix, ks)
+    children = linkage_matrix[:, :2].astype(np.intp)
+    parents = np.arange(2 * sample_count - 1, dtype=np.intp)
+    numbering_keys = cluster_numbering_keys(linkage_matrix)
+    roots = np.arange(sample_count, dtype=np.intp)
+    applied = 0
+    for position in np.argsort(merge_counts, kind="stable"):
+        if ks[position] >= sample_count:
+            labels[position] = np.arange(1, sample_count + 1)
+            continue
+        target = int(merge_counts[position])
+        if target > applied:
+            rows = merge_order[applied:target]
+            parents[children[rows, 0]] = rows + sample_count
+            parents[children[rows, 1]] = rows + sample_count
+            applied = target
+            while True:
+                next_roots = parents[roots]
+                if np.array_equal(next_roots, roots):
+                    break
+                parents[roots] = parents[next_roots]
+                roots = next_roots
+        cluster_roots = np.unique(roots)
+        cluster_numbers = np.empty(len(cluster_roots), dtype=np.int32)
+        cluster_numbers[np.argsort(numbering_keys[cluster_roots])] = np.arange(
+            1, len(cluster_roots) + 1
+        )
+        labels[position] = cluster_numbers[np.searchsorted(cluster_roots, roots)]
+    return labels
+
+
+def subtree_leaf_ranges(linkage_matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    from scipy.cluster.hierarchy import leaves_list
+
+    sample_count = len(linkage_matrix) + 1
+    leaf_order = leaves_list(linkage_matrix)
+    starts = np.empty(2 * sample_count - 1, dtype=np.intp)
+    sizes = np.ones(2 * sample_count - 1, dtype=np.intp)
+    starts[leaf_order] = np.arange(sample_count)
+    for row, (left, right) in enumerate(linkage_matrix[:, :2].astype(np.intp)):
+        starts[sample_count + row] = min(starts[left], starts[right])
+        sizes[sample_count + row] = sizes[left] + sizes[right]
+    return leaf_order, starts, sizes
+
+
+def nested_calinski_harabasz_scores(
+    matrix: np.ndarray,
+    linkage_matrix,
+    ks: Iterable[int],
+    weights: np.ndarray | None = None,
+) -> np.ndarray:
+    linkage_matrix = np.asarray(linkage_matrix, dtype=np.float64)
+    ks = [int(k) for k in ks]
+    leaf_count = len(linkage_matrix) + 1
+    merge_order, merge_counts = linkage_merge_schedule(linkage_matrix, ks)
+    levels = leaf_count - merge_counts
+    leaf_order, starts, sizes = subtree_leaf_ranges(linkage_matrix)
+    children = linkage_matrix[:, :2].astype(np.intp)
+    leaf_weights = np.ones(leaf_count, dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)
+    weight_prefix = np.concatenate([[0], np.cumsum(leaf_weights[leaf_order])])
+    node_weights = weight_prefix[starts + sizes] - weight_prefix[starts]
+    sample_count = int(weight_prefix[-1])
+
+    def subtree_sum(node: int) -> np.ndarray:
+        rows = np.sort(leaf_order[starts[node] : starts[node] + sizes[node]])
+        if weights is None:
+            return matrix[rows].sum(axis=0, dtype=np.int64)
+        return leaf_weights[rows] @ matrix[rows].astype(np.int64)
+
+    def explained_term(sums: np.ndarray, size: int) -> float:
+        return float(sums @ sums) / size
+
+    totals = subtree_sum(2 * leaf_count - 2)
+    total_ones = float(totals.sum())
+    baseline = explained_term(totals, sample_count)
+    explained = baseline
+    cluster_sums = {2 * leaf_count - 2: totals}
+    level_scores: dict[int, float] = {}
+    wanted_levels = {int(level) for level in levels if level >= 2}
+    for level in range(2, max(wanted_levels, default=1) + 1):
+        row = merge_order[leaf_count - level]
+        node = leaf_count + row
+        parent_sums = cluster_sums.pop(node)
+        left, right = children[row]
+        small, large = (left, right) if sizes[left] <= sizes[right] else (right, left)
+        small_sums = subtree_sum(small)
+        large_sums = parent_sums - small_sums
+        explained += (
+            explained_term(small_sums, node_weights[small])
+            + explained_term(large_sums, node_weights[large])
+            - explained_term(parent_sums, node_weights[node])
+        )
+        for child, sums in ((small, small_sums), (large, large_sums)):
+            if child >= leaf_count:
+                cluster_sums[child] = sums
+        if level in wanted_levels:
+            intra_dispersion = total_ones - explained
+            # Non-zero within-cluster dispersion of 0/1 data is at least 1/2.
+            if intra_dispersion < 0.25:
+                level_scores[level] = 1.0
+            else:
+                level_scores[level] = (
+                    (explained - baseline)
+                    * (sample_count - level)
+                    / (intra_dispersion * (level - 1))
+                )
+    return np.array([level_scores.get(int(level), np.nan) for level in levels], dtype=np.float64)
+
+
+def candidate_cluster_labels(
+    linkage_matrix,
+    candidate_ks: Iterable[int],
+    sample_count: int | None = None,
+) -> tuple[list[int], np.ndarray]:
+    leaf_count = len(linkage_matrix) + 1
+    sample_count = leaf_count if sample_count is None else sample_count
+    ks = [int(k) for k in candidate_ks if 2 <= k < sample_count and k <= leaf_count]
+    label_matrix = cut_linkage_labels(linkage_matrix, ks)
+    label_counts = label_matrix.max(axis=1) if ks else np.array([], dtype=np.int32)
+    valid = (label_counts >= 2) & (label_counts < sample_count)
+    return [k for k, keep in zip(ks, valid) if keep], label_matrix[valid]
+
+
+def bootstrap_sample_rows(sample_count: int, seed: int, resample: int) -> np.ndarray:
+    rng = np.random.default_rng([seed, resample])
+    return np.unique(rng.integers(0, sample_count, size=sample_count))
+
+
+def condensed_subset(condensed: np.ndarray, sample_count: int, rows: np.ndarray) -> np.ndarray:
+    rows = np.asarray(rows, dtype=np.int64)
+    subset = np.empty(len(rows) * (len(rows) - 1) // 2, dtype=np.float64)
+    increasing = bool(np.all(rows[1:] > rows[:-1]))
+    position = 0
+    for offset, row in enumerate(rows[:-1]):
+        columns = rows[offset + 1 :]
+        if increasing:
+            start = row * sample_count - row * (row + 1) // 2 - row - 1
+            subset[position : position + len(columns)] = condensed[start + columns]
+        else:
+            low = np.minimum(row, columns)
+            high = np.maximum(row, columns)
+            subset[position : position + len(columns)] = condensed[
+                low * sample_count - low * (low + 1) // 2 + high - low - 1
+            ]
+        position += len(columns)
+    return subset
+
+
+def label_contingency(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    left_codes, left_count = encode_labels(left)
+    right_codes, right_count = encode_labels(right)
+    counts = np.bincount(left_codes * right_count + right_codes, minlength=left_count * right_count)
+    return counts.reshape(left_count, right_count)
+
+
+def adjusted_rand_index(left: np.ndarray, right: np.ndarray) -> float:
+    contingency = label_contingency(left, right).astype(np.float64)
+
+    def pair_count(counts: np.ndarray) -> float:
+        return float((counts * (counts - 1)).sum() / 2)
+
+    index = pair_count(contingency)
+    left_pairs = pair_count(contingency.sum(axis=1))
+    right_pairs = pair_count(contingency.sum(axis=0))
+    total_pairs = pair_count(np.array([contingency.sum()]))
+    expected = left_pairs * right_pairs / total_pairs if total_pairs else 0.0
+    maximum = (left_pairs + right_pairs) / 2
+    if maximum == expected:
+        return 1.0
+    return (index - expected) / (maximum - expected)
+
+
+def cluster_jaccard_scores(reference: np.ndarray, labels: np.ndarray, cluster_count: int) -> np.ndarray:
+    reference = np.asarray(reference, dtype=np.int64)
+    label_codes, label_count = encode_labels(labels)
+    intersection = np.bincount(
+        (reference - 1) * label_count + label_codes,
+        minlength=cluster_count * label_count,
+    ).reshape(cluster_count, label_count)
+    reference_sizes = intersection.sum(axis=1)
+    union = reference_sizes[:, None] + intersection.sum(axis=0)[None, :] - intersection
+    scores = np.full(cluster_count, np.nan)
+    present = reference_sizes > 0
+    scores[present] = (intersection[present] / union[present]).max(axis=1)
+    return scores
+
+
+def bootstrap_resample_scores(
+    condensed: np.ndarray,
+    valid_ks: list[int],
+    label_matrix: np.ndarray,
+    rows: np.ndarray,
+    method: str = "ward",
+) -> tuple[np.ndarray, np.ndarray]:
+    from scipy.cluster.hierarchy import linkage
+
+    sample_count = label_matrix.shape[1]
+    resample_linkage = linkage(condensed_subset(condensed, sample_count, rows), method=method)
+    resample_labels = cut_linkage_labels(resample_linkage, valid_ks)
+    rand_indices = np.empty(len(valid_ks), dtype=np.float64)
+    jaccard = []
+    for position, k in enumerate(valid_ks):
+        reference = label_matrix[position, rows]
+        rand_indices[position] = adjusted_rand_index(reference, resample_labels[position])
+        jaccard.append(cluster_jaccard_scores(reference, resample_labels[position], k))
+    return rand_indices, np.concatenate(jaccard) if jaccard else np.array([], dtype=np.float64)
+
+
+def stability_worker(resample: int) -> tuple[np.ndarray, np.ndarray]:
+    state = SHARED_WORKER_STATE
+    rows = bootstrap_sample_rows(state["labels"].shape[1], state["seed"], resample)
+    return bootstrap_resample_scores(
+        state["condensed"],
+        state["valid_ks"],
+        state["labels"],
+        rows,
+        method=state["method"],
+    )
+
+
+def stability_statistics(scores: np.ndarray) -> dict[str, np.ndarray]:
+    observed = np.isfinite(scores)
+    counts = observed.sum(axis=0)
+    values = np.where(observed, scores, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = values.sum(axis=0) / counts
+        squared = np.where(observed, (scores - means) ** 2, 0.0).sum(axis=0)
+        deviations = np.sqrt(squared / (counts - 1))
+        half_widths = STABILITY_CONFIDENCE_Z * deviations / np.sqrt(counts)
+    return {"mean": means, "std": deviations, "half_width": half_widths, "count": counts}
+
+
+def bootstrap_stability(
+    condensed: np.ndarray,
+    valid_ks: list[int],
+    label_matrix: np.ndarray,
+    resamples: int,
+    seed: int = STABILITY_SEED,
+    tolerance: float = STABILITY_CI_TOLERANCE,
+    jobs: int = 1,
+    method: str = "ward",
+) -> pd.DataFrame:
+    import pandas as pd
+
+    label_matrix = np.atleast_2d(label_matrix)
+    sample_count = label_matrix.shape[1]
+    jobs = resolve_jobs(jobs)
+    rand_indices: list[np.ndarray] = []
+    jaccard: list[np.ndarray] = []
+    with shared_arrays({"condensed": condensed, "labels": label_matrix} if jobs > 1 else {}) as specs:
+        executor = (
+            ProcessPoolExecutor(
+                max_workers=jobs,
+                initializer=init_shared_worker,
+                initargs=(specs, {"valid_ks": valid_ks, "seed": seed, "method": method}),
+            )
+            if jobs > 1
+            else None
+        )
+        try:
+            for start in range(0, resamples, STABILITY_BATCH_RESAMPLES):
+                batch = range(start, min(start + STABILITY_BATCH_RESAMPLES, resamples))
+                if executor is None:
+                    results = [
+                        bootstrap_resample_scores(
+                            condensed,
+                            valid_ks,
+                            label_matrix,
+                            bootstrap_sample_rows(sample_count, seed, resample),
+                            method=method,
+                        )
+                        for resample in batch
+                    ]
+                else:
+                    results = list(executor.map(stability_worker, batch))
+                for rand_index, cluster_scores in results:
+                    rand_indices.append(rand_index)
+                    jaccard.append(cluster_scores)
+                if len(rand_indices) >= STABILITY_MIN_RESAMPLES:
+                    scores = np.column_stack([np.vstack(rand_indices), np.vstack(jaccard)])
+                    half_widths = stability_statistics(scores)["half_width"]
+                    if np.all(np.isfinite(half_widths) & (half_widths <= tolerance)):
+                        break
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    columns = [(k, None, "adjusted_rand_index") for k in valid_ks]
+    columns += [(k, cluster, "jaccard") for k in valid_ks for cluster in range(1, k + 1)]
+    statistics = stability_statistics(
+        np.column_stack([np.vstack(rand_indices), np.vstack(jaccard)])
+    )
+    return pd.DataFrame(
+        {
+            "k": [k for k, _, _ in columns],
+            "cluster": pd.array([cluster for _, cluster, _ in columns], dtype="Int64"),
+            "metric": [metric for _, _, metric in columns],
+            "mean": statistics["mean"],
+            "std": statistics["std"],
+            "ci_lower": statistics["mean"] - statistics["half_width"],
+            "ci_upper": statistics["mean"] + statistics["half_width"],
+            "resamples": statistics["count"],
+        }
+    )
+
+
+def select_best_k(metrics: pd.DataFrame) -> pd.Series:
+    required = {"k", "silhouette_score", "calinski_harabasz_score"}
+    missing = required - set(metrics.columns)
+    if missing:
+        raise ValueError(f"缺少指标列: {sorted(missing)}")
+    ranked = metrics.sort_values(
+        by=["silhouette_score", "calinski_harabasz_score", "k"],
+        ascending=[False, False, True],
+    )
+    return ranked.iloc[0]
+
+
+def build_cluster_profiles(
+    features: pd.DataFrame | dict[str, Any],
+    labels: pd.Series,
+) -> pd.DataFrame:
+    import pandas as pd
+
+    normalized = as_normalized_features(features)
+    matrix = normalized["matrix"]
+    cluster_ids, codes = np.unique(np.asarray(labels), return_inverse=True)
+    counts = cluster_feature_counts(matrix, codes, len(cluster_ids)).astype(np.int64)
+    cluster_sizes = np.bincount(codes, minlength=len(cluster_ids)).astype(np.int64)
+    cluster_frequency = counts / cluster_sizes[:, None]
+    global_frequency = normalized["global_frequency"].to_numpy(dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lift = np.where(global_frequency > 0, cluster_frequency / global_frequency, 0.0)
+
+    feature_count = matrix.shape[1]
+    return pd.DataFrame(
+        {
+            "cluster": np.repeat(cluster_ids.astype(np.int64), feature_count),
+            "cluster_size": np.repeat(cluster_sizes, feature_count),
+            "feature": np.tile(np.asarray(normalized["columns"], dtype=object), len(cluster_ids)),
+            "count": counts.ravel(),
+            "cluster_frequency": cluster_frequency.ravel(),
+            "global_frequency": np.tile(global_frequency, len(cluster_ids)),
+            "lift": lift.ravel(),
+        }
+    )
+
+
+def sort_cluster_profiles(profiles: pd.DataFrame) -> pd.DataFrame:
+    return profiles.sort_values(
+        by=["cluster", "cluster_frequency", "lift", "count", "feature"],
+        ascending=[True, False, False, False, True],
+    ).reset_index(drop=True)
+
+
+def prepare_feature_chunks(
+    chunks: Iterable[pd.DataFrame],
+    excluded_columns: Iterable[str] = ("姓名", "年龄"),
+    min_frequency: float = 0.05,
+    normalize_profile: dict[str, Any] | None = None,
+    filter_profile: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    import pandas as pd
+
+    excluded_columns = list(excluded_columns)
+    identifier_columns: list[str] = []
+    feature_columns: list[str] | None = None
+    identifier_frames: list[pd.DataFrame] = []
+    matrices: list[np.ndarray] = []
+    raw_row_count = 0
+    dropped_summary_row_count = 0
+    missing_fill_count = 0
+    positive_value_coercions = 0
+
+    for chunk in chunks:
+        if feature_columns is None:
+            identifier_columns = [col for col in excluded_columns if col in chunk.columns]
+            feature_columns = [col for col in chunk.columns if col not in excluded_columns]
+            if not feature_columns:
+                raise ValueError("没有可用于聚类的证候列。")
+        raw_row_count += len(chunk)
+        if identifier_columns:
+            summary_row_mask = chunk[identifier_columns].isna().all(axis=1)
+            chunk = chunk.loc[~summary_row_mask]
+            dropped_summary_row_count += int(summary_row_mask.sum())
+        with accumulate_profile(normalize_profile):
+            normalized_chunk = normalize_feature_frame(chunk.loc[:, feature_columns])
+        identifier_frames.append(chunk.loc[:, identifier_columns].copy())
+        matrices.append(normalized_chunk["matrix"])
+        missing_fill_count += normalized_chunk["missing_fill_count"]
+        positive_value_coercions += normalized_chunk["positive_value_coercions"]
+
+    if feature_columns is None:
+        raise ValueError("输入数据为空，没有可用于聚类的证候列。")
+    identifiers = pd.concat(identifier_frames) if len(identifier_frames) > 1 else identifier_frames[0]
+    normalized = build_normalized_features(
+        np.concatenate(matrices) if len(matrices) > 1 else matrices[0],
+        identifiers.index,
+        pd.Index(feature_columns),
+        missing_fill_count=missing_fill_count,
+        positive_value_coercions=positive_value_coercions,
+    )
+    with accumulate_profile(filter_profile):
+        filtered, filter_stats = filter_normalized_features(
+            normalized,
+            min_frequency=min_frequency,
+        )
+        if filtered["matrix"].shape[1] == 0:
+            raise ValueError("低频剔除后没有剩余证候列，无法继续聚类。")
+        feature_frame = normalized_to_frame(filtered)
+
+    return {
+        "identifiers": identifiers,
+        "normalized": filtered,
+        "feature_frame": feature_frame,
+        "feature_filter": filter_stats,
+        "missing_fill_count": missing_fill_count,
+        "dropped_summary_row_count": dropped_summary_row_count,
+        "positive_value_coercions": positive_value_coercions,
+        "excluded_columns": excluded_columns,
+        "raw_row_count": raw_row_count,
+    }
+
+
+def prepare_feature_matrix(
+    data: pd.DataFrame,
+    excluded_columns: Iterable[str] = ("姓名", "年龄"),
+    min_frequency: float = 0.05,
+) -> dict[str, Any]:
+    return prepare_feature_chunks(
+        [data],
+        excluded_columns=excluded_columns,
+        min_frequency=min_frequency,
+    )
+
+
+def unique_column_names(header: Iterable[Any]) -> list[str]:
+    names: list[str] = []
+    seen: dict[str, int] = {}
+    for position, value in enumerate(header):
+        name = f"Unnamed: {position}" if value is None else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def read_excel_chunks(
+    input_path: Path,
+    sheet_name: str | int | None = None,
+    chunk_rows: int = INPUT_CHUNK_ROWS,
+) -> tuple[str, Iterator[pd.DataFrame]]:
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(input_path, read_only=True, data_only=True)
+    if sheet_name is None:
+        worksheet = workbook.worksheets[0]
+    elif sheet_name in workbook.sheetnames:
+        worksheet = workbook[sheet_name]
+    elif str(sheet_name).isdigit() and int(sheet_name) < len(workbook.worksheets):
+        worksheet = workbook.worksheets[int(sheet_name)]
+    else:
+        workbook.close()
+        raise ValueError(f"工作簿中不存在工作表: {sheet_name}，可选: {workbook.sheetnames}")
+
+    def chunks() -> Iterator[pd.DataFrame]:
+        try:
+            rows = worksheet.iter_rows(values_only=True)
+            columns = unique_column_names(next(rows, ()))
+            width = len(columns)
+            buffer: list[tuple[Any, ...]] = []
+            pending_empty: list[tuple[Any, ...]] = []
+            offset = 0
+            yielded = False
+            for row in rows:
+                row = tuple(row[:width]) + (None,) * (width - len(row))
+                if all(value is None for value in row):
+                    pending_empty.append(row)
+                    continue
+                buffer.extend(pending_empty)
+                pending_empty.clear()
+                buffer.append(row)
+                if len(buffer) >= chunk_rows:
+                    yield pd.DataFrame(buffer, columns=columns, index=range(offset, offset + len(buffer)))
+                    offset += len(buffer)
+                    buffer = []
+                    yielded = True
+            if buffer or not yielded:
+                yield pd.DataFrame(buffer, columns=columns, index=range(offset, offset + len(buffer)))
+        finally:
+            workbook.close()
+
+    return worksheet.title, chunks()
+
+
+def read_legacy_excel_chunks(
+    input_path: Path,
+    sheet_name: str | int | None = None,
+    chunk_rows: int = INPUT_CHUNK_ROWS,
+) -> tuple[str, Iterator[pd.DataFrame]]:
+    import pandas as pd
+
+    sheet = 0 if sheet_name is None else sheet_name
+    return str(sheet), iter([pd.read_excel(input_path, sheet_name=sheet)])
+
+
+def read_csv_chunks(
+    input_path: Path,
+    sheet_name: str | int | None = None,
+    chunk_rows: int = INPUT_CHUNK_ROWS,
+) -> tuple[str, Iterator[pd.DataFrame]]:
+    import pandas as pd
+
+    if sheet_name is not None:
+        raise ValueError("CSV 输入不支持 --sheet 参数。")
+    return "不适用", iter(pd.read_csv(input_path, chunksize=chunk_rows, encoding="utf-8-sig"))
+
+
+def read_parquet_chunks(
+    input_path: Path,
+    sheet_name: str | int | None = None,
+    chunk_rows: int = INPUT_CHUNK_ROWS,
+) -> tuple[str, Iterator[pd.DataFrame]]:
+    import pandas as pd
+
+    if sheet_name is not None:
+        raise ValueError("Parquet 输入不支持 --sheet 参数。")
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise ImportError("读取 Parquet 输入需要安装 pyarrow。") from exc
+
+    parquet_file = pq.ParquetFile(input_path)
+    columns = [
+        name
+        for name in parquet_file.schema_arrow.names
+        if not (name.startswith("__index_level_") and name.endswith("__"))
+    ]
+
+    def chunks() -> Iterator[pd.DataFrame]:
+        offset = 0
+        yielded = False
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+            frame = batch.to_pandas()
+            frame.index = range(offset, offset + len(frame))
+            offset += len(frame)
+            yielded = True
+            yield frame
+        if not yielded:
+            yield pd.DataFrame(columns=columns)
+
+    return "不适用", chunks()
+
+
+INPUT_READERS: dict[str, Callable[..., tuple[str, Iterator[pd.DataFrame]]]] = {
+    ".xlsx": read_excel_chunks,
+    ".xlsm": read_excel_chunks,
+    ".xls": read_legacy_excel_chunks,
+    ".csv": read_csv_chunks,
+    ".parquet": read_parquet_chunks,
+}
+
+
+def filter_prepared_cohort(prepared: dict[str, Any], min_frequency: float) -> dict[str, Any]:
+    filtered, _ = filter_normalized_features(prepared["normalized"], min_frequency=min_frequency)
+    if filtered["matrix"].shape[1] == 0:
+        raise ValueError("低频剔除后没有剩余证候列，无法继续聚类。")
+    feature_filter = prepared["feature_filter"].copy()
+    feature_filter["keep"] = [
+        bool(value) for value in (feature_filter["global_frequency"] >= min_frequency).tolist()
+    ]
+    feature_filter["keep"] = feature_filter["keep"].astype(object)
+    return {
+        **prepared,
+        "normalized": filtered,
+        "feature_frame": normalized_to_frame(filtered),
+        "feature_filter": feature_filter,
+    }
+
+
+def load_prepared_cohort(
+    input_path: Path | str,
+    excluded_columns: Iterable[str] = ("姓名", "年龄"),
+    min_frequency: float = 0.05,
+    sheet_name: str | int | None = None,
+    chunk_rows: int = INPUT_CHUNK_ROWS,
+    read_profile: dict[str, Any] | None = None,
+    normalize_profile: dict[str, Any] | None = None,
+    filter_profile: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    input_path = Path(input_path)
+    reader = INPUT_READERS.get(input_path.suffix.lower())
+    if reader is None:
+        raise ValueError(
+            f"不支持的输入文件类型: {input_path.suffix}，可选: {sorted(INPUT_READERS)}"
+        )
+    with accumulate_profile(read_profile):
+        resolved_sheet_name, chunks = reader(input_path, sheet_name=sheet_name, chunk_rows=chunk_rows)
+    if read_profile is not None:
+        chunks = profile_chunks(chunks, read_profile)
+    prepared = prepare_feature_chunks(
+        chunks,
+        excluded_columns=excluded_columns,
+        min_frequency=min_frequency,
+        normalize_profile=normalize_profile,
+        filter_profile=filter_profile,
+    )
+    prepared["sheet_name"] = resolved_sheet_name
+    return prepared
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cohort_cache_entry(
+    cache_dir: Path,
+    input_path: Path,
+    excluded_columns: list[str],
+    min_frequency: float,
+    sheet_name: str | int | None,
+) -> Path:
+    settings = json.dumps(
+        {
+            "input": str(input_path.resolve()),
+            "excluded_columns": excluded_columns,
+            "min_frequency": float(min_frequency),
+            "sheet_name": sheet_name,
+            "version": COHORT_CACHE_VERSION,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return cache_dir / hashlib.sha256(settings.encode()).hexdigest()
+
+
+def encode_identifier_column(series: pd.Series) -> dict[str, np.ndarray]:
+    import pandas as pd
+
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        return {"values": series.to_numpy()}
+    missing = series.isna().to_numpy()
+    return {"values": series.astype(str).to_numpy(dtype=str), "missing": missing}
+
+
+def decode_identifier_column(values: np.ndarray, missing: np.ndarray | None) -> np.ndarray:
+    if missing is None:
+        return values
+    decoded = values.astype(object)
+    decoded[missing] = None
+    return decoded
+
+
+def save_cohort_cache(entry: Path, prepared: dict[str, Any], fingerprint: dict[str, Any]) -> None:
+    normalized = prepared["normalized"]
+    feature_filter = prepared["feature_filter"]
+    identifiers = prepared["identifiers"]
+    arrays: dict[str, np.ndarray] = {
+        "packed_matrix": np.packbits(normalized["matrix"], axis=1),
+        "row_index": identifiers.index.to_numpy(),
+        "feature_columns": np.asarray(normalized["columns"], dtype=str),
+        "candidate_columns": np.asarray(feature_filter.index, dtype=str),
+        "candidate_frequency": feature_filter["global_frequency"].to_numpy(dtype=np.float64),
+        "candidate_keep": feature_filter["keep"].astype(bool).to_numpy(),
+    }
+    for position, column in enumerate(identifiers.columns):
+        for name, values in encode_identifier_column(identifiers[column]).items():
+            arrays[f"identifier_{position}_{name}"] = values
+    manifest = {
+        **fingerprint,
+        "version": COHORT_CACHE_VERSION,
+        "shape": list(normalized["matrix"].shape),
+        "identifier_columns": [str(column) for column in identifiers.columns],
+        "excluded_columns": prepared["excluded_columns"],
+        "sheet_name": prepared.get("sheet_name"),
+        "raw_row_count": prepared["raw_row_count"],
+        "missing_fill_count": prepared["missing_fill_count"],
+        "dropped_summary_row_count": prepared["dropped_summary_row_count"],
+        "positive_value_coercions": prepared["positive_value_coercions"],
+    }
+
+    staging = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    np.savez(staging / "cohort.npz", **arrays)
+    (staging / "manifest.json").write_text(
+        json.dumps(manifest, ensure_ascii=False, indent=2),
+        encoding="utf-8",
+    )
+    shutil.rmtree(entry, ignore_errors=True)
+    os.replace(staging, entry)
+
+
+def load_cohort_cache(entry: Path) -> dict[str, Any]:
+    import pandas as pd
+
+    manifest = json.loads((entry / "manifest.json").read_text(encoding="utf-8"))
+    with np.load(entry / "cohort.npz", allow_pickle=False) as arrays:
+        sample_count, feature_count = manifest["shape"]
+        matrix = np.unpackbits(arrays["packed_matrix"], axis=1, count=feature_count)
+        row_index = pd.Index(arrays["row_index"])
+        identifier_values = {}
+        for position, column in enumerate(manifest["identifier_columns"]):
+            missing_key = f"identifier_{position}_missing"
+            identifier_values[column] = decode_identifier_column(
+                arrays[f"identifier_{position}_values"],
+                arrays[missing_key] if missing_key in arrays.files else None,
+            )
+        identifiers = pd.DataFrame(identifier_values, index=row_index, columns=manifest["identifier_columns"])
+        feature_filter = pd.DataFrame(
+            {
+                "global_frequency": arrays["candidate_frequency"],
+                "keep": [bool(value) for value in arrays["candidate_keep"].tolist()],
+            },
+            index=pd.Index(arrays["candidate_columns"].tolist()),
+        )
+        feature_filter["keep"] = feature_filter["keep"].astype(object)
+        columns = pd.Index(arrays["feature_columns"].tolist())
+
+    normalized = build_normalized_features(
+        matrix,
+        row_index,
+        columns,
+        missing_fill_count=manifest["missing_fill_count"],
+        positive_value_coercions=manifest["positive_value_coercions"],
+    )
+    return {
+        "identifiers": identifiers,
+        "normalized": normalized,
+        "feature_frame": normalized_to_frame(normalized),
+        "feature_filter": feature_filter,
+        "missing_fill_count": manifest["missing_fill_count"],
+        "dropped_summary_row_count": manifest["dropped_summary_row_count"],
+        "positive_value_coercions": manifest["positive_value_coercions"],
+        "excluded_columns": manifest["excluded_columns"],
+        "raw_row_count": manifest["raw_row_count"],
+        "sheet_name": manifest["sheet_name"],
+    }
+
+
+def cached_prepared_cohort(
+    input_path: Path | str,
+    cache_dir: Path | str | None,
+    excluded_columns: Iterable[str] = ("姓名", "年龄"),
+    min_frequency: float = 0.05,
+    sheet_name: str | int | None = None,
+    read_profile: dict[str, Any] | None = None,
+    normalize_profile: dict[str, Any] | None = None,
+    filter_profile: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    input_path = Path(input_path)
+    excluded_columns = list(excluded_columns)
+    if cache_dir is None:
+        prepared = load_prepared_cohort(
+            input_path,
+            excluded_columns,
+            min_frequency,
+            sheet_name,
+            read_profile=read_profile,
+            normalize_profile=normalize_profile,
+            filter_profile=filter_profile,
+        )
+        prepared["cohort_cache"] = "disabled"
+        return prepared
+
+    entry = cohort_cache_entry(Path(cache_dir), input_path, excluded_columns, min_frequency, sheet_name)
+    stat = input_path.stat()
+    fingerprint = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    manifest_path = entry / "manifest.json"
+    if manifest_path.exists():
+        try:
+            manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+            reusable = manifest.get("version") == COHORT_CACHE_VERSION and manifest["size"] == stat.st_size
+            if reusable and manifest["mtime_ns"] != stat.st_mtime_ns:
+                fingerprint["sha256"] = file_sha256(input_path)
+                reusable = manifest["sha256"] == fingerprint["sha256"]
+                if reusable:
+                    manifest.update(fingerprint)
+                    staging = manifest_path.with_name(f"manifest.json.{os.getpid()}.tmp")
+                    staging.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+                    os.replace(staging, manifest_path)
+            if reusable:
+                prepared = load_cohort_cache(entry)
+                prepared["cohort_cache"] = "hit"
+                return prepared
+        except (OSError, KeyError, ValueError):
+            pass
+
+    prepared = load_prepared_cohort(
+        input_path,
+        excluded_columns,
+        min_frequency,
+        sheet_name,
+        read_profile=read_profile,
+        normalize_profile=normalize_profile,
+        filter_profile=filter_profile,
+    )
+    fingerprint.setdefault("sha256", file_sha256(input_path))
+    save_cohort_cache(entry, prepared, fingerprint)
+    prepared["cohort_cache"] = "miss"
+    return prepared
+
+
+def evaluate_candidate_ks(
+    features: pd.DataFrame | dict[str, Any],
+    linkage_matrix,
+    candidate_ks: Iterable[int],
+    packed: np.ndarray | None = None,
+    silhouette_sample: int | None = None,
+    silhouette_seed: int = SILHOUETTE_SAMPLE_SEED,
+    candidate_labels: tuple[list[int], np.ndarray] | None = None,
+    condensed: np.ndarray | None = None,
+    jobs: int = 1,
+    weights: np.ndarray | None = None,
+    metric: str = "euclidean",
+    rows_are_leaves: bool = True,
+) -> pd.DataFrame:
+    import pandas as pd
 
-    stats = pd.DataFrame(
+    matrix = as_normalized_features(features)["matrix"]
+    if packed is None:
+        packed = pack_binary_matrix(matrix)
+    sample_count = len(matrix) if weights is None else int(weights.sum())
+    if candidate_labels is None:
+        candidate_labels = candidate_cluster_labels(linkage_matrix, candidate_ks)
+    valid_ks, label_matrix = candidate_labels
+    if not valid_ks:
+        raise ValueError("候选 K 未生成有效聚类结果，请检查样本量或 K 范围。")
+    sample_rows = sample_silhouette_rows(sample_count, silhouette_sample, silhouette_seed)
+    scores, errors = silhouette_scores(
+        packed,
+        label_matrix,
+        sample_rows=sample_rows,
+        condensed=condensed,
+        jobs=jobs,
+        weights=weights,
+        metric=metric,
+    )
+    if rows_are_leaves and len(linkage_matrix) + 1 == len(matrix):
+        ch_scores = nested_calinski_harabasz_scores(matrix, linkage_matrix, valid_ks, weights=weights)
+    else:
+        ch_scores = np.array([binary_calinski_harabasz_score(matrix, labels) for labels in label_matrix])
+    return pd.DataFrame(
         {
-            "global_frequency": global_frequency,
-            "keep": [bool(value) for value in keep_mask.tolist()],
-        },
-        index=normalized.columns,
+            "k": valid_ks,
+            "silhouette_score": scores,
+            "silhouette_sampling_error": errors,
+            "calinski_harabasz_score": ch_scores,
+        }
     )
-    stats["keep"] = stats["keep"].astype(object)
-    filtered = normalized.loc[:, keep_mask]
-    return filtered, stats
 
 
-def select_best_k(metrics: pd.DataFrame) -> pd.Series:
-    required = {"k", "silhouette_score", "calinski_harabasz_score"}
-    missing = required - set(metrics.columns)
-    if missing:
-        raise ValueError(f"缺少指标列: {sorted(missing)}")
-    ranked = metrics.sort_values(
-        by=["silhouette_score", "calinski_harabasz_score", "k"],
-        ascending=[False, False, True],
-    )
-    return ranked.iloc[0]
+def linkage_cache_key(
+    packed: np.ndarray,
+    method: str,
+    metric: str,
+    weights: np.ndarray | None = None,
+) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"{method}|{metric}|{packed.shape[0]}x{packed.shape[1]}|".encode())
+    digest.update(np.ascontiguousarray(packed).tobytes())
+    if weights is not None:
+        digest.update(b"|weights|")
+        digest.update(np.ascontiguousarray(weights, dtype=np.int64).tobytes())
+    return digest.hexdigest()
 
 
-def build_cluster_profiles(
-    features: pd.DataFrame,
-    labels: pd.Series,
-) -> pd.DataFrame:
-    normalized = features.apply(normalize_binary_series)
-    label_series = pd.Series(labels, index=normalized.index, name="cluster")
-    global_frequency = normalized.mean(axis=0)
-    rows: list[dict[str, float | int | str]] = []
-
-    for cluster in sorted(label_series.unique()):
-        cluster_mask = label_series == cluster
-        cluster_frame = normalized.loc[cluster_mask]
-        cluster_size = int(cluster_mask.sum())
-        cluster_count = cluster_frame.sum(axis=0)
-        cluster_frequency = cluster_frame.mean(axis=0)
-
-        for feature in normalized.columns:
-            overall = float(global_frequency[feature])
-            inside = float(cluster_frequency[feature]) if cluster_size else 0.0
-            lift = inside / overall if overall else 0.0
-            rows.append(
-                {
-                    "cluster": int(cluster),
-                    "cluster_size": cluster_size,
-                    "feature": feature,
-                    "count": int(cluster_count[feature]),
-                    "cluster_frequency": inside,
-                    "global_frequency": overall,
-                    "lift": lift,
-                }
-            )
+def load_cached_linkage(cache_dir: Path, key: str) -> np.ndarray | None:
+    cache_path = cache_dir / f"{key}.npy"
+    if not cache_path.exists():
+        return None
+    try:
+        linkage_matrix = np.load(cache_path, allow_pickle=False)
+    except (OSError, ValueError):
+        cache_path.unlink(missing_ok=True)
+        return None
+    os.utime(cache_path)
+    return linkage_matrix
 
-    return pd.DataFrame(rows)
 
+def evict_linkage_cache(cache_dir: Path, max_bytes: int) -> list[Path]:
+    entries = sorted(cache_dir.glob("*.npy"), key=lambda path: path.stat().st_mtime, reverse=True)
+    evicted: list[Path] = []
+    used_bytes = 0
+    for entry in entries:
+        used_bytes += entry.stat().st_size
+        if used_bytes > max_bytes:
+            entry.unlink(missing_ok=True)
+            evicted.append(entry)
+    return evicted
 
-def sort_cluster_profiles(profiles: pd.DataFrame) -> pd.DataFrame:
-    return profiles.sort_values(
-        by=["cluster", "cluster_frequency", "lift", "count", "feature"],
-        ascending=[True, False, False, False, True],
-    ).reset_index(drop=True)
 
+def store_cached_linkage(
+    cache_dir: Path,
+    key: str,
+    linkage_matrix: np.ndarray,
+    max_bytes: int = LINKAGE_CACHE_MAX_BYTES,
+) -> Path:
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cache_path = cache_dir / f"{key}.npy"
+    temporary_path = cache_dir / f"{key}.{os.getpid()}.tmp"
+    with temporary_path.open("wb") as handle:
+        np.save(handle, np.asarray(linkage_matrix, dtype=np.float64), allow_pickle=False)
+    os.replace(temporary_path, cache_path)
+    evict_linkage_cache(cache_dir, max_bytes)
+    return cache_path
 
-def prepare_feature_matrix(
-    data: pd.DataFrame,
-    excluded_columns: Iterable[str] = ("姓名", "年龄"),
-    min_frequency: float = 0.05,
-) -> dict[str, Any]:
-    excluded_columns = list(excluded_columns)
-    identifier_columns = [col for col in excluded_columns if col in data.columns]
-    if identifier_columns:
-        summary_row_mask = data[identifier_columns].isna().all(axis=1)
-        cleaned_data = data.loc[~summary_row_mask].copy()
+
+def cached_linkage(
+    packed: np.ndarray,
+    cache_dir: Path | None,
+    max_bytes: int = LINKAGE_CACHE_MAX_BYTES,
+    memmap_path: Path | None = None,
+    weights: np.ndarray | None = None,
+    method: str = "ward",
+    metric: str = "euclidean",
+) -> tuple[np.ndarray, str, np.ndarray | None]:
+    from scipy.cluster.hierarchy import linkage
+
+    key = None
+    if cache_dir is not None:
+        key = linkage_cache_key(packed, method=method, metric=metric, weights=weights)
+        linkage_matrix = load_cached_linkage(cache_dir, key)
+        if linkage_matrix is not None:
+            return linkage_matrix, "hit", None
+    if weights is None and memmap_path is not None:
+        condensed = condensed_distances(packed, metric=metric, memmap_path=memmap_path)
+        linkage_matrix = weighted_linkage(condensed, np.ones(len(packed)), method, overwrite=True)
+        del condensed
+        condensed = None
+    elif weights is None:
+        condensed = condensed_distances(packed, metric=metric)
+        linkage_matrix = linkage(condensed, method=method)
+    elif method == "ward":
+        condensed = None
+        distances = weighted_ward_distances(condensed_distances(packed, metric="hamming"), weights)
+        linkage_matrix = weighted_linkage(distances, weights, method)
+    else:
+        condensed = None
+        linkage_matrix = weighted_linkage(condensed_distances(packed, metric=metric), weights, method)
+    if key is None:
+        return linkage_matrix, "disabled", condensed
+    store_cached_linkage(cache_dir, key, linkage_matrix, max_bytes=max_bytes)
+    return linkage_matrix, "miss", condensed
+
+
+def row_fingerprints(identifiers: pd.DataFrame, packed: np.ndarray) -> np.ndarray:
+    identifier_rows = identifiers.astype(object).where(identifiers.notna(), "").astype(str).to_numpy()
+    fingerprints = np.empty(len(packed), dtype="S16")
+    for row in range(len(packed)):
+        digest = hashlib.blake2b(np.ascontiguousarray(packed[row]).tobytes(), digest_size=16)
+        digest.update("\x1f".join(identifier_rows[row]).encode())
+        fingerprints[row] = digest.digest()
+    return fingerprints
+
+
+def match_fingerprints(
+    previous: np.ndarray,
+    current: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    previous_rows: dict[bytes, list[int]] = {}
+    for row, fingerprint in enumerate(previous.tolist()):
+        previous_rows.setdefault(fingerprint, []).append(row)
+    for rows in previous_rows.values():
+        rows.reverse()
+    matched_current: list[int] = []
+    matched_previous: list[int] = []
+    new_rows: list[int] = []
+    for row, fingerprint in enumerate(current.tolist()):
+        candidates = previous_rows.get(fingerprint)
+        if candidates:
+            matched_current.append(row)
+            matched_previous.append(candidates.pop())
+        else:
+            new_rows.append(row)
+    matched_current_rows = np.asarray(matched_current, dtype=np.intp)
+    matched_previous_rows = np.asarray(matched_previous, dtype=np.intp)
+    order = np.argsort(matched_previous_rows, kind="stable")
+    return matched_current_rows[order], matched_previous_rows[order], np.asarray(new_rows, dtype=np.intp)
+
+
+def augment_condensed(
+    condensed: np.ndarray,
+    previous_count: int,
+    kept_rows: np.ndarray,
+    packed: np.ndarray,
+    metric: str = "euclidean",
+) -> np.ndarray:
+    kept_count = len(kept_rows)
+    sample_count = len(packed)
+    if kept_count == previous_count and np.array_equal(kept_rows, np.arange(previous_count)):
+        reused = condensed
     else:
-        summary_row_mask = pd.Series(False, index=data.index)
-        cleaned_data = data.copy()
+        reused = condensed_subset(condensed, previous_count, kept_rows)
+    augmented = np.empty(sample_count * (sample_count - 1) // 2, dtype=np.float64)
+    new_packed = packed[kept_count:]
+    offset = 0
+    reused_offset = 0
+    start = 0
+    while start < kept_count:
+        stop = min(start + distance_block_rows(len(new_packed), 4), kept_count)
+        block = binary_distance_block(packed[start:stop], new_packed, metric)
+        for local_row in range(stop - start):
+            reused_length = kept_count - (start + local_row) - 1
+            augmented[offset : offset + reused_length] = reused[reused_offset : reused_offset + reused_length]
+            offset += reused_length
+            reused_offset += reused_length
+            augmented[offset : offset + len(new_packed)] = block[local_row]
+            offset += len(new_packed)
+        start = stop
+    start = 0
+    while start < len(new_packed):
+        stop = min(start + distance_block_rows(len(new_packed) - start, 4), len(new_packed))
+        block = binary_distance_block(new_packed[start:stop], new_packed[start:], metric)
+        for local_row in range(stop - start):
+            segment = block[local_row, local_row + 1 :]
+            augmented[offset : offset + len(segment)] = segment
+            offset += len(segment)
+        start = stop
+    return augmented
+
+
+def cluster_centroids(matrix: np.ndarray, labels: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    cluster_ids, codes = np.unique(labels, return_inverse=True)
+    counts = cluster_feature_counts(matrix, codes, len(cluster_ids)).astype(np.float64)
+    sizes = np.bincount(codes, minlength=len(cluster_ids)).astype(np.float64)
+    return cluster_ids, counts / sizes[:, None]
 
-    feature_columns = [col for col in data.columns if col not in excluded_columns]
-    if not feature_columns:
-        raise ValueError("没有可用于聚类的证候列。")
 
-    feature_frame = cleaned_data.loc[:, feature_columns]
-    missing_fill_count = int(feature_frame.isna().sum().sum())
-    positive_value_coercions = int(
-        pd.to_numeric(feature_frame.stack(), errors="coerce").fillna(0).gt(1).sum()
+def nearest_centroid_labels(matrix: np.ndarray, cluster_ids: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    if len(matrix) == 0:
+        return np.empty(0, dtype=cluster_ids.dtype)
+    rows = np.asarray(matrix, dtype=np.float64)
+    distances = (
+        (rows**2).sum(axis=1)[:, None]
+        - 2.0 * rows @ centroids.T
+        + (centroids**2).sum(axis=1)[None, :]
     )
-    filtered_features, filter_stats = filter_low_frequency_features(
-        feature_frame,
-        min_frequency=min_frequency,
+    return cluster_ids[np.argmin(distances, axis=1)]
+
+
+def incremental_state_entry(
+    cache_dir: Path,
+    input_path: Path,
+    excluded_columns: list[str],
+    min_frequency: float,
+    sheet_name: str | int | None,
+    method: str,
+    metric: str,
+) -> Path:
+    settings = json.dumps(
+        {
+            "input": str(input_path.resolve()),
+            "excluded_columns": excluded_columns,
+            "min_frequency": float(min_frequency),
+            "sheet_name": sheet_name,
+            "method": method,
+            "metric": metric,
+            "version": INCREMENTAL_STATE_VERSION,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
     )
-    if filtered_features.shape[1] == 0:
-        raise ValueError("低频剔除后没有剩余证候列，无法继续聚类。")
+    return cache_dir / hashlib.sha256(settings.encode()).hexdigest()
 
-    return {
-        "cleaned_data": cleaned_data,
-        "feature_frame": filtered_features,
-        "feature_filter": filter_stats,
-        "missing_fill_count": missing_fill_count,
-        "dropped_summary_row_count": int(summary_row_mask.sum()),
-        "positive_value_coercions": positive_value_coercions,
-        "excluded_columns": excluded_columns,
-    }
 
+def load_incremental_state(entry: Path) -> dict[str, Any] | None:
+    try:
+        manifest = json.loads((entry / "manifest.json").read_text(encoding="utf-8"))
+        if manifest.get("version") != INCREMENTAL_STATE_VERSION:
+            return None
+        with np.load(entry / "state.npz", allow_pickle=False) as arrays:
+            state = {name: arrays[name] for name in arrays.files}
+        state["condensed"] = np.load(entry / "condensed.npy", mmap_mode="r", allow_pickle=False)
+    except (OSError, KeyError, ValueError):
+        return None
+    return {**manifest, **state}
 
-def evaluate_candidate_ks(
-    features: pd.DataFrame,
-    linkage_matrix,
-    candidate_ks: Iterable[int],
-) -> pd.DataFrame:
-    metrics_rows: list[dict[str, float | int]] = []
-    sample_count = len(features)
-    for k in candidate_ks:
-        if k < 2 or k >= sample_count:
-            continue
-        labels = pd.Series(fcluster(linkage_matrix, t=k, criterion="maxclust"), index=features.index)
-        label_count = labels.nunique()
-        if label_count < 2 or label_count >= sample_count:
-            continue
-        metrics_rows.append(
-            {
-                "k": int(k),
-                "silhouette_score": float(silhouette_score(features, labels, metric="euclidean")),
-                "calinski_harabasz_score": float(calinski_harabasz_score(features, labels)),
-            }
-        )
 
-    if not metrics_rows:
-        raise ValueError("候选 K 未生成有效聚类结果，请检查样本量或 K 范围。")
-    return pd.DataFrame(metrics_rows)
+def save_incremental_state(entry: Path, state: dict[str, Any]) -> None:
+    staging = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    np.savez(
+        staging / "state.npz",
+        fingerprints=state["fingerprints"],
+        labels=state["labels"],
+        cluster_ids=state["cluster_ids"],
+        centroids=state["centroids"],
+        linkage=state["linkage"],
+    )
+    with (staging / "condensed.npy").open("wb") as handle:
+        np.save(handle, np.asarray(state["condensed"], dtype=np.float64), allow_pickle=False)
+    (staging / "manifest.json").write_text(
+        json.dumps(
+            {
+                "version": INCREMENTAL_STATE_VERSION,
+                "columns": state["columns"],
+                "best_k": state["best_k"],
+                "k_metrics": state["k_metrics"],
+            },
+            ensure_ascii=False,
+        ),
+        encoding="utf-8",
+    )
+    shutil.rmtree(entry, ignore_errors=True)
+    os.replace(staging, entry)
 
 
 def create_output_directory(base_output_dir: Path | str | None = None) -> Path:
-    root = Path(base_output_dir or "outputs/tcm_clustering")
+    root = Path(base_output_dir or DEFAULT_OUTPUT_ROOT)
     timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
     output_dir = root / timestamp
-    output_dir.mkdir(parents=True, exist_ok=False)
-    return output_dir
+    suffix = 1
+    while True:
+        try:
+            output_dir.mkdir(parents=True, exist_ok=False)
+            return output_dir
+        except FileExistsError:
+            output_dir = root / f"{timestamp}-{suffix}"
+            suffix += 1
 
 
 def run_analysis(
@@ -200,33 +2045,318 @@ def run_analysis(
     excluded_columns: Iterable[str] = ("姓名", "年龄"),
     min_frequency: float = 0.05,
     candidate_ks: Iterable[int] = range(4, 8),
+    silhouette_sample: int | None = None,
+    use_linkage_cache: bool = True,
+    linkage_cache_max_bytes: int = LINKAGE_CACHE_MAX_BYTES,
+    out_of_core: bool = False,
+    scratch_dir: Path | str | None = None,
+    sheet_name: str | int | None = None,
+    cohort_cache_dir: Path | str | None = None,
+    jobs: int = 1,
+    stability_resamples: int = 0,
+    stability_tolerance: float = STABILITY_CI_TOLERANCE,
+    engine: str = "exact",
+    micro_clusters: int = MICRO_CLUSTER_COUNT,
+    collapse_duplicates: bool = True,
+    metric: str = "euclidean",
+    method: str = "ward",
+    incremental: bool = False,
+    assign_only: bool = False,
+    prepared_cohort: dict[str, Any] | None = None,
+    linkage_cache_dir: Path | str | None = None,
 ) -> dict[str, Any]:
+    import pandas as pd
+    from scipy.cluster.hierarchy import linkage
+
+    if engine not in CLUSTERING_ENGINES:
+        raise ValueError(f"未知聚类引擎: {engine}，可选值为 {', '.join(CLUSTERING_ENGINES)}")
+    if metric not in DISTANCE_METRICS:
+        raise ValueError(f"未知距离度量: {metric}，可选值为 {', '.join(DISTANCE_METRICS)}")
+    if method not in LINKAGE_METHODS:
+        raise ValueError(f"未知连接方法: {method}，可选值为 {', '.join(LINKAGE_METHODS)}")
+    if method == "ward" and metric != "euclidean":
+        raise ValueError("ward 连接方法只能与 euclidean 距离搭配使用。")
+    if engine == "approximate" and (out_of_core or stability_resamples):
+        raise ValueError("近似聚类引擎不构建完整距离矩阵，不能与 --out-of-core 或稳定性分析同时使用。")
+    if engine == "approximate" and method != "ward":
+        raise ValueError("近似聚类引擎基于微簇质心，只支持 ward 连接与 euclidean 距离。")
+    incremental = incremental or assign_only
+    if incremental and (engine != "exact" or out_of_core):
+        raise ValueError("增量聚类需要缓存患者级距离矩阵，只支持 exact 引擎且不能与 --out-of-core 同时使用。")
+    if assign_only and stability_resamples:
+        raise ValueError("--assign-only 不重建层次聚类，不能与稳定性分析同时使用。")
     input_path = Path(input_path)
-    data = pd.read_excel(input_path)
-    prepared = prepare_feature_matrix(
-        data,
-        excluded_columns=excluded_columns,
-        min_frequency=min_frequency,
-    )
-    cleaned_data = prepared["cleaned_data"]
+    stage_profiles: list[dict[str, Any]] = []
+    read_profile = stage_profile("read_excel")
+    normalize_profile = stage_profile("normalize")
+    filter_profile = stage_profile("filter")
+    with profile_stage(stage_profiles, "prepare_feature_matrix") as prepare_profile:
+        if prepared_cohort is not None:
+            with accumulate_profile(filter_profile):
+                prepared = filter_prepared_cohort(prepared_cohort, min_frequency)
+        else:
+            prepared = cached_prepared_cohort(
+                input_path,
+                cohort_cache_dir,
+                excluded_columns=excluded_columns,
+                min_frequency=min_frequency,
+                sheet_name=sheet_name,
+                read_profile=read_profile,
+                normalize_profile=normalize_profile,
+                filter_profile=filter_profile,
+            )
+    nested_profiles = [read_profile, normalize_profile, filter_profile]
+    for field in ("wall_seconds", "cpu_seconds"):
+        prepare_profile[field] = round(
+            prepare_profile[field] - sum(profile[field] for profile in nested_profiles),
+            4,
+        )
+    stage_profiles[:0] = nested_profiles
+    identifiers = prepared["identifiers"]
     features = prepared["feature_frame"]
-    linkage_matrix = linkage(features, method="ward", metric="euclidean")
-    k_metrics = evaluate_candidate_ks(features, linkage_matrix, candidate_ks)
+    packed = pack_binary_matrix(prepared["normalized"]["matrix"])
+    collapsed = None
+    if engine == "exact" and collapse_duplicates and not out_of_core and not incremental:
+        collapsed = collapse_if_worthwhile(prepared["normalized"]["matrix"], packed)
+    incremental_mode = "disabled"
+    incremental_counts = {"reused": 0, "new": 0}
+    unchanged = False
+    if incremental:
+        fingerprints = row_fingerprints(identifiers, packed)
+        incremental_entry = incremental_state_entry(
+            Path(output_dir or DEFAULT_OUTPUT_ROOT) / INCREMENTAL_CACHE_DIRNAME,
+            input_path,
+            list(prepared["excluded_columns"]),
+            min_frequency,
+            sheet_name,
+            method,
+            metric,
+        )
+        incremental_state = load_incremental_state(incremental_entry)
+        if incremental_state is None:
+            incremental_mode = "full"
+        elif incremental_state["columns"] != [str(column) for column in features.columns]:
+            incremental_mode = "rebuild"
+        else:
+            incremental_mode = "assign_only" if assign_only else "update"
+    if not use_linkage_cache:
+        linkage_cache_dir = None
+    elif linkage_cache_dir is None:
+        linkage_cache_dir = Path(output_dir or DEFAULT_OUTPUT_ROOT) / LINKAGE_CACHE_DIRNAME
+    memmap_path = None
+    if out_of_core:
+        resolved_scratch_dir = Path(scratch_dir or output_dir or DEFAULT_OUTPUT_ROOT)
+        resolved_scratch_dir.mkdir(parents=True, exist_ok=True)
+        handle, memmap_name = tempfile.mkstemp(
+            prefix="condensed-",
+            suffix=".dat",
+            dir=resolved_scratch_dir,
+        )
+        os.close(handle)
+        memmap_path = Path(memmap_name)
+    try:
+        with profile_stage(stage_profiles, "linkage") as linkage_profile:
+            if incremental_mode == "assign_only":
+                kept_rows, previous_rows, new_rows = match_fingerprints(
+                    incremental_state["fingerprints"],
+                    fingerprints,
+                )
+                labels = np.empty(len(packed), dtype=np.int32)
+                labels[kept_rows] = incremental_state["labels"][previous_rows]
+                labels[new_rows] = nearest_centroid_labels(
+                    prepared["normalized"]["matrix"][new_rows],
+                    incremental_state["cluster_ids"],
+                    incremental_state["centroids"],
+                )
+                incremental_counts = {"reused": len(kept_rows), "new": len(new_rows)}
+                linkage_matrix = incremental_state["linkage"]
+                linkage_cache_status = "incremental"
+                condensed = None
+                candidate_labels = ([int(incremental_state["best_k"])], labels[None, :])
+                evaluation = None
+            elif incremental:
+                if incremental_mode == "update":
+                    kept_rows, previous_rows, new_rows = match_fingerprints(
+                        incremental_state["fingerprints"],
+                        fingerprints,
+                    )
+                else:
+                    kept_rows = previous_rows = np.empty(0, dtype=np.intp)
+                    new_rows = np.arange(len(packed), dtype=np.intp)
+                order = np.concatenate([kept_rows, new_rows])
+                appended = np.array_equal(order, np.arange(len(packed)))
+                incremental_counts = {"reused": len(kept_rows), "new": len(new_rows)}
+                unchanged = (
+                    incremental_mode == "update"
+                    and appended
+                    and not len(new_rows)
+                    and np.array_equal(previous_rows, np.arange(len(incremental_state["fingerprints"])))
+                )
+                if unchanged:
+                    condensed = incremental_state["condensed"]
+                    linkage_matrix = incremental_state["linkage"]
+                else:
+                    if len(kept_rows) > 1:
+                        condensed = augment_condensed(
+                            incremental_state["condensed"],
+                            len(incremental_state["fingerprints"]),
+                            previous_rows,
+                            packed[order],
+                            metric=metric,
+                        )
+                        if not appended:
+                            condensed = condensed_subset(condensed, len(packed), np.argsort(order))
+                    else:
+                        condensed = condensed_distances(packed, metric=metric)
+                    linkage_matrix = linkage(condensed, method=method)
+                linkage_cache_status = "incremental"
+                candidate_labels = candidate_cluster_labels(linkage_matrix, candidate_ks)
+                evaluation = {"features": prepared["normalized"], "packed": packed}
+            elif engine == "approximate":
+                compressed = compress_patients(
+                    prepared["normalized"]["matrix"],
+                    max_micro_clusters=micro_clusters,
+                )
+                linkage_matrix = weighted_ward_linkage(compressed["centroids"], compressed["weights"])
+                linkage_cache_status = "disabled"
+                condensed = None
+                valid_ks, micro_labels = candidate_cluster_labels(
+                    linkage_matrix,
+                    candidate_ks,
+                    sample_count=len(packed),
+                )
+                candidate_labels = (valid_ks, micro_labels[:, compressed["assignments"]])
+                evaluation = {"features": prepared["normalized"], "packed": packed, "rows_are_leaves": False}
+            elif collapsed is not None:
+                linkage_matrix, linkage_cache_status, condensed = cached_linkage(
+                    collapsed["packed"],
+                    linkage_cache_dir,
+                    max_bytes=linkage_cache_max_bytes,
+                    weights=collapsed["weights"],
+                    method=method,
+                    metric=metric,
+                )
+                valid_ks, vector_labels = candidate_cluster_labels(
+                    linkage_matrix,
+                    candidate_ks,
+                    sample_count=len(packed),
+                )
+                candidate_labels = (valid_ks, vector_labels[:, collapsed["assignments"]])
+                evaluation = {
+                    "features": {"matrix": collapsed["matrix"]},
+                    "packed": collapsed["packed"],
+                    "candidate_labels": (valid_ks, vector_labels),
+                    "weights": collapsed["weights"],
+                }
+            else:
+                linkage_matrix, linkage_cache_status, condensed = cached_linkage(
+                    packed,
+                    linkage_cache_dir,
+                    max_bytes=linkage_cache_max_bytes,
+                    memmap_path=memmap_path,
+                    method=method,
+                    metric=metric,
+                )
+                if not out_of_core and not stability_resamples:
+                    condensed = None
+                candidate_labels = candidate_cluster_labels(linkage_matrix, candidate_ks)
+                evaluation = {"features": prepared["normalized"], "packed": packed}
+        if evaluation is None:
+            k_metrics = pd.DataFrame(incremental_state["k_metrics"])
+        else:
+            with profile_stage(stage_profiles, "evaluate_candidate_ks"):
+                k_metrics = evaluate_candidate_ks(
+                    evaluation["features"],
+                    linkage_matrix,
+                    candidate_ks,
+                    packed=evaluation["packed"],
+                    silhouette_sample=silhouette_sample,
+                    candidate_labels=evaluation.get("candidate_labels", candidate_labels),
+                    condensed=condensed if out_of_core else None,
+                    jobs=jobs,
+                    weights=evaluation.get("weights"),
+                    metric=metric,
+                    rows_are_leaves=evaluation.get("rows_are_leaves", True),
+                )
+        if incremental and incremental_mode != "assign_only" and not unchanged:
+            with profile_stage(stage_profiles, "save_incremental_state"):
+                incremental_state = None
+                valid_ks, label_matrix = candidate_labels
+                best_position = valid_ks.index(int(select_best_k(k_metrics)["k"]))
+                cluster_ids, centroids = cluster_centroids(
+                    prepared["normalized"]["matrix"],
+                    label_matrix[best_position],
+                )
+                save_incremental_state(
+                    incremental_entry,
+                    {
+                        "fingerprints": fingerprints,
+                        "labels": label_matrix[best_position],
+                        "cluster_ids": cluster_ids,
+                        "centroids": centroids,
+                        "linkage": linkage_matrix,
+                        "condensed": condensed,
+                        "columns": [str(column) for column in features.columns],
+                        "best_k": valid_ks[best_position],
+                        "k_metrics": k_metrics.to_dict(orient="list"),
+                    },
+                )
+        stability = None
+        if stability_resamples:
+            if condensed is None:
+                condensed = condensed_distances(packed, metric=metric, memmap_path=memmap_path)
+            with profile_stage(stage_profiles, "bootstrap_stability"):
+                stability = bootstrap_stability(
+                    condensed,
+                    *candidate_labels,
+                    resamples=stability_resamples,
+                    tolerance=stability_tolerance,
+                    jobs=jobs,
+                    method=method,
+                )
+        del condensed
+    finally:
+        if memmap_path is not None:
+            memmap_path.unlink(missing_ok=True)
     best_k = select_best_k(k_metrics)
+    valid_ks, label_matrix = candidate_labels
     best_labels = pd.Series(
-        fcluster(linkage_matrix, t=int(best_k["k"]), criterion="maxclust"),
+        label_matrix[valid_ks.index(int(best_k["k"]))],
         index=features.index,
         name="cluster",
     )
 
-    patient_clusters = cleaned_data.loc[
+    patient_clusters = identifiers.loc[
         :,
-        [col for col in cleaned_data.columns if col in excluded_columns],
+        [col for col in identifiers.columns if col in excluded_columns],
     ].copy()
-    patient_clusters["row_id"] = range(1, len(cleaned_data) + 1)
+    patient_clusters["row_id"] = range(1, len(identifiers) + 1)
     patient_clusters["cluster"] = best_labels.values
+    patient_names = (
+        patient_clusters["姓名"].astype(str)
+        if "姓名" in patient_clusters.columns
+        else patient_clusters["row_id"].astype(str)
+    ).to_numpy()
+    dendrogram_labels = None
+    if engine == "approximate":
+        dendrogram_labels = [
+            f"微簇{position}（{int(weight)}人）"
+            for position, weight in enumerate(compressed["weights"], start=1)
+        ]
+    elif collapsed is not None:
+        dendrogram_labels = [
+            name if weight == 1 else f"{name} 等{weight}人"
+            for name, weight in zip(patient_names[collapsed["first_rows"]], collapsed["weights"])
+        ]
+    elif incremental_mode == "assign_only":
+        leaf_names = np.full(len(linkage_matrix) + 1, "（已移除）", dtype=object)
+        leaf_names[previous_rows] = patient_names[kept_rows]
+        dendrogram_labels = leaf_names.tolist()
 
-    cluster_profiles = build_cluster_profiles(features, best_labels)
+    with profile_stage(stage_profiles, "build_cluster_profiles"):
+        cluster_profiles = sort_cluster_profiles(
+            build_cluster_profiles(prepared["normalized"], best_labels)
+        )
     cluster_sizes = (
         patient_clusters["cluster"]
         .value_counts()
@@ -234,12 +2364,13 @@ def run_analysis(
         .rename_axis("cluster")
         .reset_index(name="patient_count")
     )
+    peak_rss = peak_rss_bytes()
     summary = pd.DataFrame(
         [
             {"metric": "input_file", "value": str(input_path)},
-            {"metric": "sheet_name", "value": "第一个工作表"},
-            {"metric": "sample_count", "value": int(len(cleaned_data))},
-            {"metric": "raw_row_count", "value": int(len(data))},
+            {"metric": "sheet_name", "value": prepared["sheet_name"]},
+            {"metric": "sample_count", "value": int(len(identifiers))},
+            {"metric": "raw_row_count", "value": prepared["raw_row_count"]},
             {"metric": "excluded_columns", "value": ",".join(prepared["excluded_columns"])},
             {"metric": "candidate_feature_count", "value": int(len(prepared["feature_filter"]))},
             {"metric": "retained_feature_count", "value": int(features.shape[1])},
@@ -257,14 +2388,38 @@ def run_analysis(
                 "value": prepared["positive_value_coercions"],
             },
             {"metric": "min_frequency", "value": float(min_frequency)},
-            {"metric": "linkage_method", "value": "ward"},
-            {"metric": "distance_metric", "value": "euclidean"},
+            {"metric": "linkage_method", "value": method},
+            {"metric": "distance_metric", "value": metric},
+            {"metric": "engine", "value": engine},
+            {"metric": "collapse_duplicates", "value": collapsed is not None},
+            {"metric": "leaf_count", "value": int(len(linkage_matrix) + 1)},
+            {"metric": "clustering_seconds", "value": round(linkage_profile["wall_seconds"], 3)},
+            {"metric": "cohort_cache", "value": prepared["cohort_cache"]},
+            {"metric": "linkage_cache", "value": linkage_cache_status},
+            {"metric": "out_of_core", "value": bool(out_of_core)},
+            {"metric": "incremental_mode", "value": incremental_mode},
+            {"metric": "incremental_reused_rows", "value": incremental_counts["reused"]},
+            {"metric": "incremental_new_rows", "value": incremental_counts["new"]},
+            {"metric": "jobs", "value": resolve_jobs(jobs)},
+            {
+                "metric": "stability_resamples",
+                "value": int(stability["resamples"].max()) if stability is not None else 0,
+            },
+            {
+                "metric": "silhouette_sample_size",
+                "value": int(min(silhouette_sample or len(identifiers), len(identifiers))),
+            },
             {"metric": "optimal_k", "value": int(best_k["k"])},
             {"metric": "best_silhouette_score", "value": float(best_k["silhouette_score"])},
             {
                 "metric": "best_calinski_harabasz_score",
                 "value": float(best_k["calinski_harabasz_score"]),
             },
+            {
+                "metric": "peak_rss_mb",
+                "value": round(peak_rss / 1024 / 1024, 1) if peak_rss is not None else None,
+            },
+            *stage_profile_rows(stage_profiles),
         ]
     )
 
@@ -272,32 +2427,41 @@ def run_analysis(
     return {
         "input_path": input_path,
         "output_dir": resolved_output_dir,
-        "raw_data": data,
-        "cleaned_data": cleaned_data,
+        "identifiers": identifiers,
         "features": features,
         "feature_filter": prepared["feature_filter"].reset_index(names="feature"),
         "k_metrics": k_metrics,
         "best_k": best_k,
         "patient_clusters": patient_clusters,
         "cluster_sizes": cluster_sizes,
-        "cluster_profiles": sort_cluster_profiles(cluster_profiles),
+        "cluster_profiles": cluster_profiles,
         "summary": summary,
+        "stability": stability,
         "linkage_matrix": linkage_matrix,
+        "dendrogram_labels": dendrogram_labels,
+        "stage_profiles": stage_profiles,
     }
 
 
-def write_analysis_outputs(result: dict[str, Any]) -> dict[str, Path]:
-    output_dir = Path(result["output_dir"])
-    excel_path = output_dir / "cluster_summary.xlsx"
-    dendrogram_path = output_dir / "dendrogram.png"
+def resolve_dendrogram_mode(mode: str, leaf_count: int) -> str:
+    if mode not in DENDROGRAM_MODES:
+        raise ValueError(f"未知树状图模式: {mode}，可选值为 {', '.join(DENDROGRAM_MODES)}")
+    if mode == "auto":
+        return "full" if leaf_count <= DENDROGRAM_FULL_LEAF_LIMIT else "lastp"
+    return mode
+
 
-    with pd.ExcelWriter(excel_path, engine="openpyxl") as writer:
-        result["summary"].to_excel(writer, sheet_name="summary", index=False)
-        result["k_metrics"].to_excel(writer, sheet_name="k_metrics", index=False)
-        result["feature_filter"].to_excel(writer, sheet_name="feature_filter", index=False)
-        result["patient_clusters"].to_excel(writer, sheet_name="patient_clusters", index=False)
-        result["cluster_sizes"].to_excel(writer, sheet_name="cluster_sizes", index=False)
-        result["cluster_profiles"].to_excel(writer, sheet_name="cluster_profiles", index=False)
+def render_dendrogram(
+    linkage_matrix: np.ndarray,
+    labels: list[str] | None,
+    output_path: Path,
+    mode: str = "full",
+) -> Path:
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from matplotlib import pyplot as plt
+    from scipy.cluster.hierarchy import dendrogram
 
     plt.rcParams["font.sans-serif"] = [
         "PingFang SC",
@@ -309,29 +2473,539 @@ def write_analysis_outputs(result: dict[str, Any]) -> dict[str, Path]:
     ]
     plt.rcParams["axes.unicode_minus"] = False
 
-    labels = (
-        result["patient_clusters"]["姓名"].astype(str).tolist()
-        if "姓名" in result["patient_clusters"].columns
-        else result["patient_clusters"]["row_id"].astype(str).tolist()
-    )
-    plt.figure(figsize=(18, 8))
-    dendrogram(result["linkage_matrix"], labels=labels, leaf_rotation=90, leaf_font_size=7)
-    plt.title("患者层次聚类树状图")
+    options: dict[str, Any] = {"labels": labels, "leaf_rotation": 90, "leaf_font_size": 7}
+    title = "患者层次聚类树状图"
+    if mode == "lastp":
+        options.update(truncate_mode="lastp", p=DENDROGRAM_LASTP, show_contracted=True)
+        title = f"患者层次聚类树状图（仅显示最后 {DENDROGRAM_LASTP} 次合并）"
+    elif mode == "level":
+        options.update(truncate_mode="level", p=DENDROGRAM_LEVELS, show_contracted=True)
+        title = f"患者层次聚类树状图（仅显示顶部 {DENDROGRAM_LEVELS} 层）"
+    figure = plt.figure(figsize=(18, 8))
+    dendrogram(linkage_matrix, **options)
+    plt.title(title)
     plt.xlabel("患者")
     plt.ylabel("距离")
     plt.tight_layout()
-    plt.savefig(dendrogram_path, dpi=200)
-    plt.close()
+    figure.savefig(output_path, dpi=200 if output_path.suffix == ".png" else None)
+    plt.close(figure)
+    return output_path
+
+
+def excel_rows(frame: pd.DataFrame) -> Iterator[list[Any]]:
+    yield [str(column) for column in frame.columns]
+    for start in range(0, len(frame), OUTPUT_CHUNK_ROWS):
+        chunk = frame.iloc[start : start + OUTPUT_CHUNK_ROWS].astype(object)
+        yield from chunk.where(chunk.notna(), None).to_numpy().tolist()
+
+
+def write_excel_workbook(
+    excel_path: Path,
+    sheets: dict[str, pd.DataFrame | Callable[[], pd.DataFrame]],
+) -> Path:
+    try:
+        import xlsxwriter
+    except ImportError:
+        xlsxwriter = None
+
+    deferred_last = sorted(sheets, key=lambda sheet_name: callable(sheets[sheet_name]))
+    if xlsxwriter is not None:
+        workbook = xlsxwriter.Workbook(str(excel_path), {"constant_memory": True})
+        worksheets = {sheet_name: workbook.add_worksheet(sheet_name) for sheet_name in sheets}
+        for sheet_name in deferred_last:
+            frame = sheets[sheet_name]() if callable(sheets[sheet_name]) else sheets[sheet_name]
+            for row_number, row in enumerate(excel_rows(frame)):
+                worksheets[sheet_name].write_row(row_number, 0, row)
+        workbook.close()
+        return excel_path
+
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    worksheets = {sheet_name: workbook.create_sheet(sheet_name) for sheet_name in sheets}
+    for sheet_name in deferred_last:
+        frame = sheets[sheet_name]() if callable(sheets[sheet_name]) else sheets[sheet_name]
+        for row in excel_rows(frame):
+            worksheets[sheet_name].append(row)
+    workbook.save(excel_path)
+    return excel_path
+
+
+def write_output_table(frame: pd.DataFrame, output_path: Path, table_format: str) -> Path:
+    if table_format == "csv":
+        frame.to_csv(output_path, index=False, encoding="utf-8-sig", chunksize=OUTPUT_CHUNK_ROWS)
+        return output_path
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise ImportError("以 Parquet 格式输出结果表需要安装 pyarrow。") from exc
+
+    schema = pa.Schema.from_pandas(frame, preserve_index=False)
+    with pq.ParquetWriter(output_path, schema) as writer:
+        for start in range(0, max(len(frame), 1), OUTPUT_CHUNK_ROWS):
+            chunk = frame.iloc[start : start + OUTPUT_CHUNK_ROWS]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    return output_path
+
+
+def dendrogram_leaf_labels(result: dict[str, Any]) -> list[str] | None:
+    if result.get("dendrogram_labels") is not None:
+        return result["dendrogram_labels"]
+    if len(result["linkage_matrix"]) + 1 != len(result["patient_clusters"]):
+        return None
+    if "姓名" in result["patient_clusters"].columns:
+        return result["patient_clusters"]["姓名"].astype(str).tolist()
+    return result["patient_clusters"]["row_id"].astype(str).tolist()
+
+
+def write_analysis_outputs(
+    result: dict[str, Any],
+    dendrogram_mode: str = "auto",
+    dendrogram_format: str = "png",
+    table_format: str = "xlsx",
+    dendrogram_executor: Executor | None = None,
+    stage_profiles: list[dict[str, Any]] | None = None,
+) -> dict[str, Any]:
+    import pandas as pd
+
+    if dendrogram_format not in DENDROGRAM_FORMATS:
+        raise ValueError(f"未知树状图格式: {dendrogram_format}，可选值为 {', '.join(DENDROGRAM_FORMATS)}")
+    if table_format not in TABLE_FORMATS:
+        raise ValueError(f"未知结果表格式: {table_format}，可选值为 {', '.join(TABLE_FORMATS)}")
+    output_dir = Path(result["output_dir"])
+    excel_path = output_dir / "cluster_summary.xlsx"
+    dendrogram_path = output_dir / f"dendrogram.{dendrogram_format}"
+    mode = resolve_dendrogram_mode(dendrogram_mode, len(result["linkage_matrix"]) + 1)
+
+    labels = dendrogram_leaf_labels(result)
+    export_stage = start_stage("write_analysis_outputs")
+
+    owned_executor = None
+    if dendrogram_executor is None and mode != "none":
+        dendrogram_executor = owned_executor = ProcessPoolExecutor(max_workers=1)
+    try:
+        rendering = (
+            dendrogram_executor.submit(render_dendrogram, result["linkage_matrix"], labels, dendrogram_path, mode)
+            if mode != "none"
+            else None
+        )
+        sheets = {
+            name: result[name]
+            for name in (
+                "summary",
+                "k_metrics",
+                "feature_filter",
+                "patient_clusters",
+                "cluster_sizes",
+                "cluster_profiles",
+                "stability",
+            )
+            if result.get(name) is not None
+        }
+
+        def summary_with_export_timing() -> pd.DataFrame:
+            if rendering is not None:
+                rendering.result()
+            export_rows = pd.DataFrame(stage_profile_rows([measure_stage(export_stage)]))
+            return pd.concat([result["summary"], export_rows], ignore_index=True)
+
+        sheets["summary"] = summary_with_export_timing
+        tables = {}
+        if table_format != "xlsx":
+            for name in LARGE_OUTPUT_TABLES:
+                tables[name] = write_output_table(
+                    sheets.pop(name),
+                    output_dir / f"{name}.{table_format}",
+                    table_format,
+                )
+        write_excel_workbook(excel_path, sheets)
+        dendrogram_output = rendering.result() if rendering is not None else None
+    finally:
+        if owned_executor is not None:
+            owned_executor.shutdown()
+    if stage_profiles is not None:
+        stage_profiles.append(measure_stage(export_stage))
+
+    return {"excel": excel_path, "dendrogram": dendrogram_output, "tables": tables}
+
+
+def resolve_batch_inputs(raw_input: str) -> list[Path] | None:
+    input_path = Path(raw_input)
+    if input_path.is_dir():
+        candidates = input_path.iterdir()
+    elif glob.has_magic(raw_input):
+        candidates = (Path(match) for match in glob.glob(raw_input, recursive=True))
+    else:
+        return None
+    inputs = sorted(
+        candidate
+        for candidate in candidates
+        if candidate.is_file()
+        and candidate.suffix.lower() in INPUT_READERS
+        and not candidate.name.startswith("~$")
+    )
+    if not inputs:
+        raise ValueError(f"未找到可分析的输入文件: {raw_input}")
+    return inputs
 
-    return {"excel": excel_path, "dendrogram": dendrogram_path}
+
+def batch_output_dirs(inputs: list[Path], batch_dir: Path) -> list[Path]:
+    used: set[str] = set()
+    output_dirs = []
+    for input_path in inputs:
+        name = input_path.stem
+        suffix = 2
+        while name in used:
+            name = f"{input_path.stem}-{suffix}"
+            suffix += 1
+        used.add(name)
+        output_dirs.append(batch_dir / name)
+    return output_dirs
+
+
+def batch_record(input_path: Path) -> dict[str, Any]:
+    return {
+        "input_file": str(input_path),
+        "status": "failed",
+        "error": None,
+        "output_dir": None,
+        "sample_count": None,
+        "optimal_k": None,
+        "best_silhouette_score": None,
+        "best_calinski_harabasz_score": None,
+        "analysis_seconds": None,
+        "write_seconds": None,
+        "total_seconds": None,
+    }
+
+
+def import_analysis_dependencies() -> None:
+    import matplotlib
+
+    matplotlib.use("Agg")
+    for module in ANALYSIS_DEPENDENCIES:
+        importlib.import_module(module)
+
+
+def analyze_batch_file(
+    input_path: Path,
+    output_dir: Path,
+    analysis_options: dict[str, Any],
+    output_options: dict[str, Any],
+    dendrogram_executor: Executor | None = None,
+) -> dict[str, Any]:
+    record = batch_record(input_path)
+    started = time.perf_counter()
+    try:
+        result = run_analysis(input_path, output_dir=output_dir, **analysis_options)
+        analysis_seconds = time.perf_counter() - started
+        write_analysis_outputs(result, dendrogram_executor=dendrogram_executor, **output_options)
+    except Exception as error:
+        record["error"] = f"{type(error).__name__}: {error}"
+    else:
+        record.update(
+            {
+                "status": "ok",
+                "output_dir": str(result["output_dir"]),
+                "sample_count": int(len(result["patient_clusters"])),
+                "optimal_k": int(result["best_k"]["k"]),
+                "best_silhouette_score": float(result["best_k"]["silhouette_score"]),
+                "best_calinski_harabasz_score": float(result["best_k"]["calinski_harabasz_score"]),
+                "analysis_seconds": round(analysis_seconds, 3),
+                "write_seconds": round(time.perf_counter() - started - analysis_seconds, 3),
+            }
+        )
+        for profile in result["stage_profiles"]:
+            record[f"stage_{profile['stage']}_wall_seconds"] = profile["wall_seconds"]
+    record["total_seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def init_batch_worker() -> None:
+    init_shared_worker({})
+    import_analysis_dependencies()
+    SHARED_WORKER_STATE["dendrogram_executor"] = ThreadPoolExecutor(max_workers=1)
+
+
+def batch_worker(
+    input_path: Path,
+    output_dir: Path,
+    analysis_options: dict[str, Any],
+    output_options: dict[str, Any],
+) -> dict[str, Any]:
+    return analyze_batch_file(
+        input_path,
+        output_dir,
+        analysis_options,
+        output_options,
+        dendrogram_executor=SHARED_WORKER_STATE["dendrogram_executor"],
+    )
+
+
+def run_batch(
+    inputs: list[Path],
+    output_dir: Path | str | None = None,
+    workers: int = 1,
+    analysis_options: dict[str, Any] | None = None,
+    output_options: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    import pandas as pd
+
+    analysis_options = analysis_options or {}
+    output_options = output_options or {}
+    batch_dir = create_output_directory(output_dir)
+    output_dirs = batch_output_dirs(inputs, batch_dir)
+    workers = min(resolve_jobs(workers), len(inputs))
+    if workers == 1:
+        with ProcessPoolExecutor(max_workers=1, initializer=import_analysis_dependencies) as renderer:
+            records = [
+                analyze_batch_file(
+                    input_path,
+                    file_output_dir,
+                    analysis_options,
+                    output_options,
+                    dendrogram_executor=renderer,
+                )
+                for input_path, file_output_dir in zip(inputs, output_dirs)
+            ]
+    else:
+        records = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_batch_worker) as executor:
+            futures = [
+                executor.submit(
+                    batch_worker,
+                    input_path,
+                    file_output_dir,
+                    analysis_options,
+                    output_options,
+                )
+                for input_path, file_output_dir in zip(inputs, output_dirs)
+            ]
+            for input_path, future in zip(inputs, futures):
+                try:
+                    records.append(future.result())
+                except Exception as error:
+                    record = batch_record(input_path)
+                    record["error"] = f"{type(error).__name__}: {error}"
+                    records.append(record)
+
+    index = pd.DataFrame(records)
+    index_path = write_excel_workbook(batch_dir / BATCH_INDEX_NAME, {"batch_index": index})
+    return {"output_dir": batch_dir, "index": index, "index_path": index_path}
+
+
+def parse_frequency_list(raw_values: str) -> list[float]:
+    thresholds = sorted({float(part) for part in raw_values.split(",") if part.strip()})
+    if not thresholds:
+        raise ValueError("--min-frequency-sweep 至少需要一个阈值。")
+    if thresholds[0] < 0 or thresholds[-1] > 1:
+        raise ValueError("低频剔除阈值必须位于 0 到 1 之间。")
+    return thresholds
+
+
+def sweep_record(min_frequency: float) -> dict[str, Any]:
+    return {
+        "min_frequency": min_frequency,
+        "status": "failed",
+        "error": None,
+        "retained_feature_count": None,
+        "removed_features": None,
+        "leaf_count": None,
+        "optimal_k": None,
+        "best_silhouette_score": None,
+        "best_calinski_harabasz_score": None,
+        "clustering_seconds": None,
+        "total_seconds": None,
+        "output_dir": None,
+    }
+
+
+def analyze_sweep_threshold(
+    prepared: dict[str, Any],
+    input_path: Path,
+    min_frequency: float,
+    output_dir: Path,
+    analysis_options: dict[str, Any],
+    output_options: dict[str, Any],
+) -> dict[str, Any]:
+    record = sweep_record(min_frequency)
+    started = time.perf_counter()
+    labels = None
+    k_metrics = None
+    try:
+        result = run_analysis(
+            input_path,
+            output_dir=output_dir,
+            min_frequency=min_frequency,
+            prepared_cohort=prepared,
+            **analysis_options,
+        )
+        write_analysis_outputs(result, **output_options)
+    except Exception as error:
+        record["error"] = f"{type(error).__name__}: {error}"
+    else:
+        summary = result["summary"].set_index("metric")["value"]
+        feature_filter = result["feature_filter"]
+        record.update(
+            {
+                "status": "ok",
+                "retained_feature_count": int(summary["retained_feature_count"]),
+                "removed_features": ",".join(
+                    feature_filter.loc[~feature_filter["keep"].astype(bool), "feature"].astype(str)
+                ),
+                "leaf_count": int(summary["leaf_count"]),
+                "optimal_k": int(result["best_k"]["k"]),
+                "best_silhouette_score": float(result["best_k"]["silhouette_score"]),
+                "best_calinski_harabasz_score": float(result["best_k"]["calinski_harabasz_score"]),
+                "clustering_seconds": float(summary["clustering_seconds"]),
+                "output_dir": str(result["output_dir"]),
+            }
+        )
+        labels = result["patient_clusters"]["cluster"].to_numpy()
+        k_metrics = result["k_metrics"].assign(min_frequency=min_frequency)
+    record["total_seconds"] = round(time.perf_counter() - started, 3)
+    return {"record": record, "labels": labels, "k_metrics": k_metrics}
+
+
+def sweep_worker(
+    input_path: Path,
+    min_frequency: float,
+    output_dir: Path,
+    analysis_options: dict[str, Any],
+    output_options: dict[str, Any],
+) -> dict[str, Any]:
+    return analyze_sweep_threshold(
+        SHARED_WORKER_STATE["sweep_prepared"],
+        input_path,
+        min_frequency,
+        output_dir,
+        analysis_options,
+        output_options,
+    )
+
+
+def run_min_frequency_sweep(
+    input_path: Path | str,
+    thresholds: Iterable[float],
+    output_dir: Path | str | None = None,
+    workers: int = 0,
+    analysis_options: dict[str, Any] | None = None,
+    output_options: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    import pandas as pd
+
+    input_path = Path(input_path)
+    thresholds = sorted({float(threshold) for threshold in thresholds})
+    analysis_options = dict(analysis_options or {})
+    output_options = output_options or {}
+    prepared = cached_prepared_cohort(
+        input_path,
+        analysis_options.pop("cohort_cache_dir", None),
+        excluded_columns=analysis_options.pop("excluded_columns", ("姓名", "年龄")),
+        min_frequency=0.0,
+        sheet_name=analysis_options.pop("sheet_name", None),
+    )
+    analysis_options.pop("min_frequency", None)
+    analysis_options.setdefault(
+        "linkage_cache_dir",
+        Path(output_dir or DEFAULT_OUTPUT_ROOT) / LINKAGE_CACHE_DIRNAME,
+    )
+    sweep_dir = create_output_directory(output_dir)
+    threshold_dirs = [sweep_dir / f"min_frequency_{threshold:g}" for threshold in thresholds]
+    workers = min(resolve_jobs(workers), len(thresholds))
+    if workers == 1:
+        outcomes = [
+            analyze_sweep_threshold(
+                prepared,
+                input_path,
+                threshold,
+                threshold_dir,
+                analysis_options,
+                output_options,
+            )
+            for threshold, threshold_dir in zip(thresholds, threshold_dirs)
+        ]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_shared_worker,
+            initargs=({}, {"sweep_prepared": prepared}),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    sweep_worker,
+                    input_path,
+                    threshold,
+                    threshold_dir,
+                    analysis_options,
+                    output_options,
+                )
+                for threshold, threshold_dir in zip(thresholds, threshold_dirs)
+            ]
+            outcomes = []
+            for threshold, future in zip(thresholds, futures):
+                try:
+                    outcomes.append(future.result())
+                except Exception as error:
+                    record = sweep_record(threshold)
+                    record["error"] = f"{type(error).__name__}: {error}"
+                    outcomes.append({"record": record, "labels": None, "k_metrics": None})
+
+    previous_labels = None
+    for outcome in outcomes:
+        labels = outcome["labels"]
+        outcome["record"]["ari_vs_previous"] = (
+            adjusted_rand_index(previous_labels, labels)
+            if labels is not None and previous_labels is not None
+            else None
+        )
+        if labels is not None:
+            previous_labels = labels
+    comparison = pd.DataFrame([outcome["record"] for outcome in outcomes])
+    k_metric_frames = [outcome["k_metrics"] for outcome in outcomes if outcome["k_metrics"] is not None]
+    sheets = {"comparison": comparison}
+    if k_metric_frames:
+        k_metrics = pd.concat(k_metric_frames, ignore_index=True)
+        sheets["k_metrics"] = k_metrics.loc[:, ["min_frequency", *k_metrics.columns.drop("min_frequency")]]
+    workbook_path = write_excel_workbook(sweep_dir / SWEEP_WORKBOOK_NAME, sheets)
+    return {"output_dir": sweep_dir, "comparison": comparison, "workbook_path": workbook_path}
 
 
 def build_argument_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="中医证候层次聚类分析脚本")
-    parser.add_argument("--input", required=True, help="输入 Excel 文件路径")
+    parser.add_argument(
+        "--input",
+        required=True,
+        help="输入文件路径，按后缀选择读取方式：.xlsx/.xlsm/.xls/.csv/.parquet；"
+        "传入目录或通配符（如 'cohorts/*.xlsx'）时进入批量模式",
+    )
+    parser.add_argument(
+        "--min-frequency-sweep",
+        default=None,
+        help="逗号分隔的多个低频剔除阈值（如 0.02,0.05,0.1），只读取与标准化一次，"
+        "各阈值分别聚类并输出对比表",
+    )
+    parser.add_argument(
+        "--sweep-workers",
+        type=int,
+        default=0,
+        help="阈值扫描时并行处理的阈值数，0 表示使用全部 CPU 核心",
+    )
+    parser.add_argument(
+        "--batch-workers",
+        type=int,
+        default=1,
+        help="批量模式下同时分析的文件数，0 表示使用全部 CPU 核心",
+    )
+    parser.add_argument(
+        "--sheet",
+        default=None,
+        help="Excel 工作表名称或从 0 开始的序号，默认读取第一个工作表",
+    )
     parser.add_argument(
         "--output-dir",
-        default="outputs/tcm_clustering",
+        default=DEFAULT_OUTPUT_ROOT,
         help="输出根目录，脚本会在其下创建时间戳子目录",
     )
     parser.add_argument(
@@ -350,6 +3024,132 @@ def build_argument_parser() -> argparse.ArgumentParser:
         default="4-7",
         help="聚类数探索区间，格式如 4-7",
     )
+    parser.add_argument(
+        "--silhouette-sample",
+        type=int,
+        default=None,
+        help="轮廓系数抽样患者数，用于大样本近似评估（固定随机种子），默认使用全部患者",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="候选 K 评估使用的并行进程数，0 表示使用全部 CPU 核心",
+    )
+    parser.add_argument(
+        "--metric",
+        choices=DISTANCE_METRICS,
+        default="euclidean",
+        help="患者间距离度量：euclidean、hamming（不一致症状数）、jaccard、dice，轮廓系数使用同一度量",
+    )
+    parser.add_argument(
+        "--method",
+        choices=LINKAGE_METHODS,
+        default="ward",
+        help="层次聚类连接方法，ward 只能与 euclidean 距离搭配",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=CLUSTERING_ENGINES,
+        default="exact",
+        help="聚类引擎：exact 为完整 ward 聚类；approximate 先去重并用 MiniBatchKMeans 压缩为微簇，再对微簇做加权 ward 聚类",
+    )
+    parser.add_argument(
+        "--micro-clusters",
+        type=int,
+        default=MICRO_CLUSTER_COUNT,
+        help="approximate 引擎的微簇数量上限，去重后的症状组合不超过该值时不做 k-means 压缩",
+    )
+    parser.add_argument(
+        "--no-collapse",
+        action="store_true",
+        help="exact 引擎默认仅在去重后症状组合数不超过患者数一半时合并相同组合的患者，此选项始终逐个患者构建层次聚类树",
+    )
+    parser.add_argument(
+        "--stability-resamples",
+        type=int,
+        default=0,
+        help="自助法稳定性分析的最大重抽样次数，0 表示不进行稳定性分析",
+    )
+    parser.add_argument(
+        "--stability-tolerance",
+        type=float,
+        default=STABILITY_CI_TOLERANCE,
+        help="稳定性指标 95%% 置信区间半宽的收敛阈值，全部指标达到后提前停止重抽样",
+    )
+    parser.add_argument(
+        "--table-format",
+        choices=TABLE_FORMATS,
+        default="xlsx",
+        help="患者分群与症状画像大表的输出格式：xlsx 写入汇总工作簿；csv/parquet 另存为独立文件，工作簿仅保留小表",
+    )
+    parser.add_argument(
+        "--dendrogram",
+        choices=DENDROGRAM_MODES,
+        default="auto",
+        help=(
+            f"树状图绘制方式：auto 在叶节点超过 {DENDROGRAM_FULL_LEAF_LIMIT} 个时自动截断；"
+            "full 完整绘制；lastp 仅显示最后若干次合并；level 仅显示顶部若干层；none 不绘制"
+        ),
+    )
+    parser.add_argument(
+        "--dendrogram-format",
+        choices=DENDROGRAM_FORMATS,
+        default="png",
+        help="树状图输出格式，svg 为矢量图",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="解析后队列数据的缓存目录，输入文件未变化时直接加载清洗后的二值矩阵",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="不读写输出根目录下的 linkage 缓存，强制重新计算层次聚类",
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=float,
+        default=LINKAGE_CACHE_MAX_BYTES / 1024 / 1024,
+        help="linkage 缓存目录的容量上限（MB），超出后按最近使用时间淘汰",
+    )
+    parser.add_argument(
+        "--out-of-core",
+        action="store_true",
+        help="将压缩距离矩阵分块写入磁盘内存映射文件，并在该文件上原地执行最近邻链层次聚类，"
+        "常驻内存只随患者数线性增长，用于内存放不下的大样本；轮廓系数改为按块从症状矩阵重算",
+    )
+    parser.add_argument(
+        "--scratch-dir",
+        default=None,
+        help="--out-of-core 模式下距离矩阵临时文件所在目录，默认使用输出根目录",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="按行指纹识别已处理的患者，复用缓存的距离矩阵，仅计算新增患者的距离后重建层次聚类",
+    )
+    parser.add_argument(
+        "--assign-only",
+        action="store_true",
+        help="增量模式下不重建层次聚类，按最近质心将新增患者分配到已有聚类",
+    )
+    parser.add_argument(
+        "--profile-json",
+        default=None,
+        help="将各阶段墙钟时间、CPU 时间与内存增量写入该 JSON 文件",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="启用 tracemalloc 记录各阶段 Python 内存分配峰值（有额外开销）",
+    )
+    parser.add_argument(
+        "--cprofile",
+        default=None,
+        help="使用 cProfile 剖析整个运行过程并将 pstats 结果写入该文件",
+    )
     return parser
 
 
@@ -362,22 +3162,120 @@ def parse_k_range(raw_range: str) -> range:
     return range(start, end + 1)
 
 
-def main() -> None:
+def main(argv: list[str] | None = None) -> None:
     parser = build_argument_parser()
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     excluded_columns = [part.strip() for part in args.exclude_columns.split(",") if part.strip()]
-    result = run_analysis(
-        input_path=args.input,
-        output_dir=args.output_dir,
-        excluded_columns=excluded_columns,
-        min_frequency=args.min_frequency,
-        candidate_ks=parse_k_range(args.k_range),
-    )
-    output_paths = write_analysis_outputs(result)
+    analysis_options = {
+        "excluded_columns": excluded_columns,
+        "min_frequency": args.min_frequency,
+        "candidate_ks": parse_k_range(args.k_range),
+        "silhouette_sample": args.silhouette_sample,
+        "use_linkage_cache": not args.no_cache,
+        "linkage_cache_max_bytes": int(args.cache_max_mb * 1024 * 1024),
+        "out_of_core": args.out_of_core,
+        "scratch_dir": args.scratch_dir,
+        "sheet_name": args.sheet,
+        "cohort_cache_dir": args.cache_dir,
+        "jobs": args.jobs,
+        "stability_resamples": args.stability_resamples,
+        "stability_tolerance": args.stability_tolerance,
+        "engine": args.engine,
+        "micro_clusters": args.micro_clusters,
+        "collapse_duplicates": not args.no_collapse,
+        "metric": args.metric,
+        "method": args.method,
+        "incremental": args.incremental,
+        "assign_only": args.assign_only,
+    }
+    output_options = {
+        "dendrogram_mode": args.dendrogram,
+        "dendrogram_format": args.dendrogram_format,
+        "table_format": args.table_format,
+    }
+    batch_inputs = resolve_batch_inputs(args.input)
+    if args.min_frequency_sweep and batch_inputs is not None:
+        parser.error("--min-frequency-sweep 不能与批量模式同时使用。")
+    if args.trace_memory:
+        tracemalloc.start()
+    profiler = cProfile.Profile() if args.cprofile else None
+    if profiler is not None:
+        profiler.enable()
+
+    if args.min_frequency_sweep:
+        sweep = run_min_frequency_sweep(
+            args.input,
+            parse_frequency_list(args.min_frequency_sweep),
+            output_dir=args.output_dir,
+            workers=args.sweep_workers,
+            analysis_options=analysis_options,
+            output_options=output_options,
+        )
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.cprofile)
+        comparison = sweep["comparison"]
+        for row in comparison.itertuples(index=False):
+            if row.status == "ok":
+                print(
+                    f"min_frequency={row.min_frequency:g}: 保留 {row.retained_feature_count} 个证候，"
+                    f"最优 K = {row.optimal_k}，轮廓系数 {row.best_silhouette_score:.4f}"
+                )
+            else:
+                print(f"min_frequency={row.min_frequency:g}: 分析失败: {row.error}", file=sys.stderr)
+        print(f"阈值对比表: {sweep['workbook_path']}")
+        if (comparison["status"] != "ok").any():
+            raise SystemExit(1)
+        return
+
+    if batch_inputs is not None:
+        batch = run_batch(
+            batch_inputs,
+            output_dir=args.output_dir,
+            workers=args.batch_workers,
+            analysis_options=analysis_options,
+            output_options=output_options,
+        )
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.cprofile)
+        index = batch["index"]
+        failed = index.loc[index["status"] != "ok"]
+        if args.profile_json:
+            Path(args.profile_json).write_text(
+                index.to_json(orient="records", force_ascii=False, indent=2),
+                encoding="utf-8",
+            )
+        print(f"批量分析完成: 成功 {len(index) - len(failed)} 个，失败 {len(failed)} 个")
+        print(f"批量索引: {batch['index_path']}")
+        for row in failed.itertuples(index=False):
+            print(f"分析失败: {row.input_file}: {row.error}", file=sys.stderr)
+        if len(failed):
+            raise SystemExit(1)
+        return
+
+    result = run_analysis(input_path=args.input, output_dir=args.output_dir, **analysis_options)
+    output_paths = write_analysis_outputs(result, stage_profiles=result["stage_profiles"], **output_options)
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.cprofile)
+    if args.profile_json:
+        Path(args.profile_json).write_text(
+            json.dumps({"stages": result["stage_profiles"]}, ensure_ascii=False, indent=2),
+            encoding="utf-8",
+        )
 
     print(f"分析完成，最优 K = {int(result['best_k']['k'])}")
     print(f"Excel 输出: {output_paths['excel']}")
-    print(f"树状图输出: {output_paths['dendrogram']}")
+    print(f"树状图输出: {output_paths['dendrogram'] or '已跳过'}")
+    for name, table_path in output_paths["tables"].items():
+        print(f"{name} 输出: {table_path}")
+    for profile in result["stage_profiles"]:
+        print(f"阶段 {profile['stage']}: {profile['wall_seconds']:.2f}s（CPU {profile['cpu_seconds']:.2f}s）")
+    if args.profile_json:
+        print(f"性能剖析输出: {args.profile_json}")
+    if args.cprofile:
+        print(f"cProfile 输出: {args.cprofile}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+import json
+
+from scripts.benchmark_tcm_clustering import (
+    BENCHMARK_STAGES,
+    compare_with_baseline,
+    main,
+    measure_startup,
+    parse_importtime,
+    parse_sizes,
+    run_profiles_benchmark,
+    synthetic_cohort,
+)
+
+
+def test_synthetic_cohort_is_sparse_and_deterministic():
+    cohort = synthetic_cohort(500, 40)
+    repeated = synthetic_cohort(500, 40)
+
+    assert cohort.equals(repeated)
+    assert list(cohort.columns[:2]) == ["姓名", "年龄"]
+    symptoms = cohort.iloc[:, 2:]
+    assert set(symptoms.stack().unique()) <= {0, 1}
+    assert 0.02 < symptoms.to_numpy().mean() < 0.3
+
+
+def test_compare_with_baseline_flags_only_material_regressions():
+    baseline = {
+        "cases": [
+            {"patients": 1000, "symptoms": 50, "stages": {"linkage": 1.0, "read": 0.01, "profiles": 0.5}},
+        ]
+    }
+    current = {
+        "cases": [
+            {"patients": 1000, "symptoms": 50, "stages": {"linkage": 1.4, "read": 0.04, "profiles": 0.55}},
+            {"patients": 2000, "symptoms": 50, "stages": {"linkage": 9.0}},
+        ]
+    }
+
+    regressions = compare_with_baseline(current, baseline, threshold=0.25, min_seconds=0.05)
+
+    assert [(row["patients"], row["stage"]) for row in regressions] == [(1000, "linkage")]
+    assert regressions[0]["ratio"] == 1.4
+
+    baseline["startup"] = {"import_seconds": 0.2, "heavy_modules": []}
+    current["startup"] = {"import_seconds": 0.21, "heavy_modules": []}
+    assert len(compare_with_baseline(current, baseline)) == 1
+    current["startup"] = {"import_seconds": 0.21, "heavy_modules": ["pandas"]}
+    assert [row["stage"] for row in compare_with_baseline(current, baseline)] == [
+        "startup_import",
+        "linkage",
+    ]
+
+
+def test_profiles_benchmark_matches_loop_and_flags_regressions():
+    profiles = run_profiles_benchmark(600, 30, cluster_count=5)
+
+    assert profiles["identical"] is True
+    assert profiles["loop_seconds"] > 0 and profiles["vectorized_seconds"] > 0
+    baseline = {"cases": [], "profiles": {**profiles, "vectorized_seconds": 0.01}}
+    current = {"cases": [], "profiles": {**profiles, "vectorized_seconds": 0.2}}
+    assert [row["stage"] for row in compare_with_baseline(current, baseline)] == ["profiles_vectorized"]
+    current["profiles"]["identical"] = False
+    current["profiles"]["vectorized_seconds"] = 0.01
+    assert [row["stage"] for row in compare_with_baseline(current, baseline)] == ["profiles_mismatch"]
+
+
+def test_startup_import_avoids_heavy_dependencies():
+    startup = measure_startup(repeat=1)
+
+    assert startup["heavy_modules"] == []
+    assert parse_importtime(
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        340 |   numpy\n"
+    ) == {"numpy": 340}
+
+
+def test_benchmark_cli_writes_stage_timings_and_fails_on_regression(tmp_path, capsys):
+    assert parse_sizes("200x20, 300X30") == [(200, 20), (300, 30)]
+    assert main(["--sizes", "200x20", "--profiles-size", "300x20", "--work-dir", str(tmp_path)]) == 0
+
+    captured = capsys.readouterr()
+    results = json.loads(captured.out)
+    assert "200 例 × 20 症状" in captured.err
+    assert results["profiles"]["identical"] is True
+    case = results["cases"][0]
+    assert (case["patients"], case["symptoms"], case["engine"]) == (200, 20, "exact")
+    assert tuple(case["stages"]) == BENCHMARK_STAGES
+    assert all(seconds >= 0 for seconds in case["stages"].values())
+
+    for stage in case["stages"]:
+        case["stages"][stage] = 0.0
+    baseline_path = tmp_path / "baseline.json"
+    baseline_path.write_text(json.dumps(results), encoding="utf-8")
+    assert (
+        main(
+            [
+                "--sizes",
+                "200x20",
+                "--profiles-size",
+                "",
+                "--output",
+                str(tmp_path / "current.json"),
+                "--baseline",
+                str(baseline_path),
+                "--threshold",
+                "0",
+                "--min-seconds",
+                "0",
+                "--work-dir",
+                str(tmp_path),
+            ]
+        )
+        == 1
+    )
@@ -0,0 +1,168 @@
+import json
+import threading
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+import scripts.tcm_clustering_service as service
+from scripts.tcm_clustering_service import (
+    cohort_nbytes,
+    create_server,
+    handle_request,
+    measure_cohort_nbytes,
+    new_registry,
+)
+from scripts.tcm_hierarchical_clustering import run_analysis
+
+
+def make_cohort_frame(patient_count, seed):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame(
+        (rng.random((patient_count, 8)) < [0.6, 0.5, 0.4, 0.3, 0.3, 0.2, 0.1, 0.02]).astype(int),
+        columns=["畏冷", "咳嗽", "痰黄", "口苦", "乏力", "咽痛", "头痛", "盗汗"],
+    )
+    frame.insert(0, "年龄", rng.integers(20, 80, size=patient_count))
+    frame.insert(0, "姓名", [f"患者{index}" for index in range(1, patient_count + 1)])
+    return frame
+
+
+def request_json(registry, method, path, payload=None):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else b""
+    return handle_request(registry, method, path, body)
+
+
+def test_service_answers_cut_profile_refilter_and_k_metrics_from_cached_state(tmp_path):
+    input_path = tmp_path / "cohort.csv"
+    make_cohort_frame(60, seed=3).to_csv(input_path, index=False)
+    registry = new_registry()
+
+    status, cohort = request_json(registry, "POST", "/cohorts", {"path": str(input_path)})
+    expected = run_analysis(input_path, output_dir=tmp_path, candidate_ks=range(2, 6))
+    cohort_id = cohort["cohort_id"]
+    best_k = int(expected["best_k"]["k"])
+
+    assert status == 201
+    assert (cohort["sample_count"], cohort["candidate_feature_count"], cohort["retained_feature_count"]) == (60, 8, 7)
+    status, cut = request_json(registry, "GET", f"/cohorts/{cohort_id}/cut?k={best_k}")
+    assert status == 200
+    assert cut["clusters"] == expected["patient_clusters"]["cluster"].tolist()
+    assert sum(cut["cluster_sizes"].values()) == 60
+
+    status, metrics = request_json(registry, "GET", f"/cohorts/{cohort_id}/k_metrics?k_range=2-5")
+    assert status == 200
+    pd.testing.assert_frame_equal(pd.DataFrame(metrics["k_metrics"]), expected["k_metrics"], check_dtype=False)
+
+    status, profile = request_json(registry, "GET", f"/cohorts/{cohort_id}/profile?k={best_k}&cluster=1&top=3")
+    expected_profile = expected["cluster_profiles"].loc[expected["cluster_profiles"]["cluster"] == 1].head(3)
+    assert status == 200
+    assert [row["feature"] for row in profile["features"]] == expected_profile["feature"].tolist()
+
+    status, refiltered = request_json(registry, "POST", f"/cohorts/{cohort_id}/refilter?min_frequency=0.25")
+    assert status == 200
+    assert set(refiltered["removed_features"]) >= {"头痛", "盗汗"}
+    status, narrow_cut = request_json(registry, "GET", f"/cohorts/{cohort_id}/cut?k=3&min_frequency=0.25")
+    assert status == 200 and len(narrow_cut["clusters"]) == 60
+
+    assert request_json(registry, "GET", f"/cohorts/{cohort_id}/cut")[0] == 400
+    assert request_json(registry, "GET", f"/cohorts/{cohort_id}/refilter?min_frequency=0.99")[0] == 400
+    assert request_json(registry, "GET", "/cohorts/missing/cut?k=3")[0] == 404
+
+
+def test_service_evicts_least_recently_used_cohorts_by_memory(tmp_path):
+    paths = []
+    for seed in range(3):
+        path = tmp_path / f"cohort_{seed}.csv"
+        make_cohort_frame(80, seed=seed).to_csv(path, index=False)
+        paths.append(path)
+    registry = new_registry()
+    first_id = request_json(registry, "POST", "/cohorts", {"path": str(paths[0])})[1]["cohort_id"]
+    registry["memory_budget_bytes"] = int(cohort_nbytes(registry["cohorts"][first_id]) * 2.5)
+    second_id = request_json(registry, "POST", "/cohorts", {"path": str(paths[1])})[1]["cohort_id"]
+
+    assert request_json(registry, "GET", f"/cohorts/{first_id}")[0] == 200
+    third_id = request_json(registry, "POST", "/cohorts", {"path": str(paths[2])})[1]["cohort_id"]
+
+    assert list(registry["cohorts"]) == [first_id, third_id]
+    assert request_json(registry, "GET", f"/cohorts/{second_id}/cut?k=3")[0] == 404
+    status, health = request_json(registry, "GET", "/health")
+    assert health["evicted"] == 1
+    assert health["memory_bytes"] <= health["memory_budget_bytes"]
+
+
+def test_service_tracks_memory_incrementally_and_separates_missing_cohorts_from_failures(tmp_path, monkeypatch):
+    input_path = tmp_path / "cohort.csv"
+    make_cohort_frame(60, seed=4).to_csv(input_path, index=False)
+    registry = new_registry()
+    cohort_id = request_json(registry, "POST", "/cohorts", {"path": str(input_path)})[1]["cohort_id"]
+    for path in ("cut?k=3", "profile?k=3&cluster=1", "k_metrics?k_range=2-4", "refilter?min_frequency=0.25"):
+        assert request_json(registry, "GET", f"/cohorts/{cohort_id}/{path}")[0] == 200
+
+    cohort = registry["cohorts"][cohort_id]
+    assert cohort_nbytes(cohort) == measure_cohort_nbytes(cohort)
+    assert request_json(registry, "DELETE", "/cohorts/missing")[0] == 404
+
+    def broken_labels(*args, **kwargs):
+        raise KeyError("cluster")
+
+    monkeypatch.setattr(service, "candidate_cluster_labels", broken_labels)
+    status, payload = request_json(registry, "GET", f"/cohorts/{cohort_id}/cut?k=5")
+    assert status == 500
+    assert payload["error"].startswith("KeyError")
+
+
+def test_service_answers_cached_reads_while_a_refilter_builds(tmp_path, monkeypatch):
+    input_path = tmp_path / "cohort.csv"
+    make_cohort_frame(60, seed=6).to_csv(input_path, index=False)
+    registry = new_registry()
+    cohort_id = request_json(registry, "POST", "/cohorts", {"path": str(input_path)})[1]["cohort_id"]
+    started = threading.Event()
+    release = threading.Event()
+    original_linkage = service.cached_linkage
+
+    def slow_linkage(*args, **kwargs):
+        started.set()
+        assert release.wait(10)
+        return original_linkage(*args, **kwargs)
+
+    monkeypatch.setattr(service, "cached_linkage", slow_linkage)
+    responses = []
+    refilter_path = f"/cohorts/{cohort_id}/refilter?min_frequency=0.25"
+    refilter = threading.Thread(target=lambda: responses.append(request_json(registry, "POST", refilter_path)))
+    refilter.start()
+    try:
+        assert started.wait(10)
+        assert request_json(registry, "GET", f"/cohorts/{cohort_id}/cut?k=3")[0] == 200
+    finally:
+        release.set()
+        refilter.join()
+
+    assert responses[0][0] == 200
+
+
+def test_service_accepts_raw_workbook_upload_over_http(tmp_path):
+    input_path = tmp_path / "cohort.xlsx"
+    make_cohort_frame(40, seed=5).to_excel(input_path, index=False)
+    server = create_server(port=0, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    try:
+        upload = urllib.request.Request(
+            f"{base_url}/cohorts?filename=cohort.xlsx&min_frequency=0.1",
+            data=input_path.read_bytes(),
+            headers={"Content-Type": "application/octet-stream"},
+            method="POST",
+        )
+        with urllib.request.urlopen(upload) as response:
+            cohort = json.loads(response.read().decode("utf-8"))
+        with urllib.request.urlopen(f"{base_url}/cohorts/{cohort['cohort_id']}/cut?k=4") as response:
+            cut = json.loads(response.read().decode("utf-8"))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert cohort["source"] == "cohort.xlsx"
+    assert cohort["min_frequency"] == 0.1
+    assert len(cut["clusters"]) == 40
+    assert "elapsed_ms" in cut
@@ -1,16 +1,80 @@
+import json
+import os
+import pstats
+import subprocess
+import sys
+import warnings
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
 import pytest
+from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.spatial.distance import pdist, squareform
+from sklearn.metrics import adjusted_rand_score, calinski_harabasz_score, silhouette_score
 
 from scripts.tcm_hierarchical_clustering import (
+    adjusted_rand_index,
+    augment_condensed,
+    binary_calinski_harabasz_score,
+    bootstrap_sample_rows,
+    bootstrap_stability,
+    candidate_cluster_labels,
+    compress_patients,
+    cached_prepared_cohort,
+    cluster_centroids,
+    collapse_duplicate_rows,
+    collapse_if_worthwhile,
     build_cluster_profiles,
+    cached_linkage,
+    condensed_distance_rows,
+    condensed_distances,
+    condensed_subset,
+    cut_linkage_labels,
+    evaluate_candidate_ks,
     filter_low_frequency_features,
+    load_prepared_cohort,
+    main,
+    match_fingerprints,
+    nearest_centroid_labels,
+    nested_calinski_harabasz_scores,
+    normalize_binary_series,
+    normalize_feature_frame,
+    pack_binary_matrix,
+    parse_frequency_list,
+    resolve_batch_inputs,
+    resolve_dendrogram_mode,
     run_analysis,
+    run_batch,
+    run_min_frequency_sweep,
     select_best_k,
+    silhouette_scores,
     sort_cluster_profiles,
+    store_cached_linkage,
+    weighted_linkage,
+    weighted_ward_linkage,
     write_analysis_outputs,
+    write_excel_workbook,
 )
 
 
+def random_binary_matrix(sample_count, feature_count, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.random((sample_count, feature_count)) < 0.3).astype(np.uint8)
+
+
+def make_cohort_frame(patient_count=12, seed=0):
+    matrix = random_binary_matrix(patient_count, 6, seed=seed)
+    frame = pd.DataFrame(matrix, columns=["畏冷", "咳嗽", "痰黄", "口苦", "乏力", "盗汗"])
+    frame.insert(0, "年龄", [40 + i for i in range(patient_count)])
+    frame.insert(0, "姓名", [f"患者{i}" for i in range(1, patient_count + 1)])
+    return frame
+
+
+def summary_value(result, metric):
+    return result["summary"].set_index("metric").loc[metric, "value"]
+
+
 def test_filter_low_frequency_features_removes_features_below_threshold():
     data = pd.DataFrame(
         {
@@ -47,6 +111,272 @@ def test_filter_low_frequency_features_keeps_features_at_exact_threshold():
     assert stats.loc["刚好阈值", "keep"] is True
 
 
+def test_normalize_feature_frame_matches_series_normalization():
+    data = pd.DataFrame(
+        {
+            "数值": [1, 0, 3, None, 0.5],
+            "中文": ["是", "否", "有", "无", None],
+            "检验": ["阳性", "阴性", "1", "0", 2],
+            "布尔": [True, False, True, False, True],
+        }
+    )
+
+    normalized = normalize_feature_frame(data)["matrix"]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", FutureWarning)
+        expected = data.apply(normalize_binary_series).to_numpy()
+    assert normalized.dtype == np.uint8
+    assert normalized.tolist() == expected.tolist()
+
+
+def test_normalize_feature_frame_reports_first_invalid_column():
+    data = pd.DataFrame(
+        {
+            "正常": [1, 0, 1],
+            "负数": [1, -2, 0],
+            "异常": ["是", "偶尔", "否"],
+        }
+    )
+
+    with pytest.raises(ValueError, match=r"列 负数 包含负数取值: \[-2\]"):
+        normalize_feature_frame(data)
+    with pytest.raises(ValueError, match=r"列 异常 包含无法识别的取值: \['偶尔'\]"):
+        normalize_feature_frame(data[["正常", "异常"]])
+
+
+def test_normalize_feature_frame_collects_byproducts_in_one_pass():
+    data = pd.DataFrame(
+        {
+            "乏力": [1, None, 3, 0],
+            "咳嗽": ["是", None, None, "2"],
+        }
+    )
+
+    normalized = normalize_feature_frame(data)
+
+    assert normalized["matrix"].tolist() == [[1, 1], [0, 0], [1, 0], [0, 1]]
+    assert normalized["missing_fill_count"] == 3
+    assert normalized["positive_value_coercions"] == 2
+    assert normalized["global_frequency"]["乏力"] == pytest.approx(0.5)
+    assert list(normalized["columns"]) == ["乏力", "咳嗽"]
+
+
+def test_packed_distances_match_dense_ward_linkage():
+    matrix = random_binary_matrix(60, 70)
+    packed = pack_binary_matrix(matrix)
+
+    dense_linkage = linkage(matrix.astype(float), method="ward", metric="euclidean")
+
+    assert packed.dtype == np.uint64
+    assert packed.shape == (60, 2)
+    assert condensed_distances(packed, metric="hamming").max() <= 70
+    linkage_matrix, cache_status, _ = cached_linkage(packed, None)
+    assert cache_status == "disabled"
+    np.testing.assert_array_equal(linkage_matrix, dense_linkage)
+
+
+def test_memmapped_condensed_distances_match_pdist(tmp_path):
+    matrix = random_binary_matrix(40, 11, seed=6)
+    packed = pack_binary_matrix(matrix)
+
+    condensed = condensed_distances(packed, metric="euclidean", memmap_path=tmp_path / "distances.dat")
+
+    assert isinstance(condensed, np.memmap)
+    np.testing.assert_allclose(condensed, pdist(matrix, metric="euclidean"))
+    rows = np.array([0, 7, 39])
+    np.testing.assert_allclose(
+        condensed_distance_rows(condensed, 40, rows),
+        squareform(pdist(matrix, metric="euclidean"))[rows],
+    )
+
+
+@pytest.mark.parametrize(
+    ("metric", "scipy_metric", "scale"),
+    [("euclidean", "euclidean", 1), ("hamming", "hamming", 13), ("jaccard", "jaccard", 1), ("dice", "dice", 1)],
+)
+def test_binary_metrics_match_scipy_and_drive_silhouette(metric, scipy_metric, scale):
+    matrix = random_binary_matrix(120, 13, seed=10)
+    matrix[0] = 1
+    expected = pdist(matrix.astype(bool), scipy_metric) * scale
+
+    condensed = condensed_distances(pack_binary_matrix(matrix), metric=metric)
+    linkage_matrix = linkage(condensed, method="average")
+    metrics = evaluate_candidate_ks({"matrix": matrix}, linkage_matrix, [3, 4], metric=metric)
+
+    np.testing.assert_allclose(condensed, expected, atol=1e-12)
+    for row in metrics.itertuples():
+        labels = fcluster(linkage_matrix, row.k, criterion="maxclust")
+        reference = silhouette_score(squareform(expected), labels, metric="precomputed")
+        assert row.silhouette_score == pytest.approx(reference)
+
+
+@pytest.mark.parametrize("method", ["average", "complete", "single", "ward"])
+def test_weighted_linkage_matches_scipy_with_unit_weights(method):
+    points = np.random.default_rng(11).random((40, 4))
+    distances = pdist(points)
+
+    weighted = weighted_linkage(distances, np.ones(40), method)
+
+    np.testing.assert_allclose(weighted, linkage(points, method=method))
+    if method != "single":
+        ties = pdist(random_binary_matrix(60, 8, seed=3).astype(float))
+        np.testing.assert_array_equal(weighted_linkage(ties, np.ones(60), method), linkage(ties, method=method))
+
+
+def test_packed_scores_match_sklearn_metrics():
+    matrix = random_binary_matrix(80, 20, seed=1)
+    packed = pack_binary_matrix(matrix)
+    labels = fcluster(linkage(matrix, method="ward"), t=5, criterion="maxclust")
+
+    scores, errors = silhouette_scores(packed, labels[None, :])
+    assert scores[0] == pytest.approx(silhouette_score(matrix, labels))
+    assert errors[0] == 0
+    assert binary_calinski_harabasz_score(matrix, labels) == pytest.approx(
+        calinski_harabasz_score(matrix, labels)
+    )
+
+
+@pytest.mark.parametrize("method", ["ward", "average", "single"])
+def test_cut_linkage_labels_matches_fcluster_for_every_k(method):
+    matrix = random_binary_matrix(70, 4, seed=4)
+    linkage_matrix = linkage(matrix, method=method)
+    ks = [1, 2, 3, 5, 8, 13, 21, 40, 69, 70]
+
+    labels = cut_linkage_labels(linkage_matrix, ks)
+
+    assert labels.dtype == np.int32
+    assert labels.shape == (len(ks), 70)
+    for row, k in zip(labels, ks):
+        np.testing.assert_array_equal(row, fcluster(linkage_matrix, t=k, criterion="maxclust"))
+
+
+def test_nested_calinski_harabasz_scores_match_full_recomputation():
+    matrix = random_binary_matrix(120, 9, seed=5)
+    linkage_matrix = linkage(matrix, method="ward")
+    ks = list(range(2, 60))
+
+    scores = nested_calinski_harabasz_scores(matrix, linkage_matrix, ks)
+
+    for k, score in zip(ks, scores):
+        labels = fcluster(linkage_matrix, t=k, criterion="maxclust")
+        assert score == pytest.approx(calinski_harabasz_score(matrix, labels), rel=1e-9)
+
+
+def test_evaluate_candidate_ks_reuses_distances_for_every_k():
+    matrix = random_binary_matrix(90, 15, seed=2)
+    linkage_matrix = linkage(matrix, method="ward")
+
+    metrics = evaluate_candidate_ks({"matrix": matrix}, linkage_matrix, range(2, 6))
+
+    assert list(metrics.columns) == [
+        "k",
+        "silhouette_score",
+        "silhouette_sampling_error",
+        "calinski_harabasz_score",
+    ]
+    for row in metrics.itertuples():
+        labels = fcluster(linkage_matrix, t=row.k, criterion="maxclust")
+        assert row.silhouette_score == pytest.approx(silhouette_score(matrix, labels))
+        assert row.silhouette_sampling_error == 0.0
+
+
+def test_evaluate_candidate_ks_sampled_silhouette_reports_error():
+    matrix = random_binary_matrix(400, 12, seed=3)
+    linkage_matrix = linkage(matrix, method="ward")
+
+    exact = evaluate_candidate_ks({"matrix": matrix}, linkage_matrix, [3, 4])
+    sampled = evaluate_candidate_ks(
+        {"matrix": matrix},
+        linkage_matrix,
+        [3, 4],
+        silhouette_sample=150,
+    )
+    repeated = evaluate_candidate_ks(
+        {"matrix": matrix},
+        linkage_matrix,
+        [3, 4],
+        silhouette_sample=150,
+    )
+
+    pd.testing.assert_frame_equal(sampled, repeated)
+    assert (sampled["silhouette_sampling_error"] > 0).all()
+    deviation = (sampled["silhouette_score"] - exact["silhouette_score"]).abs()
+    assert (deviation <= 4 * sampled["silhouette_sampling_error"]).all()
+
+
+@pytest.mark.parametrize("silhouette_sample", [None, 150])
+def test_evaluate_candidate_ks_parallel_matches_serial(tmp_path, silhouette_sample):
+    matrix = random_binary_matrix(400, 12, seed=4)
+    packed = pack_binary_matrix(matrix)
+    linkage_matrix = linkage(matrix, method="ward")
+    condensed = condensed_distances(packed, metric="euclidean", memmap_path=tmp_path / "distances.dat")
+
+    serial = evaluate_candidate_ks(
+        {"matrix": matrix},
+        linkage_matrix,
+        [3, 4, 5],
+        silhouette_sample=silhouette_sample,
+    )
+    parallel = evaluate_candidate_ks(
+        {"matrix": matrix},
+        linkage_matrix,
+        [3, 4, 5],
+        silhouette_sample=silhouette_sample,
+        jobs=2,
+    )
+    out_of_core = evaluate_candidate_ks(
+        {"matrix": matrix},
+        linkage_matrix,
+        [3, 4, 5],
+        silhouette_sample=silhouette_sample,
+        condensed=condensed,
+        jobs=2,
+    )
+
+    assert parallel["k"].tolist() == [3, 4, 5]
+    pd.testing.assert_frame_equal(serial, parallel)
+    pd.testing.assert_frame_equal(serial, out_of_core, check_exact=False, rtol=1e-12)
+
+
+def test_adjusted_rand_index_and_condensed_subset_match_reference():
+    rng = np.random.default_rng(5)
+    for _ in range(20):
+        left = rng.integers(0, rng.integers(1, 6), size=60)
+        right = rng.integers(0, rng.integers(1, 6), size=60)
+        assert adjusted_rand_index(left, right) == pytest.approx(adjusted_rand_score(left, right))
+
+    condensed = pdist(random_binary_matrix(80, 10, seed=5))
+    rows = bootstrap_sample_rows(80, seed=1, resample=0)
+    expected = squareform(squareform(condensed)[np.ix_(rows, rows)], checks=False)
+    np.testing.assert_array_equal(condensed_subset(condensed, 80, rows), expected)
+
+
+def test_bootstrap_stability_is_deterministic_and_stops_early():
+    matrix = random_binary_matrix(150, 12, seed=6)
+    condensed = pdist(matrix)
+    valid_ks, label_matrix = candidate_cluster_labels(linkage(condensed, method="ward"), [3, 4])
+
+    serial = bootstrap_stability(condensed, valid_ks, label_matrix, resamples=60, tolerance=1.0)
+    parallel = bootstrap_stability(
+        condensed,
+        valid_ks,
+        label_matrix,
+        resamples=60,
+        tolerance=1.0,
+        jobs=2,
+    )
+    exhaustive = bootstrap_stability(condensed, valid_ks, label_matrix, resamples=30, tolerance=0.0)
+
+    pd.testing.assert_frame_equal(serial, parallel)
+    assert serial["resamples"].max() == 20
+    assert exhaustive["resamples"].max() == 30
+    assert serial["metric"].tolist() == ["adjusted_rand_index"] * 2 + ["jaccard"] * 7
+    assert serial["cluster"].isna().tolist() == [True, True] + [False] * 7
+    assert serial["mean"].between(-1, 1).all()
+    assert (serial["ci_lower"] <= serial["ci_upper"]).all()
+
+
 def test_select_best_k_prefers_higher_silhouette_then_ch_index():
     metrics = pd.DataFrame(
         [
@@ -141,6 +471,70 @@ def test_run_analysis_and_write_outputs_end_to_end(tmp_path):
     assert output_paths["dendrogram"].exists()
 
 
+def test_write_analysis_outputs_supports_svg_truncation_and_skipping(tmp_path):
+    input_path = tmp_path / "cohort.xlsx"
+    make_cohort_frame(30, seed=7).to_excel(input_path, index=False)
+    result = run_analysis(input_path, output_dir=tmp_path, candidate_ks=range(2, 4))
+
+    vector = write_analysis_outputs(result, dendrogram_mode="lastp", dendrogram_format="svg")
+    skipped = write_analysis_outputs(result, dendrogram_mode="none")
+
+    assert vector["dendrogram"].suffix == ".svg"
+    assert vector["dendrogram"].read_text(encoding="utf-8").lstrip().startswith("<?xml")
+    assert skipped["dendrogram"] is None
+    assert skipped["excel"].exists()
+    assert resolve_dendrogram_mode("auto", 1000) == "full"
+    assert resolve_dendrogram_mode("auto", 1001) == "lastp"
+    with pytest.raises(ValueError, match="树状图"):
+        write_analysis_outputs(result, dendrogram_mode="radial")
+
+
+def test_write_excel_workbook_streams_missing_and_mixed_values(tmp_path):
+    frame = pd.DataFrame(
+        {
+            "metric": ["sample_count", "out_of_core", "peak_rss_mb"],
+            "value": [12, True, None],
+            "cluster": pd.array([1, None, 3], dtype="Int64"),
+            "score": [0.5, np.nan, 1.25],
+        }
+    )
+
+    excel_path = write_excel_workbook(tmp_path / "streamed.xlsx", {"summary": frame, "empty": frame.iloc[:0]})
+
+    restored = pd.read_excel(excel_path, sheet_name=None)
+    assert list(restored) == ["summary", "empty"]
+    assert restored["summary"]["value"].tolist()[:2] == [12, True]
+    assert restored["summary"]["cluster"].isna().tolist() == [False, True, False]
+    assert restored["summary"]["score"].isna().tolist() == [False, True, False]
+    assert list(restored["empty"].columns) == list(frame.columns)
+
+
+def test_write_analysis_outputs_moves_large_tables_to_csv(tmp_path):
+    input_path = tmp_path / "cohort.xlsx"
+    make_cohort_frame(30, seed=8).to_excel(input_path, index=False)
+    result = run_analysis(input_path, output_dir=tmp_path, candidate_ks=range(2, 4))
+
+    output_paths = write_analysis_outputs(result, dendrogram_mode="none", table_format="csv")
+
+    sheets = pd.ExcelFile(output_paths["excel"]).sheet_names
+    patient_clusters = pd.read_csv(output_paths["tables"]["patient_clusters"], encoding="utf-8-sig")
+    assert sheets == ["summary", "k_metrics", "feature_filter", "cluster_sizes"]
+    assert set(output_paths["tables"]) == {"patient_clusters", "cluster_profiles"}
+    pd.testing.assert_frame_equal(patient_clusters, result["patient_clusters"], check_dtype=False)
+
+
+def test_write_analysis_outputs_writes_parquet_tables(tmp_path):
+    pytest.importorskip("pyarrow")
+    input_path = tmp_path / "cohort.xlsx"
+    make_cohort_frame(30, seed=8).to_excel(input_path, index=False)
+    result = run_analysis(input_path, output_dir=tmp_path, candidate_ks=range(2, 4))
+
+    output_paths = write_analysis_outputs(result, dendrogram_mode="none", table_format="parquet")
+
+    profiles = pd.read_parquet(output_paths["tables"]["cluster_profiles"])
+    pd.testing.assert_frame_equal(profiles, result["cluster_profiles"].reset_index(drop=True))
+
+
 def test_run_analysis_drops_summary_rows_and_coerces_positive_values(tmp_path):
     df = pd.DataFrame(
         {
@@ -166,3 +560,646 @@ def test_run_analysis_drops_summary_rows_and_coerces_positive_values(tmp_path):
 
     assert sample_count == 8
     assert positive_coercions == 1
+
+
+def test_run_analysis_reuses_cached_linkage(tmp_path):
+    input_path = tmp_path / "cohort.xlsx"
+    make_cohort_frame(30).to_excel(input_path, index=False)
+
+    first = run_analysis(input_path, output_dir=tmp_path / "outputs", candidate_ks=range(2, 5))
+    second = run_analysis(input_path, output_dir=tmp_path / "outputs", candidate_ks=range(3, 6))
+    uncached = run_analysis(
+        input_path,
+        output_dir=tmp_path / "outputs",
+        candidate_ks=range(2, 5),
+        use_linkage_cache=False,
+    )
+
+    assert summary_value(first, "linkage_cache") == "miss"
+    assert summary_value(second, "linkage_cache") == "hit"
+    assert summary_value(uncached, "linkage_cache") == "disabled"
+    np.testing.assert_array_equal(first["linkage_matrix"], second["linkage_matrix"])
+    assert len(list((tmp_path / "outputs" / "linkage_cache").glob("*.npy"))) == 1
+
+
+def test_store_cached_linkage_evicts_least_recently_used(tmp_path):
+    linkage_matrix = np.zeros((50, 4))
+    entry_bytes = None
+    for position, key in enumerate(["old", "middle", "new"]):
+        path = store_cached_linkage(tmp_path, key, linkage_matrix)
+        entry_bytes = path.stat().st_size
+        os.utime(path, (position, position))
+
+    store_cached_linkage(tmp_path, "newest", linkage_matrix, max_bytes=entry_bytes * 2)
+
+    assert sorted(path.stem for path in tmp_path.glob("*.npy")) == ["new", "newest"]
+
+
+def test_run_analysis_out_of_core_matches_in_memory(tmp_path):
+    input_path = tmp_path / "cohort.xlsx"
+    make_cohort_frame(40, seed=1).to_excel(input_path, index=False)
+
+    in_memory = run_analysis(
+        input_path,
+        output_dir=tmp_path / "memory",
+        candidate_ks=range(2, 6),
+        use_linkage_cache=False,
+        collapse_duplicates=False,
+    )
+    out_of_core = run_analysis(
+        input_path,
+        output_dir=tmp_path / "disk",
+        candidate_ks=range(2, 6),
+        use_linkage_cache=False,
+        out_of_core=True,
+        scratch_dir=tmp_path / "scratch",
+    )
+
+    pd.testing.assert_frame_equal(in_memory["k_metrics"], out_of_core["k_metrics"])
+    assert summary_value(out_of_core, "out_of_core") is True
+    assert summary_value(out_of_core, "peak_rss_mb") > 0
+    assert list((tmp_path / "scratch").iterdir()) == []
+
+
+def test_run_analysis_writes_stability_sheet_after_cache_hit(tmp_path):
+    input_path = tmp_path / "cohort.xlsx"
+    make_cohort_frame(40, seed=3).to_excel(input_path, index=False)
+
+    run_analysis(input_path, output_dir=tmp_path, candidate_ks=range(2, 5))
+    result = run_analysis(
+        input_path,
+        output_dir=tmp_path,
+        candidate_ks=range(2, 5),
+        stability_resamples=25,
+    )
+    output_paths = write_analysis_outputs(result)
+
+    stability = pd.read_excel(output_paths["excel"], sheet_name="stability")
+    assert summary_value(result, "linkage_cache") == "hit"
+    assert summary_value(result, "stability_resamples") == result["stability"]["resamples"].max()
+    assert stability["k"].unique().tolist() == result["k_metrics"]["k"].tolist()
+    assert len(stability) == len(result["stability"])
+
+
+def test_weighted_ward_linkage_matches_ward_on_expanded_points():
+    rng = np.random.default_rng(7)
+    points = rng.random((30, 5))
+    weights = rng.integers(1, 5, size=30)
+    expanded = linkage(np.repeat(points, weights, axis=0), method="ward")
+    leaves = np.repeat(np.arange(30), weights)
+
+    weighted = weighted_ward_linkage(points, weights)
+
+    np.testing.assert_allclose(weighted_ward_linkage(points, np.ones(30)), linkage(points, method="ward"))
+    np.testing.assert_allclose(weighted[:, 2], expanded[-29:, 2])
+    for k in (2, 4, 7):
+        labels = cut_linkage_labels(weighted, [k])[0][leaves]
+        assert adjusted_rand_score(labels, cut_linkage_labels(expanded, [k])[0]) == 1.0
+
+
+def test_evaluate_candidate_ks_on_collapsed_rows_matches_expanded_patients():
+    matrix = random_binary_matrix(300, 6, seed=9)
+    collapsed = collapse_duplicate_rows(matrix)
+    linkage_matrix = weighted_ward_linkage(collapsed["matrix"], collapsed["weights"])
+    valid_ks, vector_labels = candidate_cluster_labels(linkage_matrix, [3, 5], sample_count=300)
+
+    metrics = evaluate_candidate_ks(
+        {"matrix": collapsed["matrix"]},
+        linkage_matrix,
+        valid_ks,
+        candidate_labels=(valid_ks, vector_labels),
+        weights=collapsed["weights"],
+    )
+
+    assert len(collapsed["weights"]) < 300
+    np.testing.assert_array_equal(collapsed["matrix"][collapsed["assignments"]], matrix)
+    for row, labels in zip(metrics.itertuples(), vector_labels[:, collapsed["assignments"]]):
+        assert row.silhouette_score == pytest.approx(silhouette_score(matrix, labels))
+        assert row.calinski_harabasz_score == pytest.approx(calinski_harabasz_score(matrix, labels))
+
+
+def test_compress_patients_deduplicates_before_kmeans():
+    matrix = np.repeat(random_binary_matrix(50, 8, seed=8), 4, axis=0)
+
+    deduplicated = compress_patients(matrix, max_micro_clusters=200)
+    compressed = compress_patients(matrix, max_micro_clusters=10)
+
+    assert deduplicated["weights"].sum() == len(matrix)
+    np.testing.assert_array_equal(deduplicated["centroids"][deduplicated["assignments"]], matrix)
+    assert len(compressed["weights"]) <= 10
+    assert compressed["weights"].sum() == len(matrix)
+    assert compressed["assignments"].max() == len(compressed["weights"]) - 1
+
+
+def test_run_analysis_approximate_engine_keeps_output_shapes(tmp_path):
+    input_path = tmp_path / "cohort.xlsx"
+    make_cohort_frame(60, seed=4).to_excel(input_path, index=False)
+
+    exact = run_analysis(input_path, output_dir=tmp_path, candidate_ks=range(2, 6))
+    deduplicated = run_analysis(
+        input_path,
+        output_dir=tmp_path,
+        candidate_ks=range(2, 6),
+        engine="approximate",
+    )
+    compressed = run_analysis(
+        input_path,
+        output_dir=tmp_path,
+        candidate_ks=range(2, 6),
+        engine="approximate",
+        micro_clusters=12,
+    )
+    output_paths = write_analysis_outputs(compressed)
+
+    distinct_vectors = len(np.unique(exact["features"].to_numpy(), axis=0))
+    assert deduplicated["k_metrics"]["k"].tolist() == exact["k_metrics"]["k"].tolist()
+    assert summary_value(deduplicated, "leaf_count") == distinct_vectors < 60
+    assert summary_value(compressed, "leaf_count") <= 12
+    assert summary_value(compressed, "engine") == "approximate"
+    assert list(compressed["patient_clusters"].columns) == list(exact["patient_clusters"].columns)
+    assert list(compressed["cluster_profiles"].columns) == list(exact["cluster_profiles"].columns)
+    assert len(compressed["patient_clusters"]) == 60
+    assert output_paths["dendrogram"].exists()
+    with pytest.raises(ValueError, match="近似聚类引擎"):
+        run_analysis(input_path, output_dir=tmp_path, engine="approximate", out_of_core=True)
+
+
+def test_run_analysis_approximate_engine_scores_patients_when_rows_are_distinct(tmp_path):
+    input_path = tmp_path / "cohort.csv"
+    features = random_binary_matrix(40, 20, seed=21)
+    frame = pd.DataFrame(features, columns=[f"症状{i}" for i in range(20)])
+    frame.insert(0, "姓名", [f"患者{i}" for i in range(40)])
+    frame.to_csv(input_path, index=False)
+
+    result = run_analysis(
+        input_path,
+        output_dir=tmp_path,
+        candidate_ks=range(2, 6),
+        min_frequency=0,
+        engine="approximate",
+    )
+
+    assignments = compress_patients(features)["assignments"]
+    valid_ks, leaf_labels = candidate_cluster_labels(result["linkage_matrix"], range(2, 6), sample_count=40)
+    expected = [calinski_harabasz_score(features, labels[assignments]) for labels in leaf_labels]
+    assert len(np.unique(features, axis=0)) == summary_value(result, "leaf_count") == 40
+    assert result["k_metrics"]["k"].tolist() == valid_ks
+    np.testing.assert_allclose(result["k_metrics"]["calinski_harabasz_score"], expected)
+
+
+def test_run_analysis_collapses_duplicate_patients(tmp_path):
+    input_path = tmp_path / "cohort.csv"
+    vectors = random_binary_matrix(24, 30, seed=0)
+    rows = np.random.default_rng(0).permutation(np.repeat(np.arange(24), np.arange(1, 25)))
+    frame = pd.DataFrame(vectors[rows], columns=[f"症状{i}" for i in range(30)])
+    frame.insert(0, "姓名", [f"患者{i}" for i in range(len(rows))])
+    frame.to_csv(input_path, index=False)
+    options = {"output_dir": tmp_path, "candidate_ks": range(2, 8), "min_frequency": 0}
+
+    collapsed = run_analysis(input_path, **options)
+    per_patient = run_analysis(input_path, collapse_duplicates=False, **options)
+    output_paths = write_analysis_outputs(collapsed)
+
+    assert np.diff(np.sort(collapsed["linkage_matrix"][:, 2])).min() > 1e-6
+    assert summary_value(collapsed, "collapse_duplicates") is True
+    assert summary_value(per_patient, "collapse_duplicates") is False
+    assert summary_value(collapsed, "leaf_count") == 24
+    assert len(collapsed["patient_clusters"]) == 300
+    pd.testing.assert_frame_equal(collapsed["k_metrics"], per_patient["k_metrics"], rtol=1e-9)
+    assert int(collapsed["best_k"]["k"]) == int(per_patient["best_k"]["k"])
+    pairs = collapsed["patient_clusters"][["cluster"]].assign(expected=per_patient["patient_clusters"]["cluster"])
+    assert pairs.drop_duplicates().shape[0] == pairs["cluster"].nunique() == pairs["expected"].nunique()
+    assert sum("等" in label for label in collapsed["dendrogram_labels"]) == 23
+    assert output_paths["dendrogram"].exists()
+
+
+def test_run_analysis_keeps_per_patient_linkage_when_few_rows_repeat(tmp_path):
+    input_path = tmp_path / "cohort.xlsx"
+    frame = make_cohort_frame(40, seed=12)
+    features = random_binary_matrix(40, 20, seed=12)
+    features[1] = features[0]
+    frame = pd.concat(
+        [frame[["姓名", "年龄"]], pd.DataFrame(features, columns=[f"症状{i}" for i in range(20)])],
+        axis=1,
+    )
+    frame.to_excel(input_path, index=False)
+
+    result = run_analysis(input_path, output_dir=tmp_path, candidate_ks=range(2, 5), min_frequency=0)
+
+    assert len(np.unique(features, axis=0)) == 39
+    assert collapse_if_worthwhile(features) is None
+    assert collapse_if_worthwhile(np.repeat(features[2:12], 4, axis=0))["weights"].tolist() == [4] * 10
+    assert summary_value(result, "collapse_duplicates") is False
+    assert summary_value(result, "leaf_count") == 40
+    assert result["dendrogram_labels"] is None
+
+
+def test_run_analysis_uses_requested_metric_and_method(tmp_path):
+    input_path = tmp_path / "cohort.xlsx"
+    make_cohort_frame(40, seed=6).to_excel(input_path, index=False)
+
+    collapsed = run_analysis(
+        input_path,
+        output_dir=tmp_path,
+        candidate_ks=range(2, 5),
+        metric="jaccard",
+        method="average",
+    )
+    per_patient = run_analysis(
+        input_path,
+        output_dir=tmp_path,
+        candidate_ks=range(2, 5),
+        metric="jaccard",
+        method="average",
+        collapse_duplicates=False,
+    )
+
+    assert summary_value(collapsed, "distance_metric") == "jaccard"
+    assert summary_value(collapsed, "linkage_method") == "average"
+    assert collapsed["k_metrics"]["k"].tolist() == per_patient["k_metrics"]["k"].tolist()
+    with pytest.raises(ValueError, match="ward"):
+        run_analysis(input_path, output_dir=tmp_path, metric="dice", method="ward")
+
+
+def test_run_analysis_records_stage_profiles_in_summary_and_json(tmp_path):
+    input_path = tmp_path / "cohort.csv"
+    make_cohort_frame(30, seed=8).to_csv(input_path, index=False)
+    profile_path = tmp_path / "profile.json"
+    stats_path = tmp_path / "run.pstats"
+
+    result = run_analysis(input_path, output_dir=tmp_path, candidate_ks=range(2, 4))
+    main(
+        [
+            "--input",
+            str(input_path),
+            "--output-dir",
+            str(tmp_path / "cli"),
+            "--k-range",
+            "2-3",
+            "--dendrogram",
+            "none",
+            "--profile-json",
+            str(profile_path),
+            "--cprofile",
+            str(stats_path),
+        ]
+    )
+
+    stages = [profile["stage"] for profile in result["stage_profiles"]]
+    assert stages == [
+        "read_excel",
+        "normalize",
+        "filter",
+        "prepare_feature_matrix",
+        "linkage",
+        "evaluate_candidate_ks",
+        "build_cluster_profiles",
+    ]
+    assert result["stage_profiles"][0]["wall_seconds"] > 0
+    assert result["stage_profiles"][1]["wall_seconds"] > 0
+    assert summary_value(result, "stage_linkage_wall_seconds") >= 0
+    assert summary_value(result, "stage_read_excel_cpu_seconds") >= 0
+    profiles = json.loads(profile_path.read_text(encoding="utf-8"))["stages"]
+    assert [profile["stage"] for profile in profiles] == [*stages, "write_analysis_outputs"]
+    (excel_path,) = (tmp_path / "cli").glob("*/cluster_summary.xlsx")
+    summary_sheet = pd.read_excel(excel_path, sheet_name="summary")
+    export_seconds = summary_sheet.set_index("metric").loc["stage_write_analysis_outputs_wall_seconds", "value"]
+    assert 0 <= float(export_seconds) <= profiles[-1]["wall_seconds"]
+    assert pstats.Stats(str(stats_path)).total_calls > 0
+
+
+def test_run_batch_isolates_failures_and_writes_index(tmp_path):
+    input_dir = tmp_path / "cohorts"
+    input_dir.mkdir()
+    make_cohort_frame(24, seed=1).to_csv(input_dir / "hospital_a.csv", index=False)
+    make_cohort_frame(30, seed=2).to_excel(input_dir / "hospital_b.xlsx", index=False)
+    pd.DataFrame({"姓名": ["甲", "乙"], "畏冷": ["发热", 1]}).to_csv(input_dir / "broken.csv", index=False)
+    (input_dir / "notes.txt").write_text("ignored", encoding="utf-8")
+
+    inputs = resolve_batch_inputs(str(input_dir))
+    batch = run_batch(
+        inputs,
+        output_dir=tmp_path / "outputs",
+        workers=2,
+        analysis_options={"candidate_ks": range(2, 4)},
+        output_options={"dendrogram_mode": "none"},
+    )
+
+    assert [path.name for path in inputs] == ["broken.csv", "hospital_a.csv", "hospital_b.xlsx"]
+    assert resolve_batch_inputs(str(input_dir / "hospital_*.csv")) == [input_dir / "hospital_a.csv"]
+    assert resolve_batch_inputs(str(input_dir / "hospital_a.csv")) is None
+    index = batch["index"].set_index("input_file")
+    assert index["status"].tolist() == ["failed", "ok", "ok"]
+    assert "ValueError" in index.loc[str(input_dir / "broken.csv"), "error"]
+    assert index.loc[str(input_dir / "hospital_a.csv"), "sample_count"] == 24
+    assert index["optimal_k"].dropna().isin([2, 3]).all()
+    assert index["stage_linkage_wall_seconds"].dropna().ge(0).all()
+    written = pd.read_excel(batch["index_path"], sheet_name="batch_index")
+    assert written["status"].tolist() == ["failed", "ok", "ok"]
+    with pytest.raises(SystemExit):
+        main(["--input", str(input_dir), "--output-dir", str(tmp_path / "cli"), "--k-range", "2-3"])
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_run_batch_renders_dendrograms_with_shared_renderer(tmp_path, workers):
+    input_dir = tmp_path / "cohorts"
+    input_dir.mkdir()
+    for seed in range(3):
+        make_cohort_frame(20 + seed, seed=seed).to_csv(input_dir / f"hospital_{seed}.csv", index=False)
+
+    batch = run_batch(
+        resolve_batch_inputs(str(input_dir)),
+        output_dir=tmp_path / "outputs",
+        workers=workers,
+        analysis_options={"candidate_ks": range(2, 4)},
+        output_options={"dendrogram_mode": "full"},
+    )
+
+    assert batch["index"]["status"].tolist() == ["ok", "ok", "ok"]
+    rendered = sorted(
+        part for path in (tmp_path / "outputs").rglob("dendrogram.png") for part in path.parts if part.startswith("hospital_")
+    )
+    assert rendered == ["hospital_0", "hospital_1", "hospital_2"]
+
+
+def test_cli_help_does_not_import_heavy_dependencies():
+    completed = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys\n"
+            "from scripts.tcm_hierarchical_clustering import main\n"
+            "try:\n"
+            "    main(['--help'])\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "print(sorted({name.split('.')[0] for name in sys.modules}"
+            " & {'pandas', 'scipy', 'sklearn', 'matplotlib'}))\n",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).resolve().parents[1],
+    )
+
+    assert completed.stdout.strip().splitlines()[-1] == "[]"
+
+
+def test_augment_condensed_reuses_kept_rows_and_adds_new_rows():
+    packed = pack_binary_matrix(random_binary_matrix(30, 9, seed=4))
+    previous = condensed_distances(packed[:20], metric="jaccard")
+    kept_rows = np.array([0, 2, 3, 7, 11, 19])
+    ordered = np.concatenate([packed[kept_rows], packed[20:]])
+
+    augmented = augment_condensed(previous, 20, kept_rows, ordered, metric="jaccard")
+
+    np.testing.assert_array_equal(augmented, condensed_distances(ordered, metric="jaccard"))
+    shuffled = np.random.default_rng(4).permutation(len(ordered))
+    np.testing.assert_array_equal(
+        condensed_subset(augmented, len(ordered), shuffled),
+        condensed_distances(ordered[shuffled], metric="jaccard"),
+    )
+    current, matched, new_rows = match_fingerprints(
+        np.array([b"a", b"b", b"b", b"c"], dtype="S16"),
+        np.array([b"c", b"b", b"d", b"a", b"b", b"b"], dtype="S16"),
+    )
+    assert (current.tolist(), matched.tolist(), new_rows.tolist()) == ([3, 1, 4, 0], [0, 1, 2, 3], [2, 5])
+
+
+def test_run_analysis_incremental_update_matches_full_recompute(tmp_path):
+    input_path = tmp_path / "cohort.csv"
+    cohort = make_cohort_frame(40, seed=9)
+    cohort.to_csv(input_path, index=False)
+    first = run_analysis(input_path, output_dir=tmp_path, candidate_ks=range(2, 6), incremental=True)
+    unchanged = run_analysis(input_path, output_dir=tmp_path, candidate_ks=range(2, 6), incremental=True)
+
+    appended = make_cohort_frame(46, seed=19).iloc[40:].assign(姓名=[f"新患者{i}" for i in range(6)])
+    pd.concat([cohort, appended]).to_csv(input_path, index=False)
+    updated = run_analysis(input_path, output_dir=tmp_path, candidate_ks=range(2, 6), incremental=True)
+    full = run_analysis(
+        input_path,
+        output_dir=tmp_path,
+        candidate_ks=range(2, 6),
+        use_linkage_cache=False,
+        collapse_duplicates=False,
+    )
+
+    assert summary_value(first, "incremental_mode") == "full"
+    assert summary_value(unchanged, "incremental_mode") == "update"
+    assert summary_value(unchanged, "incremental_new_rows") == 0
+    assert summary_value(updated, "incremental_reused_rows") == 40
+    assert summary_value(updated, "incremental_new_rows") == 6
+    np.testing.assert_allclose(updated["linkage_matrix"], full["linkage_matrix"])
+    pd.testing.assert_frame_equal(updated["k_metrics"], full["k_metrics"])
+    pd.testing.assert_frame_equal(updated["patient_clusters"], full["patient_clusters"])
+
+
+@pytest.mark.parametrize("layout", ["prepend", "shuffle"])
+def test_run_analysis_incremental_update_matches_full_recompute_when_rows_move(tmp_path, layout):
+    input_path = tmp_path / "cohort.csv"
+    cohort = make_cohort_frame(60, seed=12)
+    cohort.to_csv(input_path, index=False)
+    run_analysis(input_path, output_dir=tmp_path, candidate_ks=range(2, 6), incremental=True)
+
+    added = make_cohort_frame(64, seed=22).iloc[60:].assign(姓名=[f"新患者{i}" for i in range(4)])
+    moved = pd.concat([added, cohort.iloc[3:]])
+    if layout == "shuffle":
+        moved = moved.sample(frac=1, random_state=5)
+    moved.to_csv(input_path, index=False)
+    updated = run_analysis(input_path, output_dir=tmp_path, candidate_ks=range(2, 6), incremental=True)
+    full = run_analysis(
+        input_path,
+        output_dir=tmp_path,
+        candidate_ks=range(2, 6),
+        use_linkage_cache=False,
+        collapse_duplicates=False,
+    )
+
+    assert summary_value(updated, "incremental_mode") == "update"
+    assert summary_value(updated, "incremental_reused_rows") == 57
+    np.testing.assert_array_equal(updated["linkage_matrix"], full["linkage_matrix"])
+    pd.testing.assert_frame_equal(updated["k_metrics"], full["k_metrics"])
+    pd.testing.assert_frame_equal(updated["patient_clusters"], full["patient_clusters"])
+    assert updated["dendrogram_labels"] is None
+
+
+def test_run_analysis_assign_only_places_new_patients_by_nearest_centroid(tmp_path):
+    input_path = tmp_path / "cohort.csv"
+    cohort = make_cohort_frame(40, seed=10)
+    cohort.to_csv(input_path, index=False)
+    baseline = run_analysis(input_path, output_dir=tmp_path, candidate_ks=range(2, 6), incremental=True)
+
+    appended = make_cohort_frame(45, seed=20).iloc[40:].assign(姓名=[f"新患者{i}" for i in range(5)])
+    pd.concat([appended, cohort]).to_csv(input_path, index=False)
+    assigned = run_analysis(input_path, output_dir=tmp_path, candidate_ks=range(2, 6), assign_only=True)
+
+    features = cohort.columns[2:]
+    old_labels = baseline["patient_clusters"]["cluster"].to_numpy()
+    centroid_ids, centroids = cluster_centroids(cohort[features].to_numpy(), old_labels)
+    expected_new = nearest_centroid_labels(appended[features].to_numpy(), centroid_ids, centroids)
+    clusters = assigned["patient_clusters"]["cluster"].to_numpy()
+    assert summary_value(assigned, "incremental_mode") == "assign_only"
+    assert summary_value(assigned, "incremental_new_rows") == 5
+    np.testing.assert_array_equal(clusters[5:], old_labels)
+    np.testing.assert_array_equal(clusters[:5], expected_new)
+    pd.testing.assert_frame_equal(assigned["k_metrics"], baseline["k_metrics"], check_dtype=False)
+    assert len(assigned["linkage_matrix"]) == len(baseline["linkage_matrix"])
+    assert assigned["dendrogram_labels"] == cohort["姓名"].tolist()
+
+    rare = cohort.assign(盗汗=0)
+    rare.to_csv(input_path, index=False)
+    rebuilt = run_analysis(
+        input_path,
+        output_dir=tmp_path,
+        candidate_ks=range(2, 6),
+        min_frequency=0.05,
+        assign_only=True,
+    )
+    assert summary_value(rebuilt, "incremental_mode") == "rebuild"
+    with pytest.raises(ValueError, match="增量"):
+        run_analysis(input_path, output_dir=tmp_path, incremental=True, engine="approximate")
+
+
+def test_min_frequency_sweep_matches_separate_runs_and_writes_comparison(tmp_path):
+    input_path = tmp_path / "cohort.csv"
+    cohort = make_cohort_frame(40, seed=11)
+    cohort["罕见症状"] = [1] * 3 + [0] * 37
+    cohort.to_csv(input_path, index=False)
+
+    sweep = run_min_frequency_sweep(
+        input_path,
+        [0.1, 0.02, 0.99],
+        output_dir=tmp_path / "sweep",
+        workers=2,
+        analysis_options={"candidate_ks": range(2, 5)},
+        output_options={"dendrogram_mode": "none"},
+    )
+    separate = {
+        threshold: run_analysis(input_path, output_dir=tmp_path, min_frequency=threshold, candidate_ks=range(2, 5))
+        for threshold in (0.02, 0.1)
+    }
+
+    comparison = sweep["comparison"].set_index("min_frequency")
+    assert comparison.index.tolist() == [0.02, 0.1, 0.99]
+    assert comparison["status"].tolist() == ["ok", "ok", "failed"]
+    assert "没有剩余证候列" in comparison.loc[0.99, "error"]
+    assert comparison.loc[0.02, "removed_features"] == ""
+    assert comparison.loc[0.1, "removed_features"] == "罕见症状"
+    for threshold, expected in separate.items():
+        assert comparison.loc[threshold, "optimal_k"] == int(expected["best_k"]["k"])
+        assert comparison.loc[threshold, "retained_feature_count"] == summary_value(
+            expected,
+            "retained_feature_count",
+        )
+        assert comparison.loc[threshold, "best_silhouette_score"] == pytest.approx(
+            float(expected["best_k"]["silhouette_score"])
+        )
+    assert np.isnan(comparison.loc[0.02, "ari_vs_previous"])
+    assert -1 <= comparison.loc[0.1, "ari_vs_previous"] <= 1
+    written = pd.read_excel(sweep["workbook_path"], sheet_name=None)
+    assert list(written) == ["comparison", "k_metrics"]
+    assert sorted(written["k_metrics"]["min_frequency"].unique()) == [0.02, 0.1]
+    assert parse_frequency_list("0.1, 0.05,0.1") == [0.05, 0.1]
+
+
+def test_min_frequency_sweep_records_failed_lowest_threshold_and_reuses_linkage_cache(tmp_path):
+    input_path = tmp_path / "cohort.csv"
+    make_cohort_frame(30, seed=13).to_csv(input_path, index=False)
+    options = {
+        "output_dir": tmp_path / "sweep",
+        "workers": 1,
+        "analysis_options": {"candidate_ks": range(2, 4)},
+        "output_options": {"dendrogram_mode": "none"},
+    }
+
+    failed = run_min_frequency_sweep(input_path, [0.995, 0.99], **options)
+    first = run_min_frequency_sweep(input_path, [0.1], **options)
+    second = run_min_frequency_sweep(input_path, [0.1], **options)
+
+    assert failed["comparison"]["status"].tolist() == ["failed", "failed"]
+    assert failed["comparison"]["error"].str.contains("没有剩余证候列").all()
+    cached = list((tmp_path / "sweep" / "linkage_cache").glob("*.npy"))
+    assert len(cached) == 1
+    first_dir = Path(first["comparison"]["output_dir"].iloc[0])
+    second_dir = Path(second["comparison"]["output_dir"].iloc[0])
+    first_summary = pd.read_excel(first_dir / "cluster_summary.xlsx", sheet_name="summary")
+    second_summary = pd.read_excel(second_dir / "cluster_summary.xlsx", sheet_name="summary")
+    assert first_summary.set_index("metric").loc["linkage_cache", "value"] == "miss"
+    assert second_summary.set_index("metric").loc["linkage_cache", "value"] == "hit"
+
+
+def test_load_prepared_cohort_streams_csv_and_excel_identically(tmp_path):
+    frame = make_cohort_frame(25, seed=2)
+    frame.loc[25] = [None, None, 1, 0, 0, 0, 0, 0]
+    csv_path = tmp_path / "cohort.csv"
+    excel_path = tmp_path / "cohort.xlsx"
+    frame.to_csv(csv_path, index=False)
+    with pd.ExcelWriter(excel_path) as writer:
+        pd.DataFrame({"说明": ["封面"]}).to_excel(writer, sheet_name="封面", index=False)
+        frame.to_excel(writer, sheet_name="数据", index=False)
+
+    from_csv = load_prepared_cohort(csv_path, chunk_rows=4)
+    from_excel = load_prepared_cohort(excel_path, sheet_name="数据", chunk_rows=7)
+
+    assert from_excel["sheet_name"] == "数据"
+    assert from_csv["raw_row_count"] == from_excel["raw_row_count"] == 26
+    assert from_csv["dropped_summary_row_count"] == 1
+    assert from_csv["normalized"]["matrix"].dtype == np.uint8
+    np.testing.assert_array_equal(from_csv["normalized"]["matrix"], from_excel["normalized"]["matrix"])
+    assert list(from_csv["identifiers"]["姓名"]) == list(from_excel["identifiers"]["姓名"])
+    assert list(from_csv["identifiers"].index) == list(range(25))
+
+
+def test_load_prepared_cohort_reads_parquet_with_projection(tmp_path):
+    pytest.importorskip("pyarrow")
+    parquet_path = tmp_path / "cohort.parquet"
+    frame = make_cohort_frame(15, seed=3)
+    frame.index = frame.index + 100
+    frame.to_parquet(parquet_path)
+
+    prepared = load_prepared_cohort(parquet_path, chunk_rows=4)
+
+    assert list(prepared["identifiers"].columns) == ["姓名", "年龄"]
+    assert prepared["raw_row_count"] == 15
+
+
+def test_load_prepared_cohort_rejects_unknown_suffix_and_sheet(tmp_path):
+    excel_path = tmp_path / "cohort.xlsx"
+    make_cohort_frame(5).to_excel(excel_path, index=False)
+
+    with pytest.raises(ValueError, match="不支持的输入文件类型"):
+        load_prepared_cohort(tmp_path / "cohort.json")
+    with pytest.raises(ValueError, match="不存在工作表"):
+        load_prepared_cohort(excel_path, sheet_name="缺失")
+
+
+def test_cached_prepared_cohort_reuses_parsed_matrix_until_input_changes(tmp_path):
+    input_path = tmp_path / "cohort.xlsx"
+    frame = make_cohort_frame(20, seed=4)
+    frame.loc[3, "姓名"] = None
+    frame.to_excel(input_path, index=False)
+    cache_dir = tmp_path / "cache"
+
+    first = cached_prepared_cohort(input_path, cache_dir, min_frequency=0.1)
+    second = cached_prepared_cohort(input_path, cache_dir, min_frequency=0.1)
+    os.utime(input_path, ns=(1, 1))
+    touched = cached_prepared_cohort(input_path, cache_dir, min_frequency=0.1)
+    (manifest_path,) = cache_dir.glob("*/manifest.json")
+    assert json.loads(manifest_path.read_text(encoding="utf-8"))["mtime_ns"] == 1
+    other_threshold = cached_prepared_cohort(input_path, cache_dir, min_frequency=0.2)
+    frame.loc[0, "畏冷"] = 1 - frame.loc[0, "畏冷"]
+    frame.to_excel(input_path, index=False)
+    changed = cached_prepared_cohort(input_path, cache_dir, min_frequency=0.1)
+
+    assert [first["cohort_cache"], second["cohort_cache"], touched["cohort_cache"]] == [
+        "miss",
+        "hit",
+        "hit",
+    ]
+    assert other_threshold["cohort_cache"] == "miss"
+    assert changed["cohort_cache"] == "miss"
+    np.testing.assert_array_equal(first["normalized"]["matrix"], second["normalized"]["matrix"])
+    pd.testing.assert_frame_equal(first["identifiers"], second["identifiers"], check_dtype=False)
+    pd.testing.assert_frame_equal(first["feature_filter"], second["feature_filter"])
+    for key in ("raw_row_count", "missing_fill_count", "positive_value_coercions", "sheet_name"):
+        assert first[key] == second[key]